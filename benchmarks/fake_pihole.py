@@ -0,0 +1,134 @@
+import json
+import random
+import secrets
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+KEYS = ('hosts', 'cnameRecords')
+
+
+class FakePiHole:
+    # In-process stand-in for the parts of the PiHole v6 API the sync uses
+    
+    def __init__(self, password='bench', latency=0.0, failure_rate=0.0, validity=1800, seed=0):
+        self.password = password
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.validity = validity
+        self.dns = {key: [] for key in KEYS}
+        self.sessions = set()
+        self.requests = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+    
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._server.server_address[1]}'
+    
+    def start(self):
+        handler = type('Handler', (_Handler,), {'pihole': self})
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+        return self
+    
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc):
+        self.stop()
+    
+    def reset(self, hosts=(), cnames=()):
+        with self._lock:
+            self.dns = {'hosts': list(hosts), 'cnameRecords': list(cnames)}
+            self.sessions.clear()
+            self.requests.clear()
+    
+    def handle(self, method, path, headers, body):
+        # Returns (status, payload); payload None means no body
+        with self._lock:
+            self.requests[method] += 1
+            fail = self._random.random() < self.failure_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            return 503, {'error': {'key': 'injected', 'message': 'Injected failure'}}
+        
+        if path == '/api/auth':
+            return self._auth(method, headers, body)
+        if headers.get('X-FTL-SID') not in self.sessions:
+            return 401, {'error': {'key': 'unauthorized', 'message': 'Unauthorized'}}
+        
+        parts = path.split('/')
+        if path == '/api/config/dns' and method == 'GET':
+            with self._lock:
+                return 200, {'config': {'dns': {key: list(values) for key, values in self.dns.items()}}}
+        if path == '/api/config/dns' and method == 'PATCH':
+            dns = json.loads(body).get('config', {}).get('dns', {})
+            with self._lock:
+                for key in KEYS:
+                    if key in dns:
+                        self.dns[key] = list(dns[key])
+            return 200, {'config': {'dns': dns}}
+        if len(parts) == 5 and parts[4] in KEYS and method == 'GET':
+            with self._lock:
+                return 200, {'config': {'dns': {parts[4]: list(self.dns[parts[4]])}}}
+        if len(parts) == 6 and parts[4] in KEYS:
+            return self._item(method, parts[4], unquote(parts[5]))
+        return 404, {'error': {'key': 'not_found', 'message': 'Not found'}}
+    
+    def _auth(self, method, headers, body):
+        if method == 'DELETE':
+            with self._lock:
+                self.sessions.discard(headers.get('X-FTL-SID'))
+            return 204, None
+        if json.loads(body).get('password') != self.password:
+            return 401, {'session': {'valid': False}}
+        sid = secrets.token_urlsafe(16)
+        with self._lock:
+            self.sessions.add(sid)
+        return 200, {'session': {'valid': True, 'sid': sid, 'csrf': secrets.token_urlsafe(16),
+                                 'validity': self.validity}}
+    
+    def _item(self, method, key, item):
+        with self._lock:
+            entries = self.dns[key]
+            if method == 'PUT':
+                if item in entries:
+                    return 400, {'error': {'key': 'bad_request', 'message': 'Item already present'}}
+                entries.append(item)
+                return 201, None
+            if method == 'DELETE':
+                if item not in entries:
+                    return 404, {'error': {'key': 'not_found', 'message': 'Item not found'}}
+                entries.remove(item)
+                return 204, None
+        return 405, None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    pihole = None
+    protocol_version = 'HTTP/1.1'
+    
+    def _dispatch(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        status, payload = self.pihole.handle(self.command, self.path.split('?')[0], self.headers, body)
+        data = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _dispatch
+    
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
@@ -0,0 +1,229 @@
+import argparse
+import gc
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import yaml
+
+from benchmarks.fake_pihole import FakePiHole
+from internal_dns_sync import main
+
+DEFAULT_SIZES = (100, 1000, 10000, 100000)
+CHANGED = 5
+
+
+def _host(i):
+    return f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}', f'host{i}.bench.lan'
+
+
+def generate(size):
+    # size records in total, one CNAME for every four hosts
+    cnames = size // 5
+    hosts = [_host(i) for i in range(size - cnames)]
+    return hosts, [(f'alias{i}.bench.lan', hosts[i][1]) for i in range(cnames)]
+
+
+def write_dns_config(path, hosts, cnames, fmt):
+    if fmt == 'yaml':
+        data = {
+            'hosts': [{'ip': ip, 'domain': domain} for ip, domain in hosts],
+            'cnames': [{'domain': domain, 'target': target} for domain, target in cnames],
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            yaml.safe_dump(data, f, sort_keys=False)
+    elif fmt == 'jsonl':
+        with open(path, 'w', encoding='utf-8') as f:
+            for ip, domain in hosts:
+                f.write(json.dumps({'ip': ip, 'domain': domain}) + '\n')
+            for domain, target in cnames:
+                f.write(json.dumps({'domain': domain, 'target': target}) + '\n')
+    else:
+        raise ValueError(f'unsupported format {fmt}')
+
+
+def _wire(hosts, cnames):
+    return [f'{ip} {domain}' for ip, domain in hosts], [f'{domain},{target}' for domain, target in cnames]
+
+
+# Each scenario returns what the PiHoles hold before the run, and whether a previous run is cached
+def _initial(hosts, cnames):
+    return ([], []), False
+
+
+def _unchanged(hosts, cnames):
+    return _wire(hosts, cnames), False
+
+
+def _delta(hosts, cnames):
+    current_hosts, current_cnames = _wire(hosts[CHANGED:], cnames)
+    return (current_hosts + [f'192.0.2.{i} stale{i}.bench.lan' for i in range(CHANGED)], current_cnames), False
+
+
+def _cached(hosts, cnames):
+    return _wire(hosts, cnames), True
+
+
+SCENARIOS = {'initial': _initial, 'unchanged': _unchanged, 'delta': _delta, 'cached': _cached}
+
+
+class Bench:
+    def __init__(self, workdir, piholes, fmt, latency, failure_rate):
+        self.workdir = workdir
+        self.fmt = fmt
+        self.servers = [FakePiHole(latency=latency, failure_rate=failure_rate, seed=i).start() for i in range(piholes)]
+        
+        # The sync is quietened, failed runs are flagged in the results instead. main() sets the root
+        # level from the config, so that is put back too.
+        self._logger = logging.getLogger('internal_dns_sync')
+        self._saved = (self._logger.level, logging.getLogger().level, os.environ.get('CONFIG'))
+        self._logger.setLevel(logging.CRITICAL)
+    
+    def close(self):
+        for server in self.servers:
+            server.stop()
+        level, root_level, config_file = self._saved
+        self._logger.setLevel(level)
+        logging.getLogger().setLevel(root_level)
+        if config_file is None:
+            os.environ.pop('CONFIG', None)
+        else:
+            os.environ['CONFIG'] = config_file
+    
+    def prepare(self, size):
+        self.hosts, self.cnames = generate(size)
+        self.dns_config = os.path.join(self.workdir, f'dns-config.{self.fmt}')
+        write_dns_config(self.dns_config, self.hosts, self.cnames, self.fmt)
+    
+    def _setup(self, scenario):
+        cache_dir = os.path.join(self.workdir, 'cache')
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        config_file = os.path.join(self.workdir, 'config.yml')
+        with open(config_file, 'w', encoding='utf-8') as f:
+            yaml.safe_dump({
+                'cache_dir': cache_dir,
+                'sources': [{'file': self.dns_config}],
+                'piholes': [{'url': server.url, 'password': server.password} for server in self.servers],
+            }, f)
+        os.environ['CONFIG'] = config_file
+        
+        (current_hosts, current_cnames), cached = SCENARIOS[scenario](self.hosts, self.cnames)
+        for server in self.servers:
+            server.reset(current_hosts, current_cnames)
+        if cached:
+            _run_main()
+            for server in self.servers:
+                server.requests.clear()
+    
+    def run(self, scenario, repeat, memory):
+        timings = []
+        for _ in range(repeat):
+            self._setup(scenario)
+            gc.collect()
+            start = time.perf_counter()
+            failed = _run_main()
+            timings.append(time.perf_counter() - start)
+        
+        result = {
+            'seconds': min(timings),
+            'requests': sum(sum(server.requests.values()) for server in self.servers),
+            'failed': failed,
+        }
+        
+        # Measured in a separate run, tracemalloc slows everything down considerably
+        if memory:
+            self._setup(scenario)
+            gc.collect()
+            tracemalloc.start()
+            try:
+                _run_main()
+                result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        return result
+
+
+def _run_main():
+    try:
+        main.main([])
+    except SystemExit as e:
+        return e.code != 0
+    return False
+
+
+def compare(results, baseline, tolerance):
+    # Only slowdowns, extra requests and extra memory count as regressions
+    regressions = []
+    for key, result in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        if result['requests'] > previous['requests']:
+            regressions.append(f'{key}: {result["requests"]} requests, was {previous["requests"]}')
+        for metric in ('seconds', 'peak_bytes'):
+            if metric in result and metric in previous and result[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f'{key}: {metric} {result[metric]:.4g}, was {previous[metric]:.4g}')
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark a full sync against in-process fake PiHoles')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='comma separated record counts (default: %(default)s)')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help='comma separated scenarios (default: %(default)s)')
+    parser.add_argument('--format', choices=('yaml', 'jsonl'), default='yaml', help='DNS config format')
+    parser.add_argument('--piholes', type=int, default=2, help='number of fake PiHoles (default: %(default)s)')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every fake PiHole response')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='fraction of fake PiHole requests answered with a 503')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement, the fastest counts')
+    parser.add_argument('--no-memory', action='store_true', help='skip the peak memory measurement')
+    parser.add_argument('--json', metavar='FILE', help='write the results as JSON to FILE')
+    parser.add_argument('--baseline', metavar='FILE', help='fail when results regressed against this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown and memory growth against the baseline (default: %(default)s)')
+    return parser.parse_args(argv)
+
+
+def main_bench(argv=None):
+    args = parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(',')]
+    scenarios = args.scenarios.split(',')
+    
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='internal-dns-sync-bench-') as workdir:
+        bench = Bench(workdir, args.piholes, args.format, args.latency, args.failure_rate)
+        try:
+            print(f'{"size":>8} {"scenario":<10} {"seconds":>9} {"requests":>9} {"peak MiB":>9}')
+            for size in sizes:
+                bench.prepare(size)
+                for scenario in scenarios:
+                    result = bench.run(scenario, args.repeat, not args.no_memory)
+                    results[f'{size}/{scenario}'] = result
+                    peak = f'{result["peak_bytes"] / 2 ** 20:9.1f}' if 'peak_bytes' in result else f'{"-":>9}'
+                    print(f'{size:>8} {scenario:<10} {result["seconds"]:9.3f} {result["requests"]:>9} {peak}'
+                          + (' (failed)' if result['failed'] else ''), flush=True)
+        finally:
+            bench.close()
+    
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main_bench()
@@ -0,0 +1,85 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Modules a one-shot run that finds nothing changed must never load
+HEAVY = ('requests', 'urllib3', 'charset_normalizer', 'http.server', 'internal_dns_sync.pihole',
+         'internal_dns_sync.webhook', 'internal_dns_sync.config_watch')
+
+# Runs main() against a local DNS config that was already synced, the most common run in production
+SHORT_CIRCUIT = '''
+import hashlib, json, os, sys, time
+cache_dir, dns_config = sys.argv[1], sys.argv[2]
+with open(dns_config, 'rb') as f:
+    content = f.read()
+revision = hashlib.sha1(b'blob %d\\0' % len(content) + content).hexdigest()
+with open(os.path.join(cache_dir, 'state.json'), 'w') as f:
+    # filters.fingerprint() of a target without rules, inlined so the package is not imported yet
+    no_filters = hashlib.sha1(repr(([], [])).encode('utf-8')).hexdigest()
+    json.dump({'piholes': {'http://pihole': {'revision': revision, 'synced_at': time.time(),
+                                             'filters': no_filters}}}, f)
+start = time.perf_counter()
+from internal_dns_sync import main
+main.main([])
+print(json.dumps({'seconds': time.perf_counter() - start, 'modules': sorted(sys.modules)}))
+'''
+
+
+def import_times(module='internal_dns_sync.main'):
+    # Cumulative microseconds per module from -X importtime, in a fresh interpreter
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def short_circuit_run():
+    with tempfile.TemporaryDirectory() as workdir:
+        dns_config = os.path.join(workdir, 'dns-config.yaml')
+        with open(dns_config, 'w', encoding='utf-8') as f:
+            f.write('hosts:\n  - ip: 10.0.0.1\n    domain: host.lan\n')
+        config_file = os.path.join(workdir, 'config.yml')
+        with open(config_file, 'w', encoding='utf-8') as f:
+            json.dump({'cache_dir': workdir, 'sources': [{'file': dns_config}],
+                       'piholes': [{'url': 'http://pihole', 'password': 'unused'}]}, f)
+        env = dict(os.environ, CONFIG=config_file)
+        result = subprocess.run([sys.executable, '-c', SHORT_CIRCUIT, workdir, dns_config],
+                                capture_output=True, text=True, check=True, env=env)
+        return json.loads(result.stdout.splitlines()[-1])
+
+
+def main_bench(argv=None):
+    parser = argparse.ArgumentParser(description='Measure the cold start of a one-shot run')
+    parser.add_argument('--runs', type=int, default=10, help='fresh interpreters per measurement')
+    parser.add_argument('--budget-ms', type=float, help='fail when importing the entry point takes longer')
+    args = parser.parse_args(argv)
+    
+    imports = [import_times()['internal_dns_sync.main'] / 1000 for _ in range(args.runs)]
+    runs = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        result = short_circuit_run()
+        runs.append((time.perf_counter() - start, result['seconds']))
+    loaded = [module for module in HEAVY if module in result['modules']]
+    
+    print(f'import internal_dns_sync.main: median {statistics.median(imports):.1f}ms, min {min(imports):.1f}ms')
+    print(f'unchanged one-shot run: median {statistics.median(r[1] for r in runs) * 1000:.1f}ms to import and run '
+          f'main(), {statistics.median(r[0] for r in runs) * 1000:.1f}ms including interpreter start')
+    print(f'heavy modules loaded: {", ".join(loaded) or "none"}')
+    
+    if loaded or (args.budget_ms and statistics.median(imports) > args.budget_ms):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main_bench()
@@ -0,0 +1,31 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, url, until):
+        self.url = url
+        self.until = until
+        super().__init__(f'circuit open after repeated failures, next attempt after '
+                         f'{time.strftime("%H:%M:%S", time.localtime(until))}')
+
+
+def is_open(entry, now):
+    # Once the cooldown has passed a single attempt is let through; it closes or reopens the circuit
+    return entry is not None and entry.get('open_until', 0) > now
+
+
+def record(entry, ok, now, threshold, cooldown):
+    # Returns the new breaker entry for a target, or None once it is healthy again
+    if ok:
+        if entry is not None and entry.get('failures', 0) >= threshold:
+            logger.info('Circuit closed again after a successful sync')
+        return None
+    
+    failures = (entry or {}).get('failures', 0) + 1
+    entry = {'failures': failures}
+    if failures >= threshold:
+        entry['open_until'] = now + cooldown
+    return entry
@@ -2,12 +2,18 @@ import os
 import yaml
 import logging
 
+from internal_dns_sync import filters
+
 logger = logging.getLogger(__name__)
 
 
+def config_path():
+    return os.getenv('CONFIG', '/config/config.yml')
+
+
 def get_config():
     # Try config file first (backward compatibility)
-    config_file = os.getenv('CONFIG', '/config/config.yml')
+    config_file = config_path()
     
     if os.path.exists(config_file):
         with open(config_file, 'r', encoding='utf-8') as f:
@@ -21,6 +27,46 @@ def get_config():
     cfg.setdefault('repo_url', os.getenv('REPO_URL', 'git@github.com:melvyndekort/homelab.git'))
     cfg.setdefault('ssh_key', os.getenv('SSH_KEY', '/ssh-key'))
     cfg.setdefault('dns_config_path', os.getenv('DNS_CONFIG_PATH', 'dns/dns-config.yaml'))
+    cfg.setdefault('cache_dir', os.getenv('CACHE_DIR', '/cache'))
+    cfg.setdefault('max_parallel', int(os.getenv('MAX_PARALLEL', '8')))
+    cfg.setdefault('full_sync_interval', int(os.getenv('FULL_SYNC_INTERVAL', '3600')))
+    cfg.setdefault('interval', int(os.getenv('INTERVAL', '300')))
+    cfg.setdefault('jitter', int(os.getenv('JITTER', '30')))
+    cfg.setdefault('config_poll_interval', float(os.getenv('CONFIG_POLL_INTERVAL', '5')))
+    cfg.setdefault('watch_interval', int(os.getenv('WATCH_INTERVAL', '0')))
+    cfg.setdefault('delta_threshold', int(os.getenv('DELTA_THRESHOLD', '10')))
+    cfg.setdefault('connect_timeout', float(os.getenv('CONNECT_TIMEOUT', '5')))
+    cfg.setdefault('read_timeout', float(os.getenv('READ_TIMEOUT', '30')))
+    cfg.setdefault('retries', int(os.getenv('RETRIES', '3')))
+    cfg.setdefault('backoff', float(os.getenv('BACKOFF', '1')))
+    cfg.setdefault('breaker_threshold', int(os.getenv('BREAKER_THRESHOLD', '3')))
+    cfg.setdefault('breaker_cooldown', int(os.getenv('BREAKER_COOLDOWN', '900')))
+    cfg.setdefault('metrics_port', int(os.getenv('METRICS_PORT', '0')))
+    cfg.setdefault('metrics_textfile', os.getenv('METRICS_TEXTFILE'))
+    cfg.setdefault('pushgateway_url', os.getenv('PUSHGATEWAY_URL'))
+    cfg.setdefault('webhook_port', int(os.getenv('WEBHOOK_PORT', '0')))
+    cfg.setdefault('webhook_secret', os.getenv('WEBHOOK_SECRET'))
+    cfg.setdefault('webhook_debounce', float(os.getenv('WEBHOOK_DEBOUNCE', '5')))
+    cfg.setdefault('verify', os.getenv('VERIFY', 'false').lower() in ('1', 'true', 'yes'))
+    cfg.setdefault('verify_sample', int(os.getenv('VERIFY_SAMPLE', '0')))
+    cfg.setdefault('verify_timeout', float(os.getenv('VERIFY_TIMEOUT', '2')))
+    cfg.setdefault('settle_delay', float(os.getenv('SETTLE_DELAY', '5')))
+    cfg.setdefault('health_name', os.getenv('HEALTH_NAME', 'pi.hole'))
+    cfg.setdefault('lock_mode', os.getenv('LOCK_MODE', 'exit'))
+    cfg.setdefault('lock_timeout', int(os.getenv('LOCK_TIMEOUT', '600')))
+    cfg.setdefault('lock_ttl', int(os.getenv('LOCK_TTL', '120')))
+    cfg.setdefault('log_format', os.getenv('LOG_FORMAT', 'text'))
+    cfg.setdefault('log_level', os.getenv('LOG_LEVEL', 'INFO').upper())
+    cfg.setdefault('trace_file', os.getenv('TRACE_FILE'))
+    
+    if cfg['lock_mode'] not in ('exit', 'wait'):
+        raise ValueError(f"lock_mode must be 'exit' or 'wait', not {cfg['lock_mode']!r}")
+    if cfg['log_format'] not in ('text', 'json'):
+        raise ValueError(f"log_format must be 'text' or 'json', not {cfg['log_format']!r}")
+    
+    # An unauthenticated listener would let anyone make us hammer the PiHoles
+    if cfg['webhook_port'] and not cfg['webhook_secret']:
+        raise ValueError('webhook_port requires webhook_secret')
     
     # Parse PiHole configs from env vars if not in file
     if 'piholes' not in cfg:
@@ -35,4 +81,24 @@ def get_config():
         else:
             cfg['piholes'] = []
     
+    # Without explicit sources the single repository file is the only source
+    cfg.setdefault('sources', [{}])
+    for source in cfg['sources']:
+        if 'file' not in source:
+            source.setdefault('repo_url', cfg['repo_url'])
+            source.setdefault('ssh_key', cfg['ssh_key'])
+            source.setdefault('path', cfg['dns_config_path'])
+    
+    # Per-PiHole settings fall back to the global ones
+    for pihole_config in cfg['piholes']:
+        for key in ('delta_threshold', 'connect_timeout', 'read_timeout', 'retries', 'backoff',
+                    'verify', 'verify_sample', 'verify_timeout', 'health_name'):
+            pihole_config.setdefault(key, cfg[key])
+        pihole_config.setdefault('include', [])
+        pihole_config.setdefault('exclude', [])
+        
+        # Fail early on filter rules that are neither a network nor a domain
+        for rule in pihole_config['include'] + pihole_config['exclude']:
+            filters.parse_rule(rule)
+    
     return cfg
@@ -0,0 +1,117 @@
+import ctypes
+import logging
+import os
+import select
+import threading
+
+logger = logging.getLogger(__name__)
+
+# inotify(7) events on the directory that can mean the file was written, replaced or removed
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# Editors and config management write a file in several steps, the last one counts
+SETTLE = 0.2
+
+
+def _fingerprint(path):
+    # A replaced file (rename or symlink swap, as Kubernetes does) has a new inode, an edited one a new mtime
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _inotify(directory):
+    # inotify through libc, so no extra dependency is needed; None where it is not available
+    # The symbols of the running process include libc, whatever its file is called (glibc or musl)
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError) as e:
+        logger.info('inotify is not available: %s', e)
+        return None
+    if fd < 0:
+        logger.info('inotify is not available: %s', os.strerror(ctypes.get_errno()))
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK) < 0:
+        logger.info('Cannot watch %s with inotify: %s', directory, os.strerror(ctypes.get_errno()))
+        os.close(fd)
+        return None
+    return fd
+
+
+class ConfigWatcher:
+    # Calls on_change from a background thread whenever the file at path changes. The directory is
+    # watched with inotify where possible; otherwise, and as a safety net, the file is checked every
+    # poll_interval seconds.
+    
+    def __init__(self, path, on_change, poll_interval=5.0):
+        self.path = path
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._fd = None
+        self._wakeup = None
+    
+    def start(self):
+        self._fd = _inotify(os.path.dirname(os.path.abspath(self.path)))
+        if self._fd is None:
+            logger.info('Polling %s for changes every %.0fs', self.path, self.poll_interval)
+        else:
+            logger.info('Watching %s for changes', self.path)
+            self._wakeup = os.pipe()
+        self._thread = threading.Thread(target=self._run, args=(_fingerprint(self.path),), name='config-watch',
+                                        daemon=True)
+        self._thread.start()
+        return self
+    
+    def _wait(self):
+        if self._fd is None:
+            self._stop.wait(self.poll_interval)
+            return
+        # stop() writes to the wakeup pipe, so it does not have to wait for the timeout
+        if self._fd in select.select([self._fd, self._wakeup[0]], [], [], self.poll_interval)[0]:
+            self._stop.wait(SETTLE)
+            self._drain()
+    
+    def _drain(self):
+        # The events themselves are not needed, the fingerprint tells whether the file changed
+        try:
+            while os.read(self._fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+    
+    def _run(self, last):
+        while not self._stop.is_set():
+            self._wait()
+            if self._stop.is_set():
+                break
+            current = _fingerprint(self.path)
+            if current != last:
+                last = current
+                logger.info('%s changed', self.path)
+                self.on_change()
+    
+    def stop(self):
+        self._stop.set()
+        if self._thread is None:
+            return
+        if self._wakeup is not None:
+            os.write(self._wakeup[1], b'\0')
+        self._thread.join()
+        # Closed only once the thread is gone, so neither side can touch a closed or reused descriptor
+        if self._fd is not None:
+            os.close(self._fd)
+            os.close(self._wakeup[0])
+            os.close(self._wakeup[1])
+            self._fd = self._wakeup = None
@@ -0,0 +1,51 @@
+class Delta:
+    __slots__ = ('added', 'removed', 'unchanged')
+    
+    def __init__(self, added, removed, unchanged=0):
+        self.added = added
+        self.removed = removed
+        self.unchanged = unchanged
+    
+    @property
+    def changes(self):
+        return len(self.added) + len(self.removed)
+    
+    def __repr__(self):
+        return f'Delta(added={self.added!r}, removed={self.removed!r}, unchanged={self.unchanged!r})'
+
+
+class SyncResult:
+    __slots__ = ('hosts', 'cnames')
+    
+    def __init__(self, hosts, cnames):
+        self.hosts = hosts
+        self.cnames = cnames
+    
+    @property
+    def changes(self):
+        return self.hosts.changes + self.cnames.changes
+    
+    def counts(self):
+        return {
+            'hosts': {'added': len(self.hosts.added), 'removed': len(self.hosts.removed),
+                      'unchanged': self.hosts.unchanged},
+            'cnames': {'added': len(self.cnames.added), 'removed': len(self.cnames.removed),
+                       'unchanged': self.cnames.unchanged},
+        }
+
+
+def diff(current, desired):
+    # Both sides are sets of records, so this is a hash lookup per record without building strings
+    removed = current - desired
+    added = desired - current
+    return Delta(sorted(added), sorted(removed), len(current) - len(removed))
+
+
+def total_counts(results):
+    totals = {'hosts': {'added': 0, 'removed': 0, 'unchanged': 0},
+              'cnames': {'added': 0, 'removed': 0, 'unchanged': 0}}
+    for result in results:
+        for record_type, counts in result.counts().items():
+            for name, value in counts.items():
+                totals[record_type][name] += value
+    return totals
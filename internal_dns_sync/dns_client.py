@@ -0,0 +1,105 @@
+import ipaddress
+import random
+import select
+import socket
+import struct
+import time
+
+A = 1
+CNAME = 5
+AAAA = 28
+
+FLAG_QR = 0x8000
+FLAG_RD = 0x0100
+
+
+def build_query(qid, name, qtype):
+    labels = name.rstrip('.').split('.')
+    qname = b''.join(bytes([len(label)]) + label.encode('ascii') for label in labels) + b'\0'
+    return struct.pack('!HHHHHH', qid, FLAG_RD, 1, 0, 0, 0) + qname + struct.pack('!HH', qtype, 1)
+
+
+def _read_name(data, offset):
+    # Follows compression pointers, with a bound so a malicious packet cannot loop forever
+    labels = []
+    end = None
+    for _ in range(128):
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            offset = (length & 0x3F) << 8 | data[offset + 1]
+        elif length == 0:
+            return '.'.join(labels).lower(), end if end is not None else offset + 1
+        else:
+            labels.append(data[offset + 1:offset + 1 + length].decode('ascii', 'replace'))
+            offset += 1 + length
+    raise ValueError('too many labels or compression pointers')
+
+
+def parse_response(data):
+    # Returns (id, rcode, question name, [(name, type, value)]); values of unknown types are None
+    qid, flags, qdcount, ancount, _, _ = struct.unpack_from('!HHHHHH', data)
+    if not flags & FLAG_QR:
+        raise ValueError('not a response')
+    offset = 12
+    question = None
+    for _ in range(qdcount):
+        question, offset = _read_name(data, offset)
+        offset += 4
+    
+    answers = []
+    for _ in range(ancount):
+        name, offset = _read_name(data, offset)
+        rtype, _, _, rdlength = struct.unpack_from('!HHIH', data, offset)
+        offset += 10
+        rdata = data[offset:offset + rdlength]
+        if rtype == A:
+            value = str(ipaddress.IPv4Address(rdata))
+        elif rtype == AAAA:
+            value = str(ipaddress.IPv6Address(rdata))
+        elif rtype == CNAME:
+            value = _read_name(data, offset)[0]
+        else:
+            value = None
+        answers.append((name, rtype, value))
+        offset += rdlength
+    return qid, flags & 0xF, question, answers
+
+
+def _exchange(sock, batch, results, timeout):
+    # All queries of a batch are in flight at once; answers are matched on id and question
+    ids = dict(zip(random.sample(range(1 << 16), len(batch)), batch))
+    for qid, (name, qtype) in ids.items():
+        sock.send(build_query(qid, name, qtype))
+    
+    deadline = time.monotonic() + timeout
+    while ids:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not select.select([sock], [], [], remaining)[0]:
+            return
+        try:
+            qid, rcode, question, answers = parse_response(sock.recv(4096))
+        except (OSError, ValueError, IndexError, struct.error):
+            continue
+        query = ids.get(qid)
+        if query is not None and question == query[0].rstrip('.').lower():
+            results[query] = (rcode, answers)
+            del ids[qid]
+
+
+def resolve_many(server, queries, port=53, timeout=2.0, attempts=3, window=256):
+    # Resolves (name, type) pairs against one server over a single UDP socket. Queries without an
+    # answer after every attempt are missing from the result.
+    family, _, _, _, address = socket.getaddrinfo(server, port, type=socket.SOCK_DGRAM)[0]
+    results = {}
+    pending = list(dict.fromkeys(queries))
+    with socket.socket(family, socket.SOCK_DGRAM) as sock:
+        sock.connect(address)
+        for _ in range(attempts):
+            for start in range(0, len(pending), window):
+                _exchange(sock, pending[start:start + window], results, timeout)
+            pending = [query for query in pending if query not in results]
+            if not pending:
+                break
+    return results
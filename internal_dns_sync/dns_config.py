@@ -1,26 +1,118 @@
+import json
+import os
 import yaml
 import logging
 
+from internal_dns_sync.records import HostRecord, CnameRecord
+
 logger = logging.getLogger(__name__)
 
+# libyaml's loader is an order of magnitude faster on large files
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+class DnsConfigError(ValueError):
+    def __init__(self, config_file, errors):
+        self.config_file = config_file
+        self.errors = errors
+        super().__init__(f'{len(errors)} invalid entries in {config_file}:\n  ' + '\n  '.join(errors))
+
+
+def _iter_yaml(f):
+    data = yaml.load(f, Loader=YamlLoader)
+    
+    # Handle empty file
+    if data is None:
+        return
+    if not isinstance(data, dict):
+        yield 'error', 'document', 'top level must be a mapping'
+        return
+    
+    for section, kind in (('hosts', 'host'), ('cnames', 'cname')):
+        entries = data.get(section) or []
+        if not isinstance(entries, list):
+            yield 'error', section, 'must be a list'
+            continue
+        for i, entry in enumerate(entries):
+            yield kind, f'{section}[{i}]', entry
+
+
+def _iter_hosts_file(f):
+    # Regular hosts file syntax: an IP followed by one or more names, '#' starts a comment
+    for lineno, line in enumerate(f, 1):
+        fields = line.split('#', 1)[0].split()
+        if not fields:
+            continue
+        if len(fields) == 1:
+            yield 'error', f'line {lineno}', 'expected an IP followed by at least one name'
+            continue
+        for domain in fields[1:]:
+            yield 'host', f'line {lineno}', {'ip': fields[0], 'domain': domain}
+
+
+def _iter_json_lines(f):
+    # One JSON object per line, {"ip", "domain"} for a host or {"domain", "target"} for a CNAME
+    for lineno, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError as e:
+            yield 'error', f'line {lineno}', f'invalid JSON: {e}'
+            continue
+        kind = 'cname' if isinstance(entry, dict) and 'target' in entry else 'host'
+        yield kind, f'line {lineno}', entry
+
+
+FORMATS = {
+    '.yaml': _iter_yaml,
+    '.yml': _iter_yaml,
+    '.hosts': _iter_hosts_file,
+    '.jsonl': _iter_json_lines,
+    '.ndjson': _iter_json_lines,
+}
+
+
+def _field(entry, name):
+    if not isinstance(entry, dict):
+        raise ValueError('entry must be a mapping')
+    if name not in entry:
+        raise ValueError(f"missing '{name}'")
+    value = entry[name]
+    if not isinstance(value, str):
+        raise ValueError(f"'{name}' must be a string")
+    return value
+
+
+def _parse_entry(kind, entry):
+    if kind == 'host':
+        return HostRecord(_field(entry, 'ip'), _field(entry, 'domain'))
+    return CnameRecord(_field(entry, 'domain'), _field(entry, 'target'))
+
 
 def load_dns_config(repo_dir, dns_config_path='dns-config.yaml'):
     config_file = f'{repo_dir}/{dns_config_path}'
     logger.info('Loading DNS config from %s', config_file)
     
-    with open(config_file, 'r', encoding='utf-8') as f:
-        data = yaml.safe_load(f)
-    
-    # Handle empty file
-    if data is None:
-        data = {}
+    iter_entries = FORMATS.get(os.path.splitext(dns_config_path)[1].lower(), _iter_yaml)
     
-    hosts = {}
-    for entry in data.get('hosts', []):
-        hosts[f"{entry['ip']} {entry['domain']}"] = (entry['ip'], entry['domain'])
+    # Single pass over the input; every malformed entry is reported, not just the first
+    hosts = set()
+    cnames = set()
+    errors = []
+    with open(config_file, 'r', encoding='utf-8') as f:
+        for kind, where, entry in iter_entries(f):
+            if kind == 'error':
+                errors.append(f'{where}: {entry}')
+                continue
+            try:
+                record = _parse_entry(kind, entry)
+            except ValueError as e:
+                errors.append(f'{where}: {e}')
+                continue
+            (hosts if kind == 'host' else cnames).add(record)
     
-    cnames = {}
-    for entry in data.get('cnames', []):
-        cnames[f"{entry['domain']},{entry['target']}"] = (entry['domain'], entry['target'])
+    if errors:
+        raise DnsConfigError(config_file, errors)
     
     return hosts, cnames
@@ -0,0 +1,64 @@
+import hashlib
+import ipaddress
+
+from internal_dns_sync.records import normalize_domain
+
+
+def parse_rule(rule):
+    # A rule is either a network in CIDR notation or a domain suffix
+    try:
+        return ipaddress.ip_network(rule, strict=False)
+    except ValueError:
+        return normalize_domain(rule.lstrip('.'))
+
+
+def fingerprint(pihole_config):
+    # Identifies the rules that shape a target's records, which the sources' revision knows nothing about
+    rules = sorted(map(str, map(parse_rule, pihole_config.get('include', [])))), \
+        sorted(map(str, map(parse_rule, pihole_config.get('exclude', []))))
+    return hashlib.sha1(repr(rules).encode('utf-8')).hexdigest()
+
+
+def _matches(record, rules, addresses):
+    for rule in rules:
+        if isinstance(rule, str):
+            if record.domain == rule or record.domain.endswith(f'.{rule}'):
+                return True
+        elif any(address in rule for address in addresses):
+            return True
+    return False
+
+
+def filter_records(hosts, cnames, include=(), exclude=()):
+    if not include and not exclude:
+        return hosts, cnames
+    
+    include = [parse_rule(rule) for rule in include]
+    exclude = [parse_rule(rule) for rule in exclude]
+    
+    # A host matches a network by its own address, a CNAME by the addresses of its target
+    by_domain = {}
+    for record in hosts:
+        by_domain.setdefault(record.domain, []).append(ipaddress.ip_address(record.ip))
+    
+    def keep(record, addresses):
+        if include and not _matches(record, include, addresses):
+            return False
+        return not _matches(record, exclude, addresses)
+    
+    return (
+        {record for record in hosts if keep(record, [ipaddress.ip_address(record.ip)])},
+        {record for record in cnames if keep(record, by_domain.get(record.target, []))},
+    )
+
+
+def for_targets(piholes, hosts, cnames):
+    # PiHoles with the same filters share one filtered record set
+    filtered = {}
+    desired = {}
+    for pihole_config in piholes:
+        key = (tuple(pihole_config.get('include', [])), tuple(pihole_config.get('exclude', [])))
+        if key not in filtered:
+            filtered[key] = filter_records(hosts, cnames, *key)
+        desired[pihole_config['url']] = filtered[key]
+    return desired
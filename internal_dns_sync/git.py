@@ -6,17 +6,44 @@ import tempfile
 logger = logging.getLogger(__name__)
 
 
-def clone_or_update(repo_url, ssh_key):
+def _git_env(ssh_key):
     env = os.environ.copy()
     env['GIT_SSH_COMMAND'] = f'ssh -i {ssh_key} -o StrictHostKeyChecking=accept-new'
+    return env
+
+
+def clone_or_update(repo_url, ssh_key, repo_dir=None):
+    env = _git_env(ssh_key)
     
-    repo_dir = tempfile.mkdtemp()
+    # Reuse an existing checkout when we have one, only fetching the latest commit
+    if repo_dir and os.path.isdir(os.path.join(repo_dir, '.git')):
+        logger.info('Updating repository in %s', repo_dir)
+        subprocess.run(['git', '-C', repo_dir, 'remote', 'set-url', 'origin', repo_url], env=env, check=True)
+        subprocess.run(['git', '-C', repo_dir, 'fetch', '--quiet', '--depth', '1', 'origin'], env=env, check=True)
+        subprocess.run(['git', '-C', repo_dir, 'reset', '--quiet', '--hard', '@{upstream}'], env=env, check=True)
+        return repo_dir
+    
+    if repo_dir:
+        os.makedirs(os.path.dirname(os.path.abspath(repo_dir)), exist_ok=True)
+    else:
+        repo_dir = tempfile.mkdtemp()
     logger.info('Cloning repository to %s', repo_dir)
     
     subprocess.run(
-        ['git', 'clone', repo_url, repo_dir],
+        ['git', 'clone', '--quiet', '--depth', '1', '--single-branch', repo_url, repo_dir],
         env=env,
         check=True
     )
     
     return repo_dir
+
+
+def file_revision(repo_dir, path):
+    # The blob id only changes when the file content does, unlike the commit id
+    result = subprocess.run(
+        ['git', '-C', repo_dir, 'rev-parse', f'HEAD:{path}'],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return result.stdout.strip()
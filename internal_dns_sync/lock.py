@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _hostname():
+    # Same as socket.gethostname(), without importing socket on every start
+    return os.uname().nodename
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class RunLock:
+    # Lease file that keeps overlapping runs from writing to the same PiHoles. The holder renews
+    # the lease while it runs; a lease that expired, or whose process died on this host, is stale.
+    
+    def __init__(self, lock_file, ttl=120):
+        self.lock_file = lock_file
+        self.ttl = ttl
+        self.lease = None
+        self._stop = threading.Event()
+        self._renewer = None
+    
+    def holder(self):
+        return self._read(self.lock_file)
+    
+    def _read(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            # Being written right now, or left half written by a crash: judged by its age instead
+            try:
+                return {'expires_at': os.path.getmtime(path) + self.ttl}
+            except FileNotFoundError:
+                return None
+    
+    def _stale(self, lease, now):
+        if lease.get('expires_at', 0) < now:
+            return True
+        return lease.get('host') == _hostname() and not _alive(lease.get('pid', 0))
+    
+    def _create(self):
+        fd = os.open(self.lock_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with open(fd, 'w', encoding='utf-8') as f:
+            json.dump(self.lease, f)
+    
+    def try_acquire(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.lock_file)), exist_ok=True)
+        now = time.time()
+        self.lease = {'pid': os.getpid(), 'host': _hostname(), 'acquired_at': now,
+                      'expires_at': now + self.ttl}
+        try:
+            self._create()
+        except FileExistsError:
+            current = self.holder()
+            if current is None or not self._stale(current, now):
+                self.lease = None
+                return False
+            if not self._break(current):
+                self.lease = None
+                return False
+            logger.warning('Breaking stale run lock held by pid %s on %s', current.get('pid'), current.get('host'))
+            try:
+                self._create()
+            except FileExistsError:
+                self.lease = None
+                return False
+        
+        self._stop.clear()
+        self._renewer = threading.Thread(target=self._renew, name='lock', daemon=True)
+        self._renewer.start()
+        return True
+    
+    def _break(self, stale):
+        # The lease is moved aside first, so of several runs that judged it stale only one gets it. If
+        # what was moved is not the lease judged stale, a competing run took over meanwhile and its
+        # lease goes back in place.
+        broken_file = f'{self.lock_file}.{os.urandom(8).hex()}.broken'
+        try:
+            os.rename(self.lock_file, broken_file)
+        except FileNotFoundError:
+            return False
+        try:
+            if self._read(broken_file) == stale:
+                return True
+            try:
+                os.link(broken_file, self.lock_file)
+            except FileExistsError:
+                pass
+            return False
+        finally:
+            os.unlink(broken_file)
+    
+    def acquire(self, timeout=0):
+        # Polls until the lock is free, the lease of the holder runs out, or timeout passes
+        deadline = time.monotonic() + timeout
+        while not self.try_acquire():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(remaining, 1 + random.uniform(0, 1)))
+        return True
+    
+    def _renew(self):
+        while not self._stop.wait(self.ttl / 3):
+            if self.holder() != self.lease:
+                logger.error('Run lock was taken over by another run, no longer renewing it')
+                return
+            lease = dict(self.lease, expires_at=time.time() + self.ttl)
+            tmp_file = f'{self.lock_file}.{os.getpid()}.tmp'
+            try:
+                with open(os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w',
+                          encoding='utf-8') as f:
+                    json.dump(lease, f)
+                os.replace(tmp_file, self.lock_file)
+                self.lease = lease
+            except OSError as e:
+                logger.warning('Failed to renew run lock: %s', e)
+    
+    def release(self):
+        if self.lease is None:
+            return
+        self._stop.set()
+        self._renewer.join()
+        if self.holder() == self.lease:
+            os.unlink(self.lock_file)
+        self.lease = None
+
+
+def record_skip(skip_file, holder):
+    # Appended by runs that did not get the lock, picked up by the holder for its summary
+    entry = {'skipped_at': time.time(), 'pid': os.getpid(), 'host': _hostname(), 'holder': holder}
+    os.makedirs(os.path.dirname(os.path.abspath(skip_file)), exist_ok=True)
+    with open(skip_file, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry) + '\n')
+
+
+def collect_skips(skip_file):
+    # Moved aside first, so skips recorded while reading end up in the next summary
+    pending = f'{skip_file}.pending'
+    try:
+        os.replace(skip_file, pending)
+    except FileNotFoundError:
+        return []
+    with open(pending, 'r', encoding='utf-8') as f:
+        skips = [json.loads(line) for line in f if line.strip()]
+    os.unlink(pending)
+    return skips
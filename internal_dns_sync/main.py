@@ -1,58 +1,400 @@
+import argparse
+import json
 import logging
+import os
+import random
+import signal
+import threading
+import sys
+import time
 
-from internal_dns_sync import config, git, dns_config, pihole
+from internal_dns_sync import breaker, config, diff, filters, lock, metrics, plan, sources, state, tracing
+
+# The PiHole client (and with it requests), the webhook listener and the config watcher are imported
+# where they are first needed: a one-shot run that finds nothing changed never loads them.
 
 FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
-logging.basicConfig(level=logging.INFO, format=FORMAT)
 logger = logging.getLogger(__name__)
 
 
-def sync_pihole(pihole_config, desired_hosts, desired_cnames):
-    logger.info('Syncing PiHole at %s', pihole_config['url'])
+def _is_fresh(entry, now, full_sync_interval):
+    # A target is reconciled over the network at least once per full_sync_interval to catch drift
+    return entry is not None and now - entry.get('synced_at', 0) < full_sync_interval
+
+
+def run_once(cfg, clients=None, repair=None):
+    # repair lists targets that drifted from their last synced state: only those are synced, unconditionally
+    with tracing.span('fetch'):
+        fetched = sources.fetch(cfg)
+    
+    state_file = os.path.join(cfg['cache_dir'], 'state.json')
+    sync_state = state.load_state(state_file)
+    targets = sync_state.setdefault('piholes', {})
+    revision = sources.revision(fetched)
+    now = time.time()
+    tracing.annotate(revision=revision)
     
-    api = pihole.PiHoleAPI(pihole_config['url'], pihole_config['password'])
-    api.authenticate()
+    # Nothing to do when every target is fresh and was last synced from these exact DNS sources,
+    # through the same filter rules
+    if repair is None and all(
+        _is_fresh(targets.get(p['url']), now, cfg['full_sync_interval'])
+        and targets[p['url']].get('revision') == revision
+        and targets[p['url']].get('filters') == filters.fingerprint(p)
+        for p in cfg['piholes']
+    ):
+        logger.info('DNS config unchanged at %s, skipping sync', revision[:12])
+        return {}
     
-    current_hosts = api.get_hosts()
-    current_cnames = api.get_cnames()
+    from internal_dns_sync import sync  # pylint: disable=import-outside-toplevel
     
-    # Build desired hosts list
-    desired_hosts_list = [f"{ip} {domain}" for (ip, domain) in desired_hosts.values()]
-    desired_cnames_list = [f"{domain},{target}" for (domain, target) in desired_cnames.values()]
+    desired = filters.for_targets(cfg['piholes'], *sources.load(fetched))
+    hashes = _content_hashes(desired)
     
-    # Check if updates are needed
-    hosts_changed = set(current_hosts) != set(desired_hosts_list)
-    cnames_changed = set(current_cnames) != set(desired_cnames_list)
+    # Targets that already have this content applied are skipped without any network traffic,
+    # targets that kept failing are left alone until their cooldown has passed
+    breakers = sync_state.setdefault('breakers', {})
+    pending = []
+    blocked = {}
+    for pihole_config in cfg['piholes']:
+        url = pihole_config['url']
+        entry = targets.get(url)
+        if repair is not None and url not in repair:
+            continue
+        if repair is None and _is_fresh(entry, now, cfg['full_sync_interval']) and entry.get('hash') == hashes[url]:
+            logger.info('Desired state unchanged for %s, skipping', url)
+            entry['revision'] = revision
+            entry['filters'] = filters.fingerprint(pihole_config)
+        elif breaker.is_open(breakers.get(url), now):
+            blocked[url] = breaker.CircuitOpenError(url, breakers[url]['open_until'])
+        else:
+            pending.append(pihole_config)
     
-    changes = 0
-    if hosts_changed:
-        api.update_hosts(desired_hosts_list)
-        changes += abs(len(desired_hosts_list) - len(current_hosts))
+    if clients is None:
+        clients = {}
+    sync.restore_clients(clients, pending, sync_state.get('sessions', {}))
     
-    if cnames_changed:
-        api.update_cnames(desired_cnames_list)
-        changes += abs(len(desired_cnames_list) - len(current_cnames))
+    tracing.annotate(targets=len(cfg['piholes']), pending=len(pending), blocked=len(blocked))
+    results = sync.sync_all(pending, desired, cfg['max_parallel'], clients, settle_delay=cfg['settle_delay'])
     
-    if changes > 0:
-        logger.info('Synced %d changes to %s', changes, pihole_config['url'])
-    else:
-        logger.info('No changes for %s', pihole_config['url'])
+    configs = {p['url']: p for p in pending}
+    for url, result in results.items():
+        # Held back writes say nothing about the target itself, they are simply retried next run
+        if isinstance(result, sync.WriteHeldError):
+            metrics.ERRORS.labels(url).inc()
+            continue
+        ok = not isinstance(result, Exception)
+        if ok:
+            targets[url] = {'revision': revision, 'hash': hashes[url], 'synced_at': now,
+                            'filters': filters.fingerprint(configs[url])}
+            metrics.LAST_SUCCESS.labels(url).set(now)
+        else:
+            metrics.ERRORS.labels(url).inc()
+        breakers[url] = breaker.record(breakers.get(url), ok, now, cfg['breaker_threshold'], cfg['breaker_cooldown'])
+    for url in blocked:
+        metrics.ERRORS.labels(url).inc()
+    results.update(blocked)
+    configured = {p['url'] for p in cfg['piholes']}
+    sync_state['piholes'] = {url: entry for url, entry in targets.items() if url in configured}
+    sync_state['breakers'] = {url: entry for url, entry in breakers.items() if entry and url in configured}
+    sync.save_sessions(sync_state, clients, configured)
+    state.save_state(state_file, sync_state)
     
-    return changes
+    _log_summary(results)
+    return results
 
 
-def main():
-    cfg = config.get_config()
+def run_locked(cfg, clients=None, repair=None):
+    # Every run is one trace; its id tags the run's log lines and its spans are exported together
+    with tracing.span('repair' if repair else 'run'):
+        return _run_locked(cfg, clients, repair)
+
+
+def _run_locked(cfg, clients, repair):
+    # Overlapping runs would race each other's full-list replacements on the same PiHoles
+    run_lock = lock.RunLock(os.path.join(cfg['cache_dir'], 'run.lock'), cfg['lock_ttl'])
+    skip_file = os.path.join(cfg['cache_dir'], 'skipped-runs.jsonl')
     
-    repo_dir = git.clone_or_update(cfg['repo_url'], cfg['ssh_key'])
+    if not run_lock.acquire(cfg['lock_timeout'] if cfg['lock_mode'] == 'wait' else 0):
+        holder = run_lock.holder() or {}
+        logger.warning('Skipping run, another run holds the lock (pid %s on %s)', holder.get('pid'), holder.get('host'))
+        lock.record_skip(skip_file, holder)
+        metrics.SKIPPED_RUNS.labels().inc()
+        return None
     
-    desired_hosts, desired_cnames = dns_config.load_dns_config(repo_dir, cfg['dns_config_path'])
+    try:
+        results = run_once(cfg, clients, repair)
+        
+        skips = lock.collect_skips(skip_file)
+        if skips:
+            logger.warning('%d overlapping runs were skipped since the previous run', len(skips))
+            state_file = os.path.join(cfg['cache_dir'], 'state.json')
+            sync_state = state.load_state(state_file)
+            sync_state['skipped_runs'] = sync_state.get('skipped_runs', 0) + len(skips)
+            sync_state['last_skipped_at'] = max(skip['skipped_at'] for skip in skips)
+            state.save_state(state_file, sync_state)
+        return results
+    finally:
+        run_lock.release()
+
+
+def run_watch(cfg, clients, seen):
+    # Cheap read of every PiHole that has a synced state and is not cut off by its breaker;
+    # only the ones whose records no longer match that state are synced. A poll is a trace of
+    # its own, the repair it leads to is a run and starts its own trace.
+    with tracing.span('watch', quiet=True):
+        drifted = _find_drift(cfg, clients, seen)
+    if not drifted:
+        return None
+    for url in drifted:
+        logger.warning('%s: records changed outside of the sync, repairing', url)
+        metrics.DRIFT.labels(url).inc()
+    return run_locked(cfg, clients, repair=drifted)
+
+
+def _find_drift(cfg, clients, seen):
+    from internal_dns_sync import sync, watch  # pylint: disable=import-outside-toplevel
     
-    total_changes = 0
-    for pihole_config in cfg['piholes']:
-        total_changes += sync_pihole(pihole_config, desired_hosts, desired_cnames)
+    sync_state = state.load_state(os.path.join(cfg['cache_dir'], 'state.json'))
+    targets = sync_state.get('piholes', {})
+    breakers = sync_state.get('breakers', {})
+    now = time.time()
+    watched = [p for p in cfg['piholes'] if targets.get(p['url'], {}).get('hash')
+               and not breaker.is_open(breakers.get(p['url']), now)]
+    sync.restore_clients(clients, watched, sync_state.get('sessions', {}))
+    
+    applied = {p['url']: targets[p['url']]['hash'] for p in watched}
+    return watch.find_drift(watched, clients, applied, seen, cfg['max_parallel'])
+
+
+def _content_hashes(desired):
+    # Targets sharing a filtered record set share its hash too
+    by_set = {}
+    hashes = {}
+    for url, records in desired.items():
+        if id(records) not in by_set:
+            by_set[id(records)] = state.content_hash(*records)
+        hashes[url] = by_set[id(records)]
+    return hashes
+
+
+def run_plan(cfg, json_file=None):
+    with tracing.span('plan-run'):
+        return _run_plan(cfg, json_file)
+
+
+def _run_plan(cfg, json_file):
+    from internal_dns_sync import sync  # pylint: disable=import-outside-toplevel
+    
+    with tracing.span('fetch'):
+        fetched = sources.fetch(cfg)
+    revision = sources.revision(fetched)
+    desired = filters.for_targets(cfg['piholes'], *sources.load(fetched))
+    
+    # Only reads are done, but persisted sessions are still used and kept
+    state_file = os.path.join(cfg['cache_dir'], 'state.json')
+    clients = {}
+    sync.restore_clients(clients, cfg['piholes'], state.load_state(state_file).get('sessions', {}))
+    
+    results = sync.sync_all(cfg['piholes'], desired, cfg['max_parallel'], clients, dry_run=True)
+    
+    # Only the sessions are written back, re-read under the run lock so the state of a run that
+    # finished meanwhile is kept. While a run holds the lock they are simply not saved.
+    run_lock = lock.RunLock(os.path.join(cfg['cache_dir'], 'run.lock'), cfg['lock_ttl'])
+    if run_lock.try_acquire():
+        try:
+            sync_state = state.load_state(state_file)
+            sync.save_sessions(sync_state, clients, {p['url'] for p in cfg['piholes']})
+            state.save_state(state_file, sync_state)
+        finally:
+            run_lock.release()
+    
+    # With the JSON on stdout the readable plan goes to stderr, so stdout can be parsed as a whole
+    print(plan.format_text(results), file=sys.stderr if json_file == '-' else sys.stdout)
+    if json_file == '-':
+        json.dump(plan.to_dict(results, revision), sys.stdout, indent=2, sort_keys=True)
+        print()
+    elif json_file:
+        plan.write_json(results, json_file, revision)
+    
+    return results
+
+
+def shutdown(cfg, clients):
+    # Log out so FTL can free the sessions, and forget them so nobody tries to reuse them
+    for api in clients.values():
+        api.logout()
     
-    logger.info('Total changes across all PiHoles: %d', total_changes)
+    state_file = os.path.join(cfg['cache_dir'], 'state.json')
+    sync_state = state.load_state(state_file)
+    if sync_state.pop('sessions', None) is not None:
+        state.save_state(state_file, sync_state)
+
+
+def _log_summary(results):
+    succeeded = [r for r in results.values() if not isinstance(r, Exception)]
+    failed = [url for url, r in results.items() if isinstance(r, Exception)]
+    totals = diff.total_counts(succeeded)
+    
+    from internal_dns_sync import sync  # pylint: disable=import-outside-toplevel
+    
+    for url, result in results.items():
+        if isinstance(result, (breaker.CircuitOpenError, sync.WriteHeldError)):
+            logger.warning('%s: skipped, %s', url, result)
+        elif isinstance(result, Exception):
+            logger.error('%s: failed: %s', url, result)
+        else:
+            logger.info('%s: synced, %d changes', url, result.changes)
+    
+    logger.info(
+        'Total changes across all PiHoles: %d (hosts +%d/-%d/=%d, CNAMEs +%d/-%d/=%d)',
+        sum(r.changes for r in succeeded),
+        totals['hosts']['added'], totals['hosts']['removed'], totals['hosts']['unchanged'],
+        totals['cnames']['added'], totals['cnames']['removed'], totals['cnames']['unchanged']
+    )
+    if failed:
+        logger.error('Sync failed for %d of %d PiHoles: %s', len(failed), len(results), ', '.join(failed))
+
+
+# Settings of the PiHole client, a change means a new client and session
+CLIENT_KEYS = ('password', 'connect_timeout', 'read_timeout', 'retries', 'backoff')
+# Bound once at daemon start
+RESTART_KEYS = ('metrics_port', 'webhook_port', 'webhook_secret', 'config_poll_interval')
+
+
+def reload_config(cfg, clients):
+    # The running config stays in place when the changed one does not load. Clients of PiHoles that
+    # are gone or were reconfigured are logged out; the others keep their sessions and connections.
+    try:
+        new_cfg = config.get_config()
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        logger.error('Keeping the running config, the changed one does not load: %s', e)
+        return cfg
+    
+    old = {p['url']: p for p in cfg['piholes']}
+    new = {p['url']: p for p in new_cfg['piholes']}
+    added = [url for url in new if url not in old]
+    removed = [url for url in old if url not in new]
+    changed = [url for url in new if url in old and any(new[url].get(k) != old[url].get(k) for k in CLIENT_KEYS)]
+    for url in removed + changed:
+        api = clients.pop(url, None)
+        if api is not None:
+            api.logout()
+    
+    for key in RESTART_KEYS:
+        if new_cfg.get(key) != cfg.get(key):
+            logger.warning('%s changed, this takes effect after a restart', key)
+    tracing.configure(new_cfg)
+    
+    logger.info('Reloaded config: %d PiHoles, added: %s, removed: %s, reconnected: %s', len(new),
+                ', '.join(added) or 'none', ', '.join(removed) or 'none', ', '.join(changed) or 'none')
+    return new_cfg
+
+
+def run_daemon(cfg, stop, wake=None):
+    from internal_dns_sync import config_watch, webhook  # pylint: disable=import-outside-toplevel
+    
+    logger.info('Starting daemon, syncing every %ds (+ up to %ds jitter)', cfg['interval'], cfg['jitter'])
+    
+    # PiHole sessions stay warm between cycles, the checkout lives in the cache directory.
+    # wake cuts the wait short: it is set by a push webhook and, to return promptly, on stop.
+    clients = {}
+    seen = {}
+    if wake is None:
+        wake = threading.Event()
+    servers = []
+    if cfg['metrics_port']:
+        servers.append(metrics.serve(cfg['metrics_port']))
+    if cfg['webhook_port']:
+        servers.append(webhook.serve(cfg['webhook_port'], cfg['webhook_secret'], wake.set))
+    
+    # A changed config file is picked up, and synced, right away
+    reloaded = threading.Event()
+    watcher = None
+    if cfg['config_poll_interval']:
+        def config_changed():
+            reloaded.set()
+            wake.set()
+        
+        watcher = config_watch.ConfigWatcher(config.config_path(), config_changed, cfg['config_poll_interval']).start()
+    
+    while not stop.is_set():
+        if reloaded.is_set():
+            reloaded.clear()
+            cfg = reload_config(cfg, clients)
+        try:
+            run_locked(cfg, clients)
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception('Sync cycle failed')
+        
+        delay = cfg['interval'] + random.uniform(0, cfg['jitter'])
+        logger.info('Next sync in %.0fs', delay)
+        
+        # Until then the PiHoles are checked for drift every watch_interval seconds
+        deadline = time.monotonic() + delay
+        while cfg['watch_interval'] and not stop.is_set() and deadline - time.monotonic() > cfg['watch_interval']:
+            if wake.wait(cfg['watch_interval']):
+                break
+            try:
+                run_watch(cfg, clients, seen)
+            except Exception:  # pylint: disable=broad-exception-caught
+                logger.exception('Drift check failed')
+        webhook.wait(wake, stop, max(0, deadline - time.monotonic()), cfg['webhook_debounce'])
+    
+    if watcher is not None:
+        watcher.stop()
+    shutdown(cfg, clients)
+    for server in servers:
+        server.shutdown()
+    logger.info('Daemon stopped')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Sync internal DNS entries to PiHole')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--daemon', action='store_true',
+                      help='stay resident and re-sync on an interval instead of running once')
+    mode.add_argument('--plan', action='store_true',
+                      help='show the changes for every PiHole without applying them')
+    parser.add_argument('--plan-json', metavar='FILE',
+                        help="with --plan, also write the plan as JSON to FILE ('-' for stdout)")
+    args = parser.parse_args(argv)
+    
+    # Without --plan this would silently become a real sync of every PiHole
+    if args.plan_json and not args.plan:
+        parser.error('--plan-json requires --plan')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format=FORMAT)
+    cfg = config.get_config()
+    tracing.configure(cfg)
+    
+    if args.daemon:
+        stop = threading.Event()
+        wake = threading.Event()
+        
+        def request_stop(*_):
+            stop.set()
+            wake.set()
+        
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, request_stop)
+        run_daemon(cfg, stop, wake)
+        return
+    
+    if args.plan:
+        results = run_plan(cfg, args.plan_json)
+    else:
+        try:
+            results = run_locked(cfg)
+        finally:
+            metrics.export(cfg)
+        if results is None:
+            return
+    if any(isinstance(r, Exception) for r in results.values()):
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
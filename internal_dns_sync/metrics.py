@@ -0,0 +1,208 @@
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# http.server and requests are only imported when metrics are actually served or pushed,
+# so a run that exports nothing does not pay for them at startup.
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+    
+    def register(self, metric):
+        self.metrics.append(metric)
+    
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class _Child:
+    # A metric bound to one set of label values
+    def __init__(self, metric, key):
+        self._metric = metric
+        self._key = key
+    
+    def inc(self, amount=1):
+        self._metric._update(self._key, lambda value: value + amount)
+    
+    def set(self, value):
+        self._metric._update(self._key, lambda _: value)
+    
+    def observe(self, value):
+        self._metric._observe(self._key, value)
+    
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class _Metric:
+    kind = None
+    
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+    
+    def labels(self, *values):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {values}')
+        return _Child(self, tuple(str(value) for value in values))
+    
+    def _update(self, key, update):
+        with self._lock:
+            self._values[key] = update(self._values.get(key, 0))
+    
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}' for key, value in values]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+    
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        super().__init__(name, documentation, labelnames, registry)
+    
+    def _observe(self, key, value):
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+    
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        names = self.labelnames + ('le',)
+        lines = []
+        for key, (counts, total) in values:
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{_format_labels(names, key + (_format_value(bound),))} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {counts[-1]}')
+        return lines
+
+
+PHASE_SECONDS = Histogram('internal_dns_sync_phase_seconds', 'Time spent per phase of a sync run', ['phase'])
+API_SECONDS = Histogram('internal_dns_sync_api_request_seconds', 'Time per PiHole API request, including retries',
+                        ['target', 'method'])
+SYNC_SECONDS = Histogram('internal_dns_sync_target_seconds', 'Time to sync one PiHole', ['target'])
+RECORDS = Counter('internal_dns_sync_records_total', 'DNS records changed on a PiHole', ['target', 'type', 'change'])
+ERRORS = Counter('internal_dns_sync_errors_total', 'Failed or skipped syncs per PiHole', ['target'])
+DRIFT = Counter('internal_dns_sync_drift_total', 'Times a PiHole was found changed outside of the sync', ['target'])
+SKIPPED_RUNS = Counter('internal_dns_sync_skipped_runs_total', 'Runs skipped because another run held the lock')
+LAST_SUCCESS = Gauge('internal_dns_sync_last_success_timestamp_seconds', 'Time of the last successful sync per PiHole',
+                     ['target'])
+
+
+def serve(port, addr='', registry=REGISTRY):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # pylint: disable=import-outside-toplevel
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):  # pylint: disable=invalid-name
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            logger.debug('%s - %s', self.address_string(), format % args)
+    
+    # Scrapes are answered from a background thread, so the sync loop never waits on them
+    server = ThreadingHTTPServer((addr, port), Handler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logger.info('Serving metrics on port %d', server.server_address[1])
+    return server
+
+
+def write_textfile(file, registry=REGISTRY):
+    # Written atomically so the node exporter never reads a partial file
+    tmp_file = f'{file}.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write(registry.render())
+    os.replace(tmp_file, file)
+
+
+def push(url, job='internal_dns_sync', registry=REGISTRY, timeout=10):
+    import requests  # pylint: disable=import-outside-toplevel
+    
+    response = requests.put(
+        f'{url.rstrip("/")}/metrics/job/{job}',
+        data=registry.render().encode('utf-8'),
+        headers={'Content-Type': CONTENT_TYPE},
+        timeout=timeout
+    )
+    response.raise_for_status()
+
+
+def export(cfg, registry=REGISTRY):
+    # A one-shot run hands its metrics over on exit; failing to do so never fails the sync itself
+    if cfg['metrics_textfile']:
+        try:
+            write_textfile(cfg['metrics_textfile'], registry)
+        except OSError as e:
+            logger.warning('Failed to write metrics to %s: %s', cfg['metrics_textfile'], e)
+    if cfg['pushgateway_url']:
+        import requests  # pylint: disable=import-outside-toplevel
+        
+        try:
+            push(cfg['pushgateway_url'], registry=registry)
+        except requests.RequestException as e:
+            logger.warning('Failed to push metrics to %s: %s', cfg['pushgateway_url'], e)
@@ -1,62 +1,202 @@
+import json
+import random
+import time
+from collections import namedtuple
+from urllib.parse import quote
 import requests
 import logging
 
+from internal_dns_sync import metrics, records, tracing
+
 logger = logging.getLogger(__name__)
 
+# Snapshot of the local DNS records currently configured on a PiHole, as sets of records
+DnsState = namedtuple('DnsState', ['hosts', 'cnames'])
+
+# Responses that mean the PiHole is busy or restarting rather than rejecting the request
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+def _dns_state(data):
+    dns = data.get('config', {}).get('dns', {})
+    return DnsState(records.parse_hosts(dns.get('hosts', [])), records.parse_cnames(dns.get('cnameRecords', [])))
+
+
+def parse_dns_config(body):
+    return _dns_state(json.loads(body))
+
+
+def _size(body):
+    return len(body) if isinstance(body, (bytes, str)) else 0
+
 
 class PiHoleAPI:
-    def __init__(self, base_url, password):
+    def __init__(self, base_url, password, timeout=(5, 30), retries=3, backoff=1.0):
         self.base_url = base_url.rstrip('/')
         self.password = password
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
         self.session = requests.Session()
         self.sid = None
         self.csrf = None
+        self.validity = None
+        self.expires = None
     
     def authenticate(self):
         logger.info('Authenticating with PiHole API')
-        response = self.session.post(
-            f'{self.base_url}/api/auth',
-            json={'password': self.password}
-        )
+        with tracing.span('http', method='POST', path='/api/auth') as span, \
+                metrics.API_SECONDS.labels(self.base_url, 'auth').time():
+            response = self.session.post(
+                f'{self.base_url}/api/auth',
+                json={'password': self.password},
+                timeout=self.timeout
+            )
+            span.set(status=response.status_code)
         response.raise_for_status()
         data = response.json()
-        self.sid = data['session']['sid']
-        self.csrf = data['session']['csrf']
+        self._set_session(data['session']['sid'], data['session']['csrf'], data['session'].get('validity'))
+    
+    def _set_session(self, sid, csrf, validity, expires=None):
+        self.sid = sid
+        self.csrf = csrf
+        self.validity = validity
+        self.expires = expires
+        if expires is None and validity is not None:
+            self.expires = time.time() + validity
         self.session.headers.update({
             'X-FTL-SID': self.sid,
             'X-FTL-CSRF': self.csrf
         })
     
+    def _clear_session(self):
+        self.sid = None
+        self.csrf = None
+        self.validity = None
+        self.expires = None
+        self.session.headers.pop('X-FTL-SID', None)
+        self.session.headers.pop('X-FTL-CSRF', None)
+    
+    def session_valid(self):
+        # Without a known validity we optimistically reuse the SID and rely on a 401 to tell us otherwise
+        return self.sid is not None and (self.expires is None or self.expires > time.time())
+    
+    def export_session(self):
+        if not self.session_valid():
+            return None
+        return {'sid': self.sid, 'csrf': self.csrf, 'validity': self.validity, 'expires': self.expires}
+    
+    def restore_session(self, data):
+        # A session of unknown validity is restored as well, like session_valid() it relies on a 401
+        if not data:
+            return
+        expires = data.get('expires')
+        if expires is None or expires > time.time():
+            self._set_session(data['sid'], data['csrf'], data.get('validity'), expires)
+    
+    def logout(self):
+        if self.sid is None:
+            return
+        logger.info('Logging out of PiHole API at %s', self.base_url)
+        try:
+            self.session.delete(f'{self.base_url}/api/auth', timeout=self.timeout)
+        except requests.RequestException as e:
+            logger.warning('Failed to log out of %s: %s', self.base_url, e)
+        self._clear_session()
+    
+    def _request(self, method, path, **kwargs):
+        if not self.session_valid():
+            self.authenticate()
+        
+        response = self._send(method, path, **kwargs)
+        if response.status_code == 401:
+            logger.info('Session for %s is no longer valid, re-authenticating', self.base_url)
+            self._clear_session()
+            self.authenticate()
+            response = self._send(method, path, **kwargs)
+        response.raise_for_status()
+        
+        # FTL extends the session on every authenticated request
+        if self.validity is not None:
+            self.expires = time.time() + self.validity
+        return response
+    
+    def _send(self, method, path, **kwargs):
+        with tracing.span('http', method=method.upper(), path=path) as span, \
+                metrics.API_SECONDS.labels(self.base_url, method).time():
+            response = self._send_with_retries(method, path, **kwargs)
+            span.set(status=response.status_code, bytes_sent=_size(getattr(response.request, 'body', None)),
+                     bytes_received=_size(response.content))
+            return response
+    
+    def _send_with_retries(self, method, path, **kwargs):
+        # Reads are retried on any transport error; writes only when the PiHole answered that it is
+        # overloaded or failing, since a timed out write may already have been applied.
+        send = getattr(self.session, method)
+        attempt = 0
+        while True:
+            try:
+                response = send(f'{self.base_url}{path}', timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if method != 'get' or attempt >= self.retries:
+                    raise
+                reason = e
+            else:
+                if response.status_code not in RETRY_STATUSES or method not in ('get', 'patch') \
+                        or attempt >= self.retries:
+                    return response
+                reason = f'HTTP {response.status_code}'
+            
+            # Exponential backoff with full jitter, so PiHoles recovering together are not hit in lockstep
+            delay = random.uniform(0, self.backoff * 2 ** attempt)
+            attempt += 1
+            logger.warning('%s %s%s failed (%s), retry %d/%d in %.1fs', method.upper(), self.base_url, path,
+                           reason, attempt, self.retries, delay)
+            time.sleep(delay)
+    
+    def get_dns_state(self):
+        logger.info('Fetching current DNS config')
+        response = self._request('get', '/api/config/dns')
+        return _dns_state(response.json())
+    
+    def get_dns_config(self):
+        # The raw response, so a caller polling for changes can skip parsing when it is unchanged
+        return self._request('get', '/api/config/dns').content
+    
     def get_hosts(self):
         logger.info('Fetching current DNS hosts')
-        response = self.session.get(
-            f'{self.base_url}/api/config/dns/hosts',
-            params={'sid': self.sid}
-        )
-        response.raise_for_status()
+        response = self._request('get', '/api/config/dns/hosts')
         return response.json().get('config', {}).get('dns', {}).get('hosts', [])
     
     def get_cnames(self):
         logger.info('Fetching current DNS CNAMEs')
-        response = self.session.get(
-            f'{self.base_url}/api/config/dns/cnameRecords',
-            params={'sid': self.sid}
-        )
-        response.raise_for_status()
+        response = self._request('get', '/api/config/dns/cnameRecords')
         return response.json().get('config', {}).get('dns', {}).get('cnameRecords', [])
     
+    def update_dns(self, hosts=None, cnames=None):
+        # One PATCH means one config rewrite and one resolver reload on the PiHole
+        dns = {}
+        if hosts is not None:
+            logger.info('Updating hosts list (%d entries)', len(hosts))
+            dns['hosts'] = sorted(record.wire for record in hosts)
+        if cnames is not None:
+            logger.info('Updating CNAME list (%d entries)', len(cnames))
+            dns['cnameRecords'] = sorted(record.wire for record in cnames)
+        if not dns:
+            return
+        self._request('patch', '/api/config/dns', json={'config': {'dns': dns}})
+    
+    def add_dns_item(self, key, record):
+        logger.info('Adding %s entry %s', key, record.wire)
+        self._request('put', f'/api/config/dns/{key}/{quote(record.wire, safe="")}')
+    
+    def delete_dns_item(self, key, line):
+        # Entries are deleted by the exact line stored on the PiHole
+        logger.info('Deleting %s entry %s', key, line)
+        self._request('delete', f'/api/config/dns/{key}/{quote(line, safe="")}')
+    
     def update_hosts(self, hosts):
-        logger.info('Updating hosts list (%d entries)', len(hosts))
-        response = self.session.patch(
-            f'{self.base_url}/api/config/dns',
-            json={'config': {'dns': {'hosts': hosts}}}
-        )
-        response.raise_for_status()
+        self.update_dns(hosts=hosts)
     
     def update_cnames(self, cnames):
-        logger.info('Updating CNAME list (%d entries)', len(cnames))
-        response = self.session.patch(
-            f'{self.base_url}/api/config/dns',
-            json={'config': {'dns': {'cnameRecords': cnames}}}
-        )
-        response.raise_for_status()
+        self.update_dns(cnames=cnames)
@@ -0,0 +1,45 @@
+import json
+
+LABELS = (('hosts', 'host'), ('cnames', 'cname'))
+
+
+def format_text(results):
+    lines = []
+    for url, result in results.items():
+        if isinstance(result, Exception):
+            lines.append(f'{url}: failed to fetch state: {result}')
+            continue
+        
+        added = len(result.hosts.added) + len(result.cnames.added)
+        removed = len(result.hosts.removed) + len(result.cnames.removed)
+        unchanged = result.hosts.unchanged + result.cnames.unchanged
+        lines.append(f'{url}: {added} to add, {removed} to remove, {unchanged} unchanged')
+        for attr, label in LABELS:
+            delta = getattr(result, attr)
+            lines.extend(f'  - {label} {record.wire}' for record in delta.removed)
+            lines.extend(f'  + {label} {record.wire}' for record in delta.added)
+    return '\n'.join(lines)
+
+
+def to_dict(results, revision=None):
+    targets = {}
+    for url, result in results.items():
+        if isinstance(result, Exception):
+            targets[url] = {'error': str(result)}
+        else:
+            targets[url] = {
+                attr: {
+                    'added': [record.wire for record in delta.added],
+                    'removed': [record.wire for record in delta.removed],
+                    'unchanged': delta.unchanged,
+                }
+                for attr, delta in (('hosts', result.hosts), ('cnames', result.cnames))
+            }
+            targets[url]['changes'] = result.changes
+    return {'revision': revision, 'targets': targets}
+
+
+def write_json(results, json_file, revision=None):
+    with open(json_file, 'w', encoding='utf-8') as f:
+        json.dump(to_dict(results, revision), f, indent=2, sort_keys=True)
+        f.write('\n')
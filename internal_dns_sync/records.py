@@ -0,0 +1,111 @@
+import ipaddress
+import re
+
+DOMAIN_LABEL = re.compile(r'^(?!-)[a-z0-9_-]{1,63}(?<!-)$')
+
+
+def normalize_ip(ip):
+    try:
+        return str(ipaddress.ip_address(ip))
+    except ValueError:
+        raise ValueError(f"invalid IP address '{ip}'") from None
+
+
+def normalize_domain(domain):
+    name = domain.lower()
+    if name.endswith('.'):
+        name = name[:-1]
+    if not name or len(name) > 253 or not all(DOMAIN_LABEL.match(label) for label in name.split('.')):
+        raise ValueError(f"invalid domain '{domain}'")
+    return name
+
+
+class Record:
+    # Records are compared, hashed and sorted by their canonical PiHole wire format, built once on
+    # creation. sources are the lines a record was parsed from on a PiHole, empty for desired records.
+    __slots__ = ('wire', 'sources')
+    
+    def __init__(self, wire, source=None):
+        self.wire = wire
+        self.sources = (source,) if source is not None else ()
+    
+    def __eq__(self, other):
+        return isinstance(other, Record) and other.wire == self.wire
+    
+    def __hash__(self):
+        return hash(self.wire)
+    
+    def __lt__(self, other):
+        return self.wire < other.wire
+    
+    def __repr__(self):
+        return f'{type(self).__name__}({self.wire!r})'
+
+
+class HostRecord(Record):
+    __slots__ = ('ip', 'domain')
+    
+    def __init__(self, ip, domain, source=None):
+        self.ip = normalize_ip(ip)
+        self.domain = normalize_domain(domain)
+        super().__init__(f'{self.ip} {self.domain}', source)
+
+
+class CnameRecord(Record):
+    __slots__ = ('domain', 'target')
+    
+    def __init__(self, domain, target, source=None):
+        self.domain = normalize_domain(domain)
+        self.target = normalize_domain(target)
+        super().__init__(f'{self.domain},{self.target}', source)
+
+
+class RawRecord(Record):
+    # An entry on a PiHole that cannot be parsed; it never matches a desired record
+    __slots__ = ()
+    
+    def __init__(self, wire):
+        super().__init__(wire, wire)
+
+
+def parse_hosts_line(line):
+    # hosts syntax: an IP followed by one or more names, separated by any whitespace
+    fields = line.split()
+    try:
+        if len(fields) < 2:
+            raise ValueError('expected an IP followed by at least one name')
+        return [HostRecord(fields[0], name, line) for name in fields[1:]]
+    except ValueError:
+        return [RawRecord(line)]
+
+
+def parse_cname_line(line):
+    # dnsmasq cname syntax: one or more aliases, the target and an optional TTL
+    fields = [field.strip() for field in line.split(',')]
+    if len(fields) > 2 and fields[-1].isdigit():
+        fields = fields[:-1]
+    try:
+        if len(fields) < 2:
+            raise ValueError('expected an alias and a target')
+        return [CnameRecord(alias, fields[-1], line) for alias in fields[:-1]]
+    except ValueError:
+        return [RawRecord(line)]
+
+
+def _collect(parsed):
+    # The same record can be on several lines of a PiHole, every one of them is remembered
+    found = {}
+    for record in parsed:
+        if record in found:
+            found[record].sources += record.sources
+        else:
+            found[record] = record
+    return set(found)
+
+
+def parse_hosts(lines):
+    return _collect(record for line in lines for record in parse_hosts_line(line))
+
+
+def parse_cnames(lines):
+    return _collect(record for line in lines for record in parse_cname_line(line))
@@ -0,0 +1,85 @@
+import hashlib
+import logging
+import os
+
+from internal_dns_sync import dns_config, git, metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+
+class SourceConflictError(ValueError):
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+        super().__init__(f'{len(conflicts)} conflicting names across DNS sources:\n  ' + '\n  '.join(conflicts))
+
+
+def _checkout_dir(cache_dir, repo_url):
+    return os.path.join(cache_dir, 'repos', hashlib.sha1(repo_url.encode('utf-8')).hexdigest()[:12])
+
+
+def file_revision(path):
+    # Same id git would give the file, so local files and repository files are tracked alike
+    with open(path, 'rb') as f:
+        content = f.read()
+    return hashlib.sha1(b'blob %d\0' % len(content) + content).hexdigest()
+
+
+def fetch(cfg):
+    # Every repository is checked out once, however many of its files are used
+    checkouts = {}
+    fetched = []
+    for source in cfg['sources']:
+        if 'file' in source:
+            fetched.append((source['file'], file_revision(source['file'])))
+            continue
+        repo_url = source['repo_url']
+        if repo_url not in checkouts:
+            with tracing.span('git', repo=repo_url), metrics.PHASE_SECONDS.labels('git').time():
+                checkouts[repo_url] = git.clone_or_update(repo_url, source['ssh_key'],
+                                                          _checkout_dir(cfg['cache_dir'], repo_url))
+        revision = git.file_revision(checkouts[repo_url], source['path'])
+        fetched.append((os.path.join(checkouts[repo_url], source['path']), revision))
+    return fetched
+
+
+def revision(fetched):
+    if len(fetched) == 1:
+        return fetched[0][1]
+    return hashlib.sha1('\n'.join(rev for _, rev in fetched).encode('utf-8')).hexdigest()
+
+
+def load(fetched):
+    loaded = []
+    for path, _ in fetched:
+        with tracing.span('load', path=path) as span, metrics.PHASE_SECONDS.labels('load').time():
+            hosts, cnames = dns_config.load_dns_config(os.path.dirname(path), os.path.basename(path))
+            span.set(hosts=len(hosts), cnames=len(cnames))
+        loaded.append((path, hosts, cnames))
+    return merge(loaded)
+
+
+def merge(loaded):
+    if len(loaded) == 1:
+        return loaded[0][1], loaded[0][2]
+    
+    # A name may appear in several sources, but only with exactly the same records
+    hosts = set()
+    cnames = set()
+    claims = {}
+    conflicts = []
+    for path, source_hosts, source_cnames in loaded:
+        names = {}
+        for record in (*source_hosts, *source_cnames):
+            names.setdefault(record.domain, set()).add(record)
+        for domain, records in names.items():
+            owner, owned = claims.setdefault(domain, (path, records))
+            if owner != path and owned != records:
+                conflicts.append(f'{domain}: defined differently in {owner} and {path}')
+        hosts |= source_hosts
+        cnames |= source_cnames
+    
+    if conflicts:
+        raise SourceConflictError(conflicts)
+    
+    logger.info('Merged %d sources into %d hosts and %d CNAMEs', len(loaded), len(hosts), len(cnames))
+    return hosts, cnames
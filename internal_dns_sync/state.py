@@ -0,0 +1,38 @@
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def load_state(state_file):
+    try:
+        with open(state_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        logger.warning('Ignoring unreadable state file %s: %s', state_file, e)
+        return {}
+
+
+def save_state(state_file, state):
+    os.makedirs(os.path.dirname(os.path.abspath(state_file)), exist_ok=True)
+    
+    # Write to a temporary file first so a crash never leaves a truncated state file
+    # The state holds PiHole session IDs, so keep it private
+    tmp_file = f'{state_file}.tmp'
+    with open(os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, state_file)
+
+
+def content_hash(hosts, cnames):
+    # Order-independent fingerprint of a desired state, based on the wire format of the records
+    digest = hashlib.sha256()
+    for record in sorted(hosts):
+        digest.update(f'h {record.wire}\n'.encode('utf-8'))
+    for record in sorted(cnames):
+        digest.update(f'c {record.wire}\n'.encode('utf-8'))
+    return digest.hexdigest()
@@ -0,0 +1,218 @@
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from internal_dns_sync import diff, metrics, pihole, tracing, verify
+
+logger = logging.getLogger(__name__)
+
+
+class WriteHeldError(Exception):
+    def __init__(self, url, group, unhealthy):
+        self.url = url
+        self.group = group
+        self.unhealthy = unhealthy
+        super().__init__(f'changes held back, {unhealthy} in redundancy group {group!r} '
+                         'did not recover from its update')
+
+
+class WriteSlot:
+    # Lets one member of a redundancy group write at a time. Every PiHole update reloads the resolver,
+    # so the next member only writes once the previous one has had settle_delay seconds and answers
+    # DNS again; if it does not, the rest of the group keeps its old records.
+    
+    def __init__(self, group, settle_delay):
+        self.group = group
+        self.settle_delay = settle_delay
+        self.unhealthy = None
+        self._last = None
+        self._lock = threading.Lock()
+    
+    @contextlib.contextmanager
+    def write(self, pihole_config):
+        with self._lock:
+            if self.unhealthy is None and self._last is not None:
+                previous, written_at = self._last
+                with tracing.span('settle', target=previous['url']):
+                    time.sleep(max(0.0, written_at + self.settle_delay - time.monotonic()))
+                    if not verify.healthy(previous):
+                        logger.error('%s does not answer DNS after its update, holding back the rest of group %r',
+                                     previous['url'], self.group)
+                        self.unhealthy = previous['url']
+            if self.unhealthy is not None:
+                raise WriteHeldError(pihole_config['url'], self.group, self.unhealthy)
+            
+            try:
+                yield
+            except Exception:
+                # A failed write or verification leaves the PiHole in doubt, its peers stay as they are
+                self.unhealthy = pihole_config['url']
+                raise
+            finally:
+                self._last = (pihole_config, time.monotonic())
+
+
+def _compare(api, desired_hosts, desired_cnames):
+    # Both sides are normalized records, so equivalent entries never show up as changes
+    current = api.get_dns_state()
+    return current, diff.SyncResult(diff.diff(current.hosts, desired_hosts), diff.diff(current.cnames, desired_cnames))
+
+
+def plan_pihole(pihole_config, desired_hosts, desired_cnames, api=None):
+    # The client authenticates lazily, reusing a still valid session when it has one
+    if api is None:
+        api = pihole.PiHoleAPI(pihole_config['url'], pihole_config['password'])
+    
+    with tracing.span('plan', target=pihole_config['url']) as span:
+        result = _compare(api, desired_hosts, desired_cnames)[1]
+        span.set(**_counts(result))
+        return result
+
+
+def _counts(result):
+    return {'changes': result.changes,
+            'hosts_added': len(result.hosts.added), 'hosts_removed': len(result.hosts.removed),
+            'cnames_added': len(result.cnames.added), 'cnames_removed': len(result.cnames.removed)}
+
+
+def sync_pihole(pihole_config, desired_hosts, desired_cnames, api=None, slot=None):
+    with tracing.span('sync', target=pihole_config['url']) as span, \
+            metrics.SYNC_SECONDS.labels(pihole_config['url']).time():
+        span.set(desired_hosts=len(desired_hosts), desired_cnames=len(desired_cnames))
+        result = _sync_pihole(pihole_config, desired_hosts, desired_cnames, api, slot)
+        span.set(**_counts(result))
+        return result
+
+
+def _sync_pihole(pihole_config, desired_hosts, desired_cnames, api, slot):
+    logger.info('Syncing PiHole at %s', pihole_config['url'])
+    
+    if api is None:
+        api = pihole.PiHoleAPI(pihole_config['url'], pihole_config['password'])
+    
+    current, result = _compare(api, desired_hosts, desired_cnames)
+    
+    # Only the write waits for its turn in the redundancy group, reading and diffing never do
+    if result.changes:
+        with slot.write(pihole_config) if slot is not None else contextlib.nullcontext():
+            _apply(pihole_config, api, result, current, desired_hosts, desired_cnames)
+    else:
+        _count(pihole_config['url'], result)
+        logger.info('No changes for %s', pihole_config['url'])
+    
+    return result
+
+
+def _count(url, result):
+    for kind, delta in (('hosts', result.hosts), ('cnames', result.cnames)):
+        metrics.RECORDS.labels(url, kind, 'added').inc(len(delta.added))
+        metrics.RECORDS.labels(url, kind, 'removed').inc(len(delta.removed))
+
+
+def _apply(pihole_config, api, result, current, desired_hosts, desired_cnames):
+    if result.changes > pihole_config.get('delta_threshold', 0):
+        api.update_dns(
+            hosts=desired_hosts if result.hosts.changes else None,
+            cnames=desired_cnames if result.cnames.changes else None
+        )
+    else:
+        _apply_delta(api, 'hosts', result.hosts, current.hosts)
+        _apply_delta(api, 'cnameRecords', result.cnames, current.cnames)
+    
+    _count(pihole_config['url'], result)
+    logger.info('Synced %d changes to %s (hosts +%d/-%d, CNAMEs +%d/-%d)', result.changes, pihole_config['url'],
+                len(result.hosts.added), len(result.hosts.removed),
+                len(result.cnames.added), len(result.cnames.removed))
+    
+    # A 200 only means the config was accepted, the resolver itself is asked to confirm the changes
+    if pihole_config.get('verify'):
+        verify.verify_pihole(pihole_config, result)
+
+
+def _apply_delta(api, key, delta, current):
+    # Removals go first so a replaced entry never conflicts with its successor. A PiHole line can
+    # hold several names and deleting it drops all of them, so the ones still wanted are re-added,
+    # unless another line that is kept still holds them.
+    deleted = {}
+    for record in delta.removed:
+        deleted.update(dict.fromkeys(record.sources or (record.wire,)))
+    for line in deleted:
+        api.delete_dns_item(key, line)
+    
+    removed = set(delta.removed)
+    restored = {record for record in current
+                if record not in removed and record.sources and all(line in deleted for line in record.sources)}
+    for record in sorted(restored.union(delta.added)):
+        api.add_dns_item(key, record)
+
+
+def _slots(piholes, settle_delay):
+    # PiHoles without a group are on their own and write whenever they are ready
+    groups = {}
+    slots = {}
+    for pihole_config in piholes:
+        group = pihole_config.get('group')
+        if group is None:
+            continue
+        if group not in groups:
+            groups[group] = WriteSlot(group, settle_delay)
+        slots[pihole_config['url']] = groups[group]
+    return slots
+
+
+def sync_all(piholes, desired, max_parallel=1, clients=None, dry_run=False, settle_delay=0):
+    # desired maps each PiHole URL to its (hosts, cnames).
+    # Every target gets its own outcome: a SyncResult or the exception it raised
+    results = {}
+    if not piholes:
+        return results
+    
+    # Clients are reused across calls when the caller keeps them, which keeps sessions warm.
+    # A failed client is kept too: its session is still valid or gets renewed on the next 401.
+    if clients is None:
+        clients = {}
+    restore_clients(clients, piholes, {})
+    task = plan_pihole if dry_run else sync_pihole
+    slots = {} if dry_run else _slots(piholes, settle_delay)
+    
+    # Each task runs in a copy of the caller's context, so its spans and logs belong to the caller's run
+    workers = max(1, min(max_parallel, len(piholes)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sync') as executor:
+        futures = {}
+        for p in piholes:
+            kwargs = {'api': clients[p['url']]}
+            if p['url'] in slots:
+                kwargs['slot'] = slots[p['url']]
+            futures[p['url']] = executor.submit(contextvars.copy_context().run, task, p, *desired[p['url']], **kwargs)
+        for url, future in futures.items():
+            try:
+                results[url] = future.result()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.error('Failed to sync %s: %s', url, e)
+                results[url] = e
+    
+    return results
+
+
+def restore_clients(clients, piholes, sessions):
+    # Pick up sessions persisted by a previous run so a steady-state sync needs no /api/auth
+    for pihole_config in piholes:
+        url = pihole_config['url']
+        if url not in clients:
+            clients[url] = pihole.PiHoleAPI(
+                url, pihole_config['password'],
+                timeout=(pihole_config.get('connect_timeout', 5), pihole_config.get('read_timeout', 30)),
+                retries=pihole_config.get('retries', 3),
+                backoff=pihole_config.get('backoff', 1.0)
+            )
+            clients[url].restore_session(sessions.get(url))
+
+
+def save_sessions(sync_state, clients, configured):
+    sessions = sync_state.get('sessions', {})
+    for url, api in clients.items():
+        sessions[url] = api.export_session()
+    sync_state['sessions'] = {url: s for url, s in sessions.items() if s and url in configured}
@@ -0,0 +1,171 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = 'internal-dns-sync'
+
+_current = contextvars.ContextVar('span', default=None)
+_trace_file = None
+
+
+class _Trace:
+    __slots__ = ('trace_id', 'spans', 'lock')
+    
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans = []
+        self.lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'attributes', 'start', 'end', 'error')
+    
+    def __init__(self, trace, parent_id, name, attributes):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time_ns()
+        self.end = None
+        self.error = None
+    
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+    
+    @property
+    def seconds(self):
+        return ((self.end or time.time_ns()) - self.start) / 1e9
+    
+    def to_dict(self):
+        return {
+            'name': self.name, 'trace_id': self.trace.trace_id, 'span_id': self.span_id,
+            'parent_id': self.parent_id, 'duration_ms': round(self.seconds * 1000, 3),
+            'attributes': self.attributes, **({'error': self.error} if self.error else {}),
+        }
+
+
+def annotate(**attributes):
+    # Adds attributes to the innermost open span, if any
+    span = _current.get()
+    if span is not None:
+        span.set(**attributes)
+
+
+@contextmanager
+def span(name, quiet=False, **attributes):
+    # Spans nest through a context variable; a span without a parent starts a new trace (one per run).
+    # The summary of a quiet trace, one that runs too often to be worth a line each time, is only debug.
+    parent = _current.get()
+    trace = parent.trace if parent is not None else _Trace()
+    current = Span(trace, parent.span_id if parent is not None else None, name, attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f'{type(e).__name__}: {e}'
+        raise
+    finally:
+        current.end = time.time_ns()
+        _current.reset(token)
+        with trace.lock:
+            trace.spans.append(current)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Span %s took %.1fms', name, current.seconds * 1000, extra={'span': current.to_dict()})
+        if parent is None:
+            _finish(trace, current, logging.DEBUG if quiet else logging.INFO)
+
+
+def _finish(trace, root, level):
+    # Direct children of the root are the phases worth a line in every log
+    phases = [s for s in trace.spans if s.parent_id == root.span_id]
+    if phases:
+        logger.log(level, 'Run %s: %s took %.3fs (%s)', trace.trace_id[:16], root.name, root.seconds,
+                    ', '.join(f'{_label(s)} {s.seconds:.3f}s' for s in phases))
+    if _trace_file:
+        try:
+            with open(_trace_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(to_otlp(trace.spans)) + '\n')
+        except OSError as e:
+            logger.warning('Failed to export trace to %s: %s', _trace_file, e)
+
+
+def _label(span):
+    target = span.attributes.get('target')
+    return f'{span.name} {target}' if target else span.name
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def to_otlp(spans):
+    # One ExportTraceServiceRequest in the OTLP/JSON encoding, as written by the collector's file exporter
+    return {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]},
+        'scopeSpans': [{
+            'scope': {'name': 'internal_dns_sync'},
+            'spans': [{
+                'traceId': s.trace.trace_id,
+                'spanId': s.span_id,
+                **({'parentSpanId': s.parent_id} if s.parent_id else {}),
+                'name': s.name,
+                'kind': 1,
+                'startTimeUnixNano': str(s.start),
+                'endTimeUnixNano': str(s.end),
+                'attributes': [{'key': key, 'value': _otlp_value(value)} for key, value in s.attributes.items()],
+                'status': {'code': 2, 'message': s.error} if s.error else {'code': 1},
+            } for s in spans],
+        }],
+    }]}
+
+
+class ContextFilter(logging.Filter):
+    # Tags every log record with the run and span it was logged from
+    def filter(self, record):
+        span = _current.get()
+        record.run_id = span.trace.trace_id if span is not None else None
+        record.span_id = span.span_id if span is not None else None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        for key in ('run_id', 'span_id', 'span'):
+            if getattr(record, key, None) is not None:
+                entry[key] = getattr(record, key)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure(cfg):
+    global _trace_file  # pylint: disable=global-statement
+    _trace_file = cfg['trace_file']
+    
+    root = logging.getLogger()
+    root.setLevel(cfg['log_level'])
+    for handler in root.handlers:
+        if not any(isinstance(f, ContextFilter) for f in handler.filters):
+            handler.addFilter(ContextFilter())
+        if cfg['log_format'] == 'json':
+            handler.setFormatter(JsonFormatter())
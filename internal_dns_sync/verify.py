@@ -0,0 +1,97 @@
+import ipaddress
+import logging
+import random
+import time
+from urllib.parse import urlparse
+
+from internal_dns_sync import dns_client, tracing
+from internal_dns_sync.records import CnameRecord, HostRecord
+
+logger = logging.getLogger(__name__)
+
+# The resolver reloads its config right after an update, so failing names get a few more chances
+ROUNDS = 3
+ROUND_DELAY = 1.0
+
+
+class VerificationError(Exception):
+    def __init__(self, mismatches):
+        self.mismatches = mismatches
+        super().__init__(f'{len(mismatches)} changed names do not resolve as expected: ' + '; '.join(mismatches[:5])
+                         + ('; ...' if len(mismatches) > 5 else ''))
+
+
+def _checks(result):
+    # (name, query type) -> [(answer type, value, expected present)]
+    checks = {}
+    for record, present in [*((r, True) for r in result.hosts.added), *((r, False) for r in result.hosts.removed)]:
+        if not isinstance(record, HostRecord):
+            continue
+        qtype = dns_client.AAAA if ipaddress.ip_address(record.ip).version == 6 else dns_client.A
+        checks.setdefault((record.domain, qtype), []).append((qtype, record.ip, present))
+    for record, present in [*((r, True) for r in result.cnames.added), *((r, False) for r in result.cnames.removed)]:
+        if not isinstance(record, CnameRecord):
+            continue
+        checks.setdefault((record.domain, dns_client.A), []).append((dns_client.CNAME, record.target, present))
+    return checks
+
+
+def _mismatches(checks, answers):
+    # query -> what is wrong with its answer
+    mismatches = {}
+    for query, expectations in checks.items():
+        if query not in answers:
+            mismatches[query] = ['no answer']
+            continue
+        found = {(rtype, value) for _, rtype, value in answers[query][1]}
+        for rtype, value, present in expectations:
+            if ((rtype, value) in found) != present:
+                mismatches.setdefault(query, []).append(f'{"missing" if present else "still resolves to"} {value}')
+    return mismatches
+
+
+def _server(pihole_config):
+    return pihole_config.get('dns_server') or urlparse(pihole_config['url']).hostname, pihole_config.get('dns_port', 53)
+
+
+def healthy(pihole_config):
+    # The resolver is serving again once it gives a real answer, NXDOMAIN included, rather than
+    # SERVFAIL or nothing at all
+    server, port = _server(pihole_config)
+    query = (pihole_config.get('health_name', 'pi.hole'), dns_client.A)
+    try:
+        answers = dns_client.resolve_many(server, [query], port, pihole_config.get('verify_timeout', 2.0))
+    except OSError as e:
+        logger.warning('Health check of %s failed: %s', server, e)
+        return False
+    return query in answers and answers[query][0] in (0, 3)
+
+
+def verify_pihole(pihole_config, result):
+    checks = _checks(result)
+    sample = pihole_config.get('verify_sample', 0)
+    if sample and len(checks) > sample:
+        checks = dict(random.sample(sorted(checks.items()), sample))
+    if not checks:
+        return
+    
+    server, port = _server(pihole_config)
+    logger.info('Verifying %d changed names against %s:%d', len(checks), server, port)
+    
+    total = len(checks)
+    with tracing.span('verify', target=pihole_config['url'], names=total) as span:
+        for attempt in range(ROUNDS):
+            span.set(rounds=attempt + 1)
+            answers = dns_client.resolve_many(server, list(checks), port, pihole_config.get('verify_timeout', 2.0))
+            mismatches = _mismatches(checks, answers)
+            if not mismatches:
+                logger.info('All %d changed names resolve as expected on %s', total, server)
+                return
+            if attempt < ROUNDS - 1:
+                checks = {query: checks[query] for query in mismatches}
+                time.sleep(ROUND_DELAY)
+        
+        messages = [f'{query[0]}: {problem}' for query, problems in sorted(mismatches.items()) for problem in problems]
+        for message in messages:
+            logger.error('Verification failed on %s: %s', server, message)
+        raise VerificationError(messages)
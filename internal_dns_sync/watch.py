@@ -0,0 +1,44 @@
+import contextvars
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from internal_dns_sync import pihole, state
+
+logger = logging.getLogger(__name__)
+
+
+def _drifted(api, applied, seen):
+    # A body seen before while it matched the applied state needs no parsing at all
+    body = api.get_dns_config()
+    digest = hashlib.sha256(body).hexdigest()
+    if seen.get(api.base_url) == (applied, digest):
+        return False
+    if state.content_hash(*pihole.parse_dns_config(body)) != applied:
+        return True
+    seen[api.base_url] = (applied, digest)
+    return False
+
+
+def find_drift(piholes, clients, applied, seen, max_parallel=1):
+    # applied maps each PiHole URL to the content hash of what was last synced to it, seen is kept
+    # by the caller between polls. Targets that cannot be read are left to the next sync.
+    drifted = []
+    if not piholes:
+        return drifted
+    
+    # Each check runs in a copy of the caller's context, so its requests belong to the caller's poll
+    workers = max(1, min(max_parallel, len(piholes)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='watch') as executor:
+        futures = {
+            p['url']: executor.submit(contextvars.copy_context().run, _drifted, clients[p['url']],
+                                      applied[p['url']], seen)
+            for p in piholes
+        }
+        for url, future in futures.items():
+            try:
+                if future.result():
+                    drifted.append(url)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.warning('Failed to check %s for drift: %s', url, e)
+    return drifted
@@ -0,0 +1,98 @@
+import hashlib
+import hmac
+import logging
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY = 1024 * 1024
+
+# Only pushes trigger a sync; anything else (e.g. a ping) is acknowledged only
+EVENT_HEADERS = ('X-GitHub-Event', 'X-Gitea-Event', 'X-Gogs-Event')
+
+
+def verify_signature(secret, body, signature):
+    # GitHub sends 'sha256=<hex>', Gitea and Gogs send the bare hex digest
+    if not signature:
+        return False
+    signature = signature.removeprefix('sha256=').strip().lower()
+    # compare_digest only takes ASCII strings, and anything but hex cannot match anyway
+    if not re.fullmatch('[0-9a-f]+', signature):
+        return False
+    expected = hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+class _Server(ThreadingHTTPServer):
+    def __init__(self, address, secret, trigger):
+        super().__init__(address, _Handler)
+        self.secret = secret
+        self.trigger = trigger
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):  # pylint: disable=invalid-name
+        if self.path.split('?')[0] != '/webhook':
+            self.send_error(404)
+            return
+        
+        # Checked before anything is read, as the request is not authenticated yet and a negative length would
+        # block the read
+        length = self.headers.get('Content-Length')
+        if length is None:
+            self.send_error(411)
+            return
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.send_error(400, 'Invalid Content-Length')
+            return
+        if length > MAX_BODY:
+            self.send_error(413)
+            return
+        body = self.rfile.read(length)
+        
+        signature = self.headers.get('X-Hub-Signature-256') or self.headers.get('X-Gitea-Signature') \
+            or self.headers.get('X-Gogs-Signature')
+        if not verify_signature(self.server.secret, body, signature):
+            logger.warning('Rejected webhook from %s: invalid signature', self.address_string())
+            self.send_error(401)
+            return
+        
+        event = next((self.headers[h] for h in EVENT_HEADERS if h in self.headers), 'push')
+        if event != 'push':
+            logger.info('Ignoring %s webhook', event)
+            self.send_response(204)
+            self.end_headers()
+            return
+        
+        logger.info('Push webhook received, scheduling a sync')
+        self.server.trigger()
+        self.send_response(202)
+        self.end_headers()
+    
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logger.debug('%s - %s', self.address_string(), format % args)
+
+
+def serve(port, secret, trigger, addr=''):
+    # The handler only signals the daemon loop, which does the fetch and sync itself
+    server = _Server((addr, port), secret, trigger)
+    threading.Thread(target=server.serve_forever, name='webhook', daemon=True).start()
+    logger.info('Listening for webhooks on port %d', server.server_address[1])
+    return server
+
+
+def wait(wake, stop, timeout, debounce):
+    # Returns after timeout, on stop, or once pushes have been quiet for debounce seconds,
+    # so a burst of pushes results in a single sync of the last one.
+    if not wake.wait(timeout):
+        return
+    while not stop.is_set():
+        wake.clear()
+        if not wake.wait(debounce):
+            return
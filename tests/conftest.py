@@ -0,0 +1,18 @@
+import pytest
+from internal_dns_sync.diff import Delta, SyncResult
+from internal_dns_sync.records import HostRecord
+
+
+@pytest.fixture
+def make_result():
+    # Builds the SyncResult of a target that got the given number of host records added and removed
+    def make(added=0, removed=0):
+        return SyncResult(
+            Delta(
+                [HostRecord(f'10.0.0.{i}', f'h{i}.local') for i in range(added)],
+                [HostRecord(f'10.0.1.{i}', f'r{i}.local') for i in range(removed)],
+                1
+            ),
+            Delta([], [])
+        )
+    return make
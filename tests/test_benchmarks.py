@@ -0,0 +1,41 @@
+import json
+from benchmarks import run
+from benchmarks.fake_pihole import FakePiHole
+from internal_dns_sync.pihole import PiHoleAPI
+from internal_dns_sync.records import HostRecord
+
+
+def test_fake_pihole_speaks_the_api():
+    """Test the real client against the fake PiHole"""
+    with FakePiHole() as server:
+        api = PiHoleAPI(server.url, server.password)
+        api.update_dns(hosts={HostRecord('10.0.0.1', 'a.lan')}, cnames=set())
+        api.add_dns_item('hosts', HostRecord('10.0.0.2', 'b.lan'))
+        api.delete_dns_item('hosts', '10.0.0.1 a.lan')
+
+        assert api.get_dns_state().hosts == {HostRecord('10.0.0.2', 'b.lan')}
+        assert server.requests == {'POST': 1, 'PATCH': 1, 'PUT': 1, 'DELETE': 1, 'GET': 1}
+
+
+def test_benchmark_smoke(tmp_path):
+    """Test that every scenario runs end to end and needs the expected number of requests"""
+    output = tmp_path / 'bench.json'
+
+    run.main_bench(['--sizes', '50', '--piholes', '1', '--repeat', '1', '--json', str(output)])
+
+    results = json.loads(output.read_text())
+    assert {key: r['requests'] for key, r in results.items()} == {
+        '50/initial': 3,
+        '50/unchanged': 2,
+        '50/delta': 2 + 2 * run.CHANGED,
+        '50/cached': 0,
+    }
+    assert not any(r['failed'] for r in results.values())
+
+
+def test_compare_reports_regressions():
+    """Test that extra requests and slowdowns beyond the tolerance are regressions"""
+    baseline = {'100/initial': {'seconds': 1.0, 'requests': 6, 'peak_bytes': 1000}}
+
+    assert run.compare({'100/initial': {'seconds': 1.2, 'requests': 6, 'peak_bytes': 1000}}, baseline, 0.25) == []
+    assert len(run.compare({'100/initial': {'seconds': 2.0, 'requests': 8, 'peak_bytes': 1000}}, baseline, 0.25)) == 2
@@ -82,6 +82,42 @@ def test_get_config_empty_file():
             'repo_url': 'git@github.com:melvyndekort/homelab.git',
             'ssh_key': '/ssh-key',
             'dns_config_path': 'dns/dns-config.yaml',
+            'cache_dir': '/cache',
+            'max_parallel': 8,
+            'full_sync_interval': 3600,
+            'interval': 300,
+            'jitter': 30,
+            'config_poll_interval': 5.0,
+            'watch_interval': 0,
+            'delta_threshold': 10,
+            'connect_timeout': 5.0,
+            'read_timeout': 30.0,
+            'retries': 3,
+            'backoff': 1.0,
+            'breaker_threshold': 3,
+            'breaker_cooldown': 900,
+            'metrics_port': 0,
+            'metrics_textfile': None,
+            'pushgateway_url': None,
+            'webhook_port': 0,
+            'webhook_secret': None,
+            'webhook_debounce': 5.0,
+            'verify': False,
+            'verify_sample': 0,
+            'verify_timeout': 2.0,
+            'settle_delay': 5.0,
+            'health_name': 'pi.hole',
+            'lock_mode': 'exit',
+            'lock_timeout': 600,
+            'lock_ttl': 120,
+            'log_format': 'text',
+            'log_level': 'INFO',
+            'trace_file': None,
+            'sources': [{
+                'repo_url': 'git@github.com:melvyndekort/homelab.git',
+                'ssh_key': '/ssh-key',
+                'path': 'dns/dns-config.yaml'
+            }],
             'piholes': []
         }
     finally:
@@ -131,3 +167,108 @@ ssh_key: /custom/key
         os.unlink(config_file)
         if 'CONFIG' in os.environ:
             del os.environ['CONFIG']
+
+
+def test_get_config_max_parallel_env():
+    """Test max_parallel read from environment"""
+    os.environ['CONFIG'] = '/nonexistent/config.yml'
+    os.environ['MAX_PARALLEL'] = '3'
+    try:
+        cfg = config.get_config()
+        assert cfg['max_parallel'] == 3
+    finally:
+        del os.environ['CONFIG']
+        del os.environ['MAX_PARALLEL']
+
+
+def test_get_config_per_pihole_delta_threshold():
+    """Test that PiHoles inherit the global delta_threshold unless they set their own"""
+    config_content = """
+delta_threshold: 5
+piholes:
+  - url: http://test1
+    password: pass1
+  - url: http://test2
+    password: pass2
+    delta_threshold: 0
+"""
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.yml', delete=False) as f:
+        f.write(config_content)
+        config_file = f.name
+
+    try:
+        os.environ['CONFIG'] = config_file
+        cfg = config.get_config()
+        assert cfg['piholes'][0]['delta_threshold'] == 5
+        assert cfg['piholes'][1]['delta_threshold'] == 0
+    finally:
+        os.unlink(config_file)
+        if 'CONFIG' in os.environ:
+            del os.environ['CONFIG']
+
+
+def test_get_config_sources_and_filters():
+    """Test that sources inherit the global repository and filters are validated"""
+    config_content = """
+sources:
+  - path: dns/lan.yaml
+  - repo_url: git@github.com:test/other.git
+    path: records.hosts
+  - file: /etc/extra.hosts
+piholes:
+  - url: http://test1
+    password: pass1
+    include: [lan, 10.0.0.0/8]
+"""
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.yml', delete=False) as f:
+        f.write(config_content)
+        config_file = f.name
+
+    try:
+        os.environ['CONFIG'] = config_file
+        cfg = config.get_config()
+        assert cfg['sources'] == [
+            {'repo_url': 'git@github.com:melvyndekort/homelab.git', 'ssh_key': '/ssh-key', 'path': 'dns/lan.yaml'},
+            {'repo_url': 'git@github.com:test/other.git', 'ssh_key': '/ssh-key', 'path': 'records.hosts'},
+            {'file': '/etc/extra.hosts'},
+        ]
+        assert cfg['piholes'][0]['include'] == ['lan', '10.0.0.0/8']
+        assert cfg['piholes'][0]['exclude'] == []
+    finally:
+        os.unlink(config_file)
+        if 'CONFIG' in os.environ:
+            del os.environ['CONFIG']
+
+
+def test_get_config_invalid_filter_rule():
+    """Test that a filter rule that is neither a network nor a domain is rejected"""
+    config_content = """
+piholes:
+  - url: http://test1
+    password: pass1
+    exclude: ['not a domain']
+"""
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.yml', delete=False) as f:
+        f.write(config_content)
+        config_file = f.name
+
+    try:
+        os.environ['CONFIG'] = config_file
+        with pytest.raises(ValueError, match='invalid domain'):
+            config.get_config()
+    finally:
+        os.unlink(config_file)
+        if 'CONFIG' in os.environ:
+            del os.environ['CONFIG']
+
+
+def test_get_config_webhook_requires_secret():
+    """Test that the webhook listener is not started without a secret"""
+    os.environ['CONFIG'] = '/nonexistent/config.yml'
+    os.environ['WEBHOOK_PORT'] = '8080'
+    try:
+        with pytest.raises(ValueError, match='webhook_secret'):
+            config.get_config()
+    finally:
+        del os.environ['CONFIG']
+        del os.environ['WEBHOOK_PORT']
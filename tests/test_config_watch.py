@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+import pytest
+from unittest.mock import patch
+from internal_dns_sync import config_watch
+
+
+def _watch(path, poll_interval=0.05):
+    changed = threading.Event()
+    watcher = config_watch.ConfigWatcher(str(path), changed.set, poll_interval).start()
+    return watcher, changed
+
+
+def _replace(path, content):
+    # The way editors and config management write: a new file renamed over the old one
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+def test_replaced_file_is_noticed_through_inotify(tmp_path):
+    """Test that inotify reports a config file replaced by rename long before the next poll"""
+    path = tmp_path / 'config.yml'
+    path.write_text('piholes: []\n')
+
+    watcher, changed = _watch(path, poll_interval=30)
+    try:
+        if watcher._fd is None:
+            pytest.skip('inotify is not available here')
+        _replace(path, 'piholes: [{url: http://pihole1, password: x}]\n')
+        assert changed.wait(5)
+    finally:
+        watcher.stop()
+
+
+def test_replaced_file_is_noticed_by_polling(tmp_path):
+    """Test that without inotify a replaced config file is noticed by polling"""
+    path = tmp_path / 'config.yml'
+    path.write_text('piholes: []\n')
+
+    with patch.object(config_watch, '_inotify', return_value=None):
+        watcher, changed = _watch(path)
+    try:
+        _replace(path, 'piholes: [{url: http://pihole1, password: x}]\n')
+        assert changed.wait(5)
+    finally:
+        watcher.stop()
+
+
+def test_created_file_is_noticed(tmp_path):
+    """Test that a config file that did not exist yet counts as a change once it appears"""
+    path = tmp_path / 'config.yml'
+
+    with patch.object(config_watch, '_inotify', return_value=None):
+        watcher, changed = _watch(path)
+    try:
+        path.write_text('piholes: []\n')
+        assert changed.wait(5)
+    finally:
+        watcher.stop()
+
+
+def test_untouched_file_is_not_a_change(tmp_path):
+    """Test that polling an unchanged file, or writing to another file next to it, reports nothing"""
+    path = tmp_path / 'config.yml'
+    path.write_text('piholes: []\n')
+
+    watcher, changed = _watch(path)
+    try:
+        (tmp_path / 'other.yml').write_text('x: 1\n')
+        assert not changed.wait(0.5)
+    finally:
+        watcher.stop()
+
+
+@pytest.mark.parametrize('inotify', [True, False])
+def test_stop_ends_the_thread(tmp_path, inotify):
+    """Test that stop ends the watcher thread without waiting for the poll interval"""
+    path = tmp_path / 'config.yml'
+    path.write_text('piholes: []\n')
+
+    if inotify:
+        watcher, _ = _watch(path, poll_interval=30)
+    else:
+        with patch.object(config_watch, '_inotify', return_value=None):
+            watcher, _ = _watch(path, poll_interval=0.05)
+    start = time.monotonic()
+    watcher.stop()
+
+    assert not watcher._thread.is_alive()
+    assert time.monotonic() - start < 5
+
+
+def test_stop_closes_the_descriptors(tmp_path):
+    """Test that stop closes inotify and the wakeup pipe only after the thread ended, and can be repeated"""
+    path = tmp_path / 'config.yml'
+    path.write_text('piholes: []\n')
+
+    watcher, _ = _watch(path, poll_interval=30)
+    if watcher._fd is None:
+        pytest.skip('inotify is not available here')
+    fds = [watcher._fd, *watcher._wakeup]
+    watcher.stop()
+    watcher.stop()
+
+    for fd in fds:
+        with pytest.raises(OSError):
+            os.fstat(fd)
+
+
+def test_inotify_unavailable_is_logged(caplog):
+    """Test that falling back to polling says why inotify could not be used"""
+    with patch('ctypes.CDLL', side_effect=OSError('no libc')), caplog.at_level('INFO', logger='internal_dns_sync'):
+        assert config_watch._inotify('/tmp') is None
+
+    assert 'inotify is not available: no libc' in caplog.text
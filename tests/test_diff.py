@@ -0,0 +1,80 @@
+from internal_dns_sync import diff
+from internal_dns_sync.records import HostRecord, RawRecord
+
+
+def _hosts(*wires):
+    return {HostRecord(*wire.split(' ')) for wire in wires}
+
+
+def test_diff_added_and_removed():
+    """Test that added and removed entries are computed from both sides"""
+    delta = diff.diff(_hosts('10.0.0.1 a.local', '10.0.0.2 b.local'), _hosts('10.0.0.2 b.local', '10.0.0.3 c.local'))
+
+    assert delta.added == [HostRecord('10.0.0.3', 'c.local')]
+    assert delta.removed == [HostRecord('10.0.0.1', 'a.local')]
+    assert delta.changes == 2
+
+
+def test_diff_no_changes():
+    """Test identical sets"""
+    delta = diff.diff(_hosts('10.0.0.2 b.local', '10.0.0.1 a.local'), _hosts('10.0.0.1 a.local', '10.0.0.2 b.local'))
+
+    assert delta.added == []
+    assert delta.removed == []
+    assert delta.changes == 0
+
+
+def test_diff_ip_swap_counts_both_sides():
+    """Test that replacing an entry counts as one removal and one addition"""
+    delta = diff.diff(_hosts('10.0.0.1 a.local'), _hosts('10.0.0.9 a.local'))
+
+    assert delta.changes == 2
+
+
+def test_diff_sorted_by_wire_format():
+    """Test that added and removed records are sorted for a stable order"""
+    delta = diff.diff(set(), _hosts('10.0.0.2 b.local', '10.0.0.1 z.local', '10.0.0.1 a.local'))
+
+    assert [record.wire for record in delta.added] == ['10.0.0.1 a.local', '10.0.0.1 z.local', '10.0.0.2 b.local']
+
+
+def test_diff_raw_record_is_removed():
+    """Test that a non-canonical entry on the PiHole never matches a desired record"""
+    delta = diff.diff({RawRecord('10.0.0.1  a.local')}, _hosts('10.0.0.1 a.local'))
+
+    assert delta.removed == [RawRecord('10.0.0.1  a.local')]
+    assert delta.added == [HostRecord('10.0.0.1', 'a.local')]
+
+
+def test_diff_unchanged_count():
+    """Test that entries present on both sides are counted as unchanged"""
+    current = _hosts('10.0.0.1 a', '10.0.0.1 b', '10.0.0.1 c')
+    delta = diff.diff(current, _hosts('10.0.0.1 a', '10.0.0.1 b', '10.0.0.1 d'))
+
+    assert delta.added == [HostRecord('10.0.0.1', 'd')]
+    assert delta.removed == [HostRecord('10.0.0.1', 'c')]
+    assert delta.unchanged == 2
+
+
+def test_sync_result_counts():
+    """Test the per record type counts of a sync result"""
+    result = diff.SyncResult(diff.Delta(['a'], ['b', 'c'], 5), diff.Delta([], ['d'], 1))
+
+    assert result.changes == 4
+    assert result.counts() == {
+        'hosts': {'added': 1, 'removed': 2, 'unchanged': 5},
+        'cnames': {'added': 0, 'removed': 1, 'unchanged': 1},
+    }
+
+
+def test_total_counts():
+    """Test that counts are summed across PiHoles"""
+    results = [
+        diff.SyncResult(diff.Delta(['a'], [], 2), diff.Delta([], [], 1)),
+        diff.SyncResult(diff.Delta(['a'], ['b'], 2), diff.Delta(['c'], [], 0)),
+    ]
+
+    totals = diff.total_counts(results)
+
+    assert totals['hosts'] == {'added': 2, 'removed': 1, 'unchanged': 4}
+    assert totals['cnames'] == {'added': 1, 'removed': 0, 'unchanged': 1}
@@ -0,0 +1,116 @@
+import ipaddress
+import socket
+import struct
+import threading
+import pytest
+from internal_dns_sync import dns_client
+
+ZONE = {
+    ('host.lan', dns_client.A): [(dns_client.A, '10.0.0.1')],
+    ('host6.lan', dns_client.AAAA): [(dns_client.AAAA, 'fd00::1')],
+    ('alias.lan', dns_client.A): [(dns_client.CNAME, 'host.lan'), (dns_client.A, '10.0.0.1')],
+}
+
+
+def _encode_name(name):
+    return b''.join(bytes([len(label)]) + label.encode('ascii') for label in name.split('.')) + b'\0'
+
+
+def _respond(query, zone):
+    # Answers point back at the question name, so name compression is exercised
+    qid = struct.unpack_from('!H', query)[0]
+    end = query.index(b'\0', 12) + 1
+    labels, offset = [], 12
+    while query[offset]:
+        labels.append(query[offset + 1:offset + 1 + query[offset]].decode('ascii'))
+        offset += 1 + query[offset]
+    name = '.'.join(labels).lower()
+    qtype = struct.unpack_from('!H', query, end)[0]
+    answers = zone.get((name, qtype), [])
+
+    body = b''
+    for rtype, value in answers:
+        if rtype == dns_client.CNAME:
+            rdata = _encode_name(value)
+        else:
+            rdata = ipaddress.ip_address(value).packed
+        body += struct.pack('!HHHIH', 0xC00C, rtype, 1, 60, len(rdata)) + rdata
+    flags = 0x8180 if answers else 0x8183
+    return struct.pack('!HHHHHH', qid, flags, 1, len(answers), 0, 0) + query[12:end + 4] + body
+
+
+@pytest.fixture
+def dns_server():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.settimeout(0.1)
+    seen = []
+    stop = threading.Event()
+
+    def serve():
+        while not stop.is_set():
+            try:
+                query, client = sock.recvfrom(512)
+            except socket.timeout:
+                continue
+            seen.append(query)
+            # Every first query is dropped to exercise retransmission
+            if len(seen) == 1:
+                continue
+            sock.sendto(_respond(query, ZONE), client)
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    yield sock.getsockname()[1], seen
+    stop.set()
+    thread.join()
+    sock.close()
+
+
+def test_build_and_parse_round_trip():
+    """Test that a query is built in wire format and a compressed response is parsed"""
+    query = dns_client.build_query(0x1234, 'Alias.LAN.', dns_client.A)
+
+    assert query[:2] == b'\x12\x34'
+    assert dns_client.parse_response(_respond(query, ZONE)) == (
+        0x1234, 0, 'alias.lan',
+        [('alias.lan', dns_client.CNAME, 'host.lan'), ('alias.lan', dns_client.A, '10.0.0.1')],
+    )
+
+
+def test_parse_rejects_queries():
+    """Test that a packet without the response flag is rejected"""
+    with pytest.raises(ValueError):
+        dns_client.parse_response(dns_client.build_query(1, 'host.lan', dns_client.A))
+
+
+def test_parse_rejects_pointer_loops():
+    """Test that a compression pointer pointing at itself does not loop forever"""
+    packet = struct.pack('!HHHHHH', 1, 0x8180, 1, 0, 0, 0) + b'\xc0\x0c' + struct.pack('!HH', 1, 1)
+
+    with pytest.raises(ValueError):
+        dns_client.parse_response(packet)
+
+
+def test_resolve_many_pipelines_and_retries(dns_server):
+    """Test that all queries are answered, including a lost one, and NXDOMAIN is reported"""
+    port, seen = dns_server
+    queries = [('host.lan', dns_client.A), ('host6.lan', dns_client.AAAA), ('alias.lan', dns_client.A),
+               ('missing.lan', dns_client.A)]
+
+    results = dns_client.resolve_many('127.0.0.1', queries, port, timeout=0.5)
+
+    assert results[('host.lan', dns_client.A)] == (0, [('host.lan', dns_client.A, '10.0.0.1')])
+    assert results[('host6.lan', dns_client.AAAA)] == (0, [('host6.lan', dns_client.AAAA, 'fd00::1')])
+    assert results[('missing.lan', dns_client.A)] == (3, [])
+    assert len(seen) == len(queries) + 1
+
+
+def test_resolve_many_gives_up():
+    """Test that a server that never answers leaves the queries out of the result"""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as silent:
+        silent.bind(('127.0.0.1', 0))
+        results = dns_client.resolve_many('127.0.0.1', [('host.lan', dns_client.A)], silent.getsockname()[1],
+                                          timeout=0.1, attempts=2)
+
+    assert results == {}
@@ -2,6 +2,7 @@ import pytest
 import tempfile
 import os
 from internal_dns_sync import dns_config
+from internal_dns_sync.records import HostRecord, CnameRecord
 
 
 def test_load_dns_config_success():
@@ -24,11 +25,10 @@ cnames:
         hosts, cnames = dns_config.load_dns_config(tmpdir)
         
         assert len(hosts) == 2
-        assert '10.0.0.1 test1.local' in hosts
-        assert hosts['10.0.0.1 test1.local'] == ('10.0.0.1', 'test1.local')
+        assert HostRecord('10.0.0.1', 'test1.local') in hosts
         
         assert len(cnames) == 1
-        assert 'alias.local,test1.local' in cnames
+        assert CnameRecord('alias.local', 'test1.local') in cnames
 
 
 def test_load_dns_config_missing_file():
@@ -63,8 +63,8 @@ def test_load_dns_config_empty_file():
             f.write("")
         
         hosts, cnames = dns_config.load_dns_config(tmpdir)
-        assert hosts == {}
-        assert cnames == {}
+        assert hosts == set()
+        assert cnames == set()
 
 
 def test_load_dns_config_missing_hosts():
@@ -80,7 +80,7 @@ cnames:
             f.write(yaml_content)
         
         hosts, cnames = dns_config.load_dns_config(tmpdir)
-        assert hosts == {}
+        assert hosts == set()
         assert len(cnames) == 1
 
 
@@ -98,7 +98,7 @@ hosts:
         
         hosts, cnames = dns_config.load_dns_config(tmpdir)
         assert len(hosts) == 1
-        assert cnames == {}
+        assert cnames == set()
 
 
 def test_load_dns_config_malformed_host():
@@ -113,9 +113,15 @@ hosts:
         with open(config_file, 'w') as f:
             f.write(yaml_content)
         
-        with pytest.raises((KeyError, TypeError)):
+        with pytest.raises(dns_config.DnsConfigError) as exc_info:
             dns_config.load_dns_config(tmpdir)
 
+        # Both broken entries are reported at once
+        assert exc_info.value.errors == [
+            "hosts[0]: missing 'domain'",
+            "hosts[1]: missing 'ip'",
+        ]
+
 
 def test_load_dns_config_malformed_cname():
     """Test cname entry missing required fields"""
@@ -129,9 +135,11 @@ cnames:
         with open(config_file, 'w') as f:
             f.write(yaml_content)
         
-        with pytest.raises((KeyError, TypeError)):
+        with pytest.raises(dns_config.DnsConfigError) as exc_info:
             dns_config.load_dns_config(tmpdir)
 
+        assert len(exc_info.value.errors) == 2
+
 
 def test_load_dns_config_duplicate_hosts():
     """Test duplicate host entries"""
@@ -164,6 +172,125 @@ hosts:
         with open(config_file, 'w') as f:
             f.write(yaml_content)
         
-        # Should still load but with invalid IP
+        with pytest.raises(dns_config.DnsConfigError) as exc_info:
+            dns_config.load_dns_config(tmpdir)
+
+        assert exc_info.value.errors == ["hosts[0]: invalid IP address 'not.an.ip.address'"]
+
+
+def test_load_dns_config_invalid_domain():
+    """Test invalid domain names are rejected"""
+    yaml_content = """
+hosts:
+  - ip: "10.0.0.1"
+    domain: "-bad.local"
+cnames:
+  - domain: "alias.local"
+    target: "has space.local"
+"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config_file = os.path.join(tmpdir, 'dns-config.yaml')
+        with open(config_file, 'w') as f:
+            f.write(yaml_content)
+
+        with pytest.raises(dns_config.DnsConfigError) as exc_info:
+            dns_config.load_dns_config(tmpdir)
+
+        assert exc_info.value.errors == [
+            "hosts[0]: invalid domain '-bad.local'",
+            "cnames[0]: invalid domain 'has space.local'",
+        ]
+
+
+def test_load_dns_config_normalizes_records():
+    """Test that IPv6 addresses are compressed and names lowercased without trailing dot"""
+    yaml_content = """
+hosts:
+  - ip: "fd00:0:0::0001"
+    domain: "Test.Local."
+"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config_file = os.path.join(tmpdir, 'dns-config.yaml')
+        with open(config_file, 'w') as f:
+            f.write(yaml_content)
+
         hosts, _ = dns_config.load_dns_config(tmpdir)
-        assert len(hosts) == 1
+        assert [record.wire for record in hosts] == ['fd00::1 test.local']
+
+
+def test_load_dns_config_not_a_mapping():
+    """Test a YAML document that is not a mapping"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config_file = os.path.join(tmpdir, 'dns-config.yaml')
+        with open(config_file, 'w') as f:
+            f.write("- just\n- a list\n")
+
+        with pytest.raises(dns_config.DnsConfigError):
+            dns_config.load_dns_config(tmpdir)
+
+
+def test_load_dns_config_hosts_file():
+    """Test the hosts file format with comments and multiple names per line"""
+    content = """# internal hosts
+10.0.0.1 test1.local test1-alias.local
+10.0.0.2\ttest2.local  # trailing comment
+
+fd00::3 test3.local
+"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(os.path.join(tmpdir, 'internal.hosts'), 'w') as f:
+            f.write(content)
+
+        hosts, cnames = dns_config.load_dns_config(tmpdir, 'internal.hosts')
+
+        assert {record.wire for record in hosts} == {
+            '10.0.0.1 test1.local', '10.0.0.1 test1-alias.local', '10.0.0.2 test2.local', 'fd00::3 test3.local'
+        }
+        assert cnames == set()
+
+
+def test_load_dns_config_hosts_file_errors():
+    """Test that every bad hosts file line is reported with its line number"""
+    content = "10.0.0.1\n300.0.0.1 test.local\n"
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(os.path.join(tmpdir, 'internal.hosts'), 'w') as f:
+            f.write(content)
+
+        with pytest.raises(dns_config.DnsConfigError) as exc_info:
+            dns_config.load_dns_config(tmpdir, 'internal.hosts')
+
+        assert exc_info.value.errors == [
+            'line 1: expected an IP followed by at least one name',
+            "line 2: invalid IP address '300.0.0.1'",
+        ]
+
+
+def test_load_dns_config_json_lines():
+    """Test the JSON lines format with hosts and CNAMEs"""
+    content = """{"ip": "10.0.0.1", "domain": "test1.local"}
+
+{"domain": "alias.local", "target": "test1.local"}
+"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(os.path.join(tmpdir, 'dns-config.jsonl'), 'w') as f:
+            f.write(content)
+
+        hosts, cnames = dns_config.load_dns_config(tmpdir, 'dns-config.jsonl')
+
+        assert hosts == {HostRecord('10.0.0.1', 'test1.local')}
+        assert cnames == {CnameRecord('alias.local', 'test1.local')}
+
+
+def test_load_dns_config_json_lines_errors():
+    """Test that invalid JSON lines are reported with their line number"""
+    content = '{"ip": "10.0.0.1"\n{"ip": 10, "domain": "test.local"}\n'
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(os.path.join(tmpdir, 'dns-config.jsonl'), 'w') as f:
+            f.write(content)
+
+        with pytest.raises(dns_config.DnsConfigError) as exc_info:
+            dns_config.load_dns_config(tmpdir, 'dns-config.jsonl')
+
+        assert len(exc_info.value.errors) == 2
+        assert exc_info.value.errors[0].startswith('line 1: invalid JSON')
+        assert exc_info.value.errors[1] == "line 2: 'ip' must be a string"
@@ -0,0 +1,73 @@
+import pytest
+from internal_dns_sync import filters
+from internal_dns_sync.records import HostRecord, CnameRecord
+
+
+HOSTS = {
+    HostRecord('10.0.0.1', 'nas.lan'),
+    HostRecord('10.0.0.2', 'printer.lan'),
+    HostRecord('192.168.1.1', 'router.iot'),
+}
+CNAMES = {
+    CnameRecord('files.lan', 'nas.lan'),
+    CnameRecord('admin.iot', 'router.iot'),
+}
+
+
+def test_filter_records_without_rules():
+    """Test that no rules keeps every record"""
+    assert filters.filter_records(HOSTS, CNAMES) == (HOSTS, CNAMES)
+
+
+def test_filter_records_by_domain_suffix():
+    """Test that a domain rule matches the name and its subdomains"""
+    hosts, cnames = filters.filter_records(HOSTS, CNAMES, include=['.lan'])
+
+    assert hosts == {HostRecord('10.0.0.1', 'nas.lan'), HostRecord('10.0.0.2', 'printer.lan')}
+    assert cnames == {CnameRecord('files.lan', 'nas.lan')}
+
+
+def test_filter_records_by_network():
+    """Test that CIDR rules match hosts by address and CNAMEs by their target's address"""
+    hosts, cnames = filters.filter_records(HOSTS, CNAMES, include=['192.168.0.0/16'])
+
+    assert hosts == {HostRecord('192.168.1.1', 'router.iot')}
+    assert cnames == {CnameRecord('admin.iot', 'router.iot')}
+
+
+def test_filter_records_exclude_wins():
+    """Test that exclude rules are applied after include rules"""
+    hosts, cnames = filters.filter_records(HOSTS, CNAMES, include=['10.0.0.0/8'], exclude=['printer.lan'])
+
+    assert hosts == {HostRecord('10.0.0.1', 'nas.lan')}
+    assert cnames == {CnameRecord('files.lan', 'nas.lan')}
+
+
+def test_parse_rule_rejects_invalid():
+    """Test that a rule that is neither a network nor a domain is rejected"""
+    with pytest.raises(ValueError):
+        filters.parse_rule('not a domain')
+
+
+def test_for_targets_shares_identical_filters():
+    """Test that PiHoles with the same filters get the same record set"""
+    piholes = [
+        {'url': 'http://pihole1', 'include': ['lan']},
+        {'url': 'http://pihole2', 'include': ['lan']},
+        {'url': 'http://pihole3'},
+    ]
+
+    desired = filters.for_targets(piholes, HOSTS, CNAMES)
+
+    assert desired['http://pihole1'] is desired['http://pihole2']
+    assert desired['http://pihole3'] == (HOSTS, CNAMES)
+
+
+def test_fingerprint_follows_rules_not_spelling():
+    """Test that the fingerprint changes with the rules but not with their order or spelling"""
+    base = filters.fingerprint({'include': ['lan', '10.0.0.0/8'], 'exclude': []})
+
+    assert filters.fingerprint({'include': ['10.0.0.1/8', 'LAN.'], 'exclude': []}) == base
+    assert filters.fingerprint({'include': ['lan'], 'exclude': []}) != base
+    assert filters.fingerprint({'include': [], 'exclude': ['lan', '10.0.0.0/8']}) != base
+    assert filters.fingerprint({}) == filters.fingerprint({'include': [], 'exclude': []})
@@ -1,5 +1,7 @@
 import pytest
 from unittest.mock import patch, Mock
+import os
+import shutil
 import subprocess
 from internal_dns_sync import git
 
@@ -82,3 +84,82 @@ def test_clone_or_update_permission_denied():
                     'git@github.com:test/repo.git',
                     '/path/to/key'
                 )
+
+
+def test_clone_or_update_existing_checkout():
+    """Test that an existing checkout is fetched and reset instead of re-cloned"""
+    mock_run = Mock()
+
+    with patch('subprocess.run', mock_run):
+        with patch('os.path.isdir', return_value=True):
+            with patch('tempfile.mkdtemp') as mock_mkdtemp:
+                repo_dir = git.clone_or_update(
+                    'git@github.com:test/repo.git',
+                    '/path/to/key',
+                    '/tmp/existing-repo'
+                )
+
+    assert repo_dir == '/tmp/existing-repo'
+    mock_mkdtemp.assert_not_called()
+    commands = [c[0][0] for c in mock_run.call_args_list]
+    assert 'set-url' in commands[0]
+    assert 'fetch' in commands[1] and '--depth' in commands[1]
+    assert 'reset' in commands[2]
+    assert all('clone' not in c for c in commands)
+
+
+def test_clone_or_update_into_cache_dir(tmp_path):
+    """Test that a missing cache checkout is cloned shallow into the given directory"""
+    mock_run = Mock()
+    repo_dir = str(tmp_path / 'cache' / 'repo')
+
+    with patch('subprocess.run', mock_run):
+        with patch('tempfile.mkdtemp') as mock_mkdtemp:
+            result = git.clone_or_update('git@github.com:test/repo.git', '/path/to/key', repo_dir)
+
+    assert result == repo_dir
+    assert (tmp_path / 'cache').is_dir()
+    mock_mkdtemp.assert_not_called()
+    command = mock_run.call_args[0][0]
+    assert command[:2] == ['git', 'clone']
+    assert '--depth' in command
+    assert command[-1] == repo_dir
+
+
+def test_file_revision():
+    """Test that the blob id of the file at HEAD is returned"""
+    mock_run = Mock(return_value=Mock(stdout='abc123\n'))
+
+    with patch('subprocess.run', mock_run):
+        revision = git.file_revision('/tmp/repo', 'dns/dns-config.yaml')
+
+    assert revision == 'abc123'
+    assert mock_run.call_args[0][0] == ['git', '-C', '/tmp/repo', 'rev-parse', 'HEAD:dns/dns-config.yaml']
+
+
+@pytest.mark.skipif(shutil.which('git') is None, reason='git not installed')
+def test_clone_then_update_real_repo(tmp_path):
+    """Test a clone followed by an incremental update against a local repository"""
+    upstream = tmp_path / 'upstream'
+    env = {**os.environ, 'GIT_AUTHOR_NAME': 't', 'GIT_AUTHOR_EMAIL': 't@t', 'GIT_COMMITTER_NAME': 't',
+           'GIT_COMMITTER_EMAIL': 't@t'}
+
+    def commit(content):
+        (upstream / 'dns-config.yaml').write_text(content)
+        subprocess.run(['git', '-C', str(upstream), 'add', '.'], check=True, env=env)
+        subprocess.run(['git', '-C', str(upstream), 'commit', '-qm', 'update'], check=True, env=env)
+
+    subprocess.run(['git', 'init', '-q', str(upstream)], check=True)
+    commit('hosts: []\n')
+
+    repo_dir = str(tmp_path / 'cache' / 'repo')
+    git.clone_or_update(f'file://{upstream}', '/path/to/key', repo_dir)
+    first = git.file_revision(repo_dir, 'dns-config.yaml')
+
+    git.clone_or_update(f'file://{upstream}', '/path/to/key', repo_dir)
+    assert git.file_revision(repo_dir, 'dns-config.yaml') == first
+
+    commit('cnames: []\n')
+    git.clone_or_update(f'file://{upstream}', '/path/to/key', repo_dir)
+    assert git.file_revision(repo_dir, 'dns-config.yaml') != first
+    assert (tmp_path / 'cache' / 'repo' / 'dns-config.yaml').read_text() == 'cnames: []\n'
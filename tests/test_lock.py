@@ -0,0 +1,123 @@
+import json
+import socket
+import threading
+import time
+from unittest.mock import patch
+from internal_dns_sync import lock
+
+
+def test_lock_is_exclusive(tmp_path):
+    """Test that a held lock cannot be acquired again until it is released"""
+    first = lock.RunLock(str(tmp_path / 'run.lock'))
+    second = lock.RunLock(str(tmp_path / 'run.lock'))
+
+    assert first.try_acquire()
+    try:
+        assert not second.try_acquire()
+        assert second.holder()['pid'] == first.lease['pid']
+    finally:
+        first.release()
+
+    assert not (tmp_path / 'run.lock').exists()
+    assert second.try_acquire()
+    second.release()
+
+
+def test_expired_lease_is_broken(tmp_path):
+    """Test that a lease that was not renewed in time is taken over"""
+    lock_file = tmp_path / 'run.lock'
+    lock_file.write_text(json.dumps({'pid': 1, 'host': 'elsewhere', 'expires_at': time.time() - 1}))
+
+    run_lock = lock.RunLock(str(lock_file))
+    assert run_lock.try_acquire()
+    run_lock.release()
+
+
+def test_lease_of_dead_process_is_broken(tmp_path):
+    """Test that a lease held by a process that no longer exists on this host is taken over"""
+    lock_file = tmp_path / 'run.lock'
+    lock_file.write_text(json.dumps({'pid': 2 ** 22 + 1, 'host': socket.gethostname(),
+                                     'expires_at': time.time() + 600}))
+
+    run_lock = lock.RunLock(str(lock_file))
+    assert run_lock.try_acquire()
+    run_lock.release()
+
+
+def test_stale_lease_is_broken_by_one_run_only(tmp_path):
+    """Test that of two runs that judged the same lease stale, only one ends up holding the lock"""
+    lock_file = tmp_path / 'run.lock'
+    lock_file.write_text(json.dumps({'pid': 1, 'host': 'elsewhere', 'expires_at': time.time() - 1}))
+    first = lock.RunLock(str(lock_file))
+    second = lock.RunLock(str(lock_file))
+    stale = second.holder()
+
+    def first_breaks_it_meanwhile():
+        assert first.try_acquire()
+        return stale
+
+    try:
+        with patch.object(second, 'holder', side_effect=first_breaks_it_meanwhile):
+            assert not second.try_acquire()
+        assert second.holder() == first.lease
+    finally:
+        first.release()
+    assert not list(tmp_path.iterdir())
+
+
+def test_lease_gone_while_breaking_is_not_taken(tmp_path):
+    """Test that a run that finds the stale lease already moved aside backs off without an error"""
+    lock_file = tmp_path / 'run.lock'
+    lock_file.write_text(json.dumps({'pid': 1, 'host': 'elsewhere', 'expires_at': time.time() - 1}))
+    run_lock = lock.RunLock(str(lock_file))
+    stale = run_lock.holder()
+
+    def broken_by_another_run():
+        lock_file.unlink()
+        return stale
+
+    with patch.object(run_lock, 'holder', side_effect=broken_by_another_run):
+        assert not run_lock.try_acquire()
+    assert run_lock.lease is None
+
+
+def test_live_lease_on_other_host_is_kept(tmp_path):
+    """Test that an unexpired lease from another host is respected"""
+    lock_file = tmp_path / 'run.lock'
+    lock_file.write_text(json.dumps({'pid': 2 ** 22 + 1, 'host': 'elsewhere', 'expires_at': time.time() + 600}))
+
+    assert not lock.RunLock(str(lock_file)).try_acquire()
+
+
+def test_acquire_waits_for_release(tmp_path):
+    """Test that a waiting run gets the lock once the holder is done"""
+    holder = lock.RunLock(str(tmp_path / 'run.lock'))
+    holder.try_acquire()
+    threading.Timer(0.2, holder.release).start()
+
+    waiting = lock.RunLock(str(tmp_path / 'run.lock'))
+    assert waiting.acquire(timeout=10)
+    waiting.release()
+
+
+def test_holder_renews_lease(tmp_path):
+    """Test that the lease is extended while the lock is held"""
+    run_lock = lock.RunLock(str(tmp_path / 'run.lock'), ttl=0.3)
+    run_lock.try_acquire()
+    first_expiry = run_lock.lease['expires_at']
+    try:
+        time.sleep(0.5)
+        assert run_lock.holder()['expires_at'] > first_expiry
+        assert not lock.RunLock(str(tmp_path / 'run.lock'), ttl=0.3).try_acquire()
+    finally:
+        run_lock.release()
+
+
+def test_skips_are_collected_once(tmp_path):
+    """Test that recorded skips are handed over once"""
+    skip_file = str(tmp_path / 'skipped-runs.jsonl')
+    lock.record_skip(skip_file, {'pid': 1})
+    lock.record_skip(skip_file, {'pid': 1})
+
+    assert [skip['holder'] for skip in lock.collect_skips(skip_file)] == [{'pid': 1}, {'pid': 1}]
+    assert lock.collect_skips(skip_file) == []
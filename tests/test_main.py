@@ -0,0 +1,653 @@
+import json
+import logging
+import threading
+import pytest
+from unittest.mock import Mock, patch
+import requests
+from internal_dns_sync import breaker, lock, main, sources, state, sync, tracing
+from internal_dns_sync.records import HostRecord
+
+
+PIHOLES = [
+    {'url': 'http://pihole1', 'password': 'pass1'},
+    {'url': 'http://pihole2', 'password': 'pass2'},
+    {'url': 'http://pihole3', 'password': 'pass3'},
+]
+
+
+@pytest.fixture(autouse=True)
+def _restore_root_logger():
+    # main() configures the root logger from the config, which must not leak into other tests
+    root = logging.getLogger()
+    level = root.level
+    yield
+    root.setLevel(level)
+
+
+def _run_once_cfg(tmp_path):
+    return {
+        'repo_url': 'git@github.com:test/repo.git',
+        'ssh_key': '/path/to/key',
+        'dns_config_path': 'dns-config.yaml',
+        'cache_dir': str(tmp_path),
+        'full_sync_interval': 3600,
+        'max_parallel': 2,
+        'breaker_threshold': 2,
+        'breaker_cooldown': 600,
+        'settle_delay': 0,
+        'metrics_textfile': None,
+        'pushgateway_url': None,
+        'lock_mode': 'exit',
+        'lock_timeout': 0,
+        'lock_ttl': 60,
+        'log_format': 'text',
+        'log_level': 'INFO',
+        'trace_file': None,
+        'sources': [{'repo_url': 'git@github.com:test/repo.git', 'ssh_key': '/path/to/key', 'path': 'dns-config.yaml'}],
+        'piholes': PIHOLES,
+    }
+
+
+def test_main_aggregates_changes(caplog, tmp_path, make_result):
+    """Test that main sums changes across all PiHoles"""
+    cfg = _run_once_cfg(tmp_path)
+
+    with patch('internal_dns_sync.config.get_config', return_value=cfg), \
+         patch('internal_dns_sync.git.clone_or_update', return_value='/tmp/repo'), \
+         patch('internal_dns_sync.git.file_revision', return_value='rev1'), \
+         patch('internal_dns_sync.dns_config.load_dns_config', return_value=(set(), set())), \
+         patch.object(sync, 'sync_pihole', return_value=make_result(added=1, removed=1)):
+        with caplog.at_level('INFO'):
+            main.main([])
+
+    assert 'Total changes across all PiHoles: 6' in caplog.text
+
+
+def test_main_exits_nonzero_on_failure(tmp_path):
+    """Test that main exits with an error when any PiHole failed"""
+    cfg = _run_once_cfg(tmp_path)
+
+    with patch('internal_dns_sync.config.get_config', return_value=cfg), \
+         patch('internal_dns_sync.git.clone_or_update', return_value='/tmp/repo'), \
+         patch('internal_dns_sync.git.file_revision', return_value='rev1'), \
+         patch('internal_dns_sync.dns_config.load_dns_config', return_value=(set(), set())), \
+         patch.object(sync, 'sync_pihole', side_effect=requests.HTTPError('500 Error')):
+        with pytest.raises(SystemExit):
+            main.main([])
+
+
+def test_main_exports_metrics(tmp_path, make_result):
+    """Test that a one-shot run writes its metrics to the textfile"""
+    cfg = _run_once_cfg(tmp_path)
+    cfg['metrics_textfile'] = str(tmp_path / 'internal_dns_sync.prom')
+
+    with patch('internal_dns_sync.config.get_config', return_value=cfg), \
+         patch('internal_dns_sync.git.clone_or_update', return_value='/tmp/repo'), \
+         patch('internal_dns_sync.git.file_revision', return_value='rev1'), \
+         patch('internal_dns_sync.dns_config.load_dns_config', return_value=(set(), set())), \
+         patch.object(sync, 'sync_pihole', return_value=make_result(added=2)):
+        main.main([])
+
+    exported = (tmp_path / 'internal_dns_sync.prom').read_text()
+    assert 'internal_dns_sync_last_success_timestamp_seconds{target="http://pihole1"}' in exported
+    assert 'internal_dns_sync_phase_seconds_count{phase="load"}' in exported
+
+
+def test_run_daemon_reuses_clients_and_stops(tmp_path):
+    """Test that the daemon keeps its clients between cycles and honours stop"""
+    cfg = {'interval': 0, 'jitter': 0, 'cache_dir': str(tmp_path), 'metrics_port': 0, 'webhook_port': 0,
+           'webhook_debounce': 0, 'watch_interval': 0,
+           'config_poll_interval': 0}
+    stop = threading.Event()
+    calls = []
+
+    def fake_run_once(cfg, clients):
+        calls.append(clients)
+        if len(calls) == 3:
+            stop.set()
+        return {}
+
+    with patch.object(main, 'run_locked', side_effect=fake_run_once):
+        main.run_daemon(cfg, stop)
+
+    assert len(calls) == 3
+    assert calls[0] is calls[1] is calls[2]
+
+
+def test_run_daemon_survives_failed_cycle(tmp_path):
+    """Test that an exception in one cycle does not stop the daemon"""
+    cfg = {'interval': 0, 'jitter': 0, 'cache_dir': str(tmp_path), 'metrics_port': 0, 'webhook_port': 0,
+           'webhook_debounce': 0, 'watch_interval': 0,
+           'config_poll_interval': 0}
+    stop = threading.Event()
+    calls = []
+
+    def fake_run_once(cfg, clients):
+        calls.append(clients)
+        if len(calls) == 1:
+            raise RuntimeError('git failed')
+        stop.set()
+        return {}
+
+    with patch.object(main, 'run_locked', side_effect=fake_run_once):
+        main.run_daemon(cfg, stop)
+
+    assert len(calls) == 2
+
+
+def test_main_daemon_flag():
+    """Test that --daemon starts the resident loop"""
+    with patch('internal_dns_sync.config.get_config',
+               return_value={'log_format': 'text', 'log_level': 'INFO', 'trace_file': None}), \
+         patch('signal.signal'), \
+         patch.object(main, 'run_daemon') as mock_daemon:
+        main.main(['--daemon'])
+
+    mock_daemon.assert_called_once()
+
+
+def test_run_once_skips_unchanged_revision(tmp_path, make_result):
+    """Test that an unchanged DNS config revision skips the sync entirely"""
+    cfg = _run_once_cfg(tmp_path)
+
+    with patch('internal_dns_sync.git.clone_or_update', return_value='/tmp/repo') as mock_clone, \
+         patch('internal_dns_sync.git.file_revision', return_value='rev1'), \
+         patch('internal_dns_sync.dns_config.load_dns_config', return_value=(set(), set())) as mock_load, \
+         patch.object(sync, 'sync_pihole', return_value=make_result()) as mock_sync:
+        main.run_once(cfg)
+        main.run_once(cfg)
+
+    assert mock_clone.call_args[0][2] == sources._checkout_dir(str(tmp_path), 'git@github.com:test/repo.git')
+    assert mock_load.call_count == 1
+    assert mock_sync.call_count == len(PIHOLES)
+
+
+def test_run_once_resyncs_after_failure(tmp_path, make_result):
+    """Test that a run with a failed PiHole is not recorded as successful"""
+    cfg = _run_once_cfg(tmp_path)
+
+    with patch('internal_dns_sync.git.clone_or_update', return_value='/tmp/repo'), \
+         patch('internal_dns_sync.git.file_revision', return_value='rev1'), \
+         patch('internal_dns_sync.dns_config.load_dns_config', return_value=(set(), set())), \
+         patch.object(sync, 'sync_pihole', side_effect=requests.HTTPError('500 Error')):
+        main.run_once(cfg)
+
+    with patch('internal_dns_sync.git.clone_or_update', return_value='/tmp/repo'), \
+         patch('internal_dns_sync.git.file_revision', return_value='rev1'), \
+         patch('internal_dns_sync.dns_config.load_dns_config', return_value=(set(), set())), \
+         patch.object(sync, 'sync_pihole', return_value=make_result()) as mock_sync:
+        main.run_once(cfg)
+
+    assert mock_sync.call_count == len(PIHOLES)
+
+
+def test_run_once_held_back_write_is_retried_without_breaker(tmp_path, caplog, make_result):
+    """Test that a write held back by its redundancy group neither trips the breaker nor counts as synced"""
+    cfg = _run_once_cfg(tmp_path)
+    cfg['breaker_threshold'] = 1
+
+    def fake_sync(pihole_config, *args, **kwargs):
+        if pihole_config['url'] == 'http://pihole2':
+            raise sync.WriteHeldError('http://pihole2', 'lan', 'http://pihole1')
+        return make_result()
+
+    with patch('internal_dns_sync.git.clone_or_update', return_value='/tmp/repo'), \
+         patch('internal_dns_sync.git.file_revision', return_value='rev1'), \
+         patch('internal_dns_sync.dns_config.load_dns_config', return_value=(set(), set())), \
+         patch.object(sync, 'sync_pihole', side_effect=fake_sync) as mock_sync:
+        with caplog.at_level('INFO'):
+            main.run_once(cfg)
+        mock_sync.reset_mock()
+        mock_sync.side_effect = None
+        mock_sync.return_value = make_result()
+        main.run_once(cfg)
+
+    assert 'http://pihole2: skipped, changes held back' in caplog.text
+    assert [c.args[0]['url'] for c in mock_sync.call_args_list] == ['http://pihole2']
+
+
+def test_run_once_opens_circuit_after_repeated_failures(tmp_path, caplog, make_result):
+    """Test that a consistently failing PiHole is skipped until its cooldown has passed"""
+    cfg = _run_once_cfg(tmp_path)
+    failing = requests.ConnectionError('unreachable')
+    clock = [1000.0]
+
+    def fake_sync(pihole_config, *args, **kwargs):
+        if pihole_config['url'] == 'http://pihole1':
+            raise failing
+        return make_result()
+
+    with patch('internal_dns_sync.git.clone_or_update', return_value='/tmp/repo'), \
+         patch('internal_dns_sync.git.file_revision', return_value='rev1'), \
+         patch('internal_dns_sync.dns_config.load_dns_config', return_value=(set(), set())), \
+         patch.object(sync, 'sync_pihole', side_effect=fake_sync) as mock_sync, \
+         patch('time.time', side_effect=lambda: clock[0]):
+        main.run_once(cfg)
+        main.run_once(cfg)
+        with caplog.at_level('INFO'):
+            results = main.run_once(cfg)
+        assert mock_sync.call_count == 4
+        assert isinstance(results['http://pihole1'], breaker.CircuitOpenError)
+        assert 'http://pihole1: skipped, circuit open' in caplog.text
+
+        clock[0] += cfg['breaker_cooldown']
+        main.run_once(cfg)
+        assert [c[0][0]['url'] for c in mock_sync.call_args_list[4:]] == ['http://pihole1']
+
+
+def test_run_once_closes_circuit_after_success(tmp_path, make_result):
+    """Test that one successful sync resets the failure count of a PiHole"""
+    cfg = _run_once_cfg(tmp_path)
+
+    with patch('internal_dns_sync.git.clone_or_update', return_value='/tmp/repo'), \
+         patch('internal_dns_sync.git.file_revision', side_effect=['rev1', 'rev2']), \
+         patch('internal_dns_sync.dns_config.load_dns_config', return_value=(set(), set())), \
+         patch.object(sync, 'sync_pihole', side_effect=[requests.HTTPError('500 Error'), make_result(), make_result(),
+                                                        make_result(), make_result(), make_result()]):
+        main.run_once(cfg)
+        main.run_once(cfg)
+
+    saved = json.loads((tmp_path / 'state.json').read_text())
+    assert saved['breakers'] == {}
+
+
+def test_overlapping_run_is_skipped_and_recorded(tmp_path, make_result):
+    """Test that a run exits without syncing while another holds the lock, and the next run records it"""
+    cfg = _run_once_cfg(tmp_path)
+    holder = lock.RunLock(str(tmp_path / 'run.lock'))
+    holder.try_acquire()
+
+    with patch('internal_dns_sync.config.get_config', return_value=cfg), \
+         patch('internal_dns_sync.git.clone_or_update', return_value='/tmp/repo'), \
+         patch('internal_dns_sync.git.file_revision', return_value='rev1'), \
+         patch('internal_dns_sync.dns_config.load_dns_config', return_value=(set(), set())), \
+         patch.object(sync, 'sync_pihole', return_value=make_result()) as mock_sync:
+        main.main([])
+        mock_sync.assert_not_called()
+
+        holder.release()
+        main.main([])
+        assert mock_sync.call_count == len(PIHOLES)
+
+    saved = json.loads((tmp_path / 'state.json').read_text())
+    assert saved['skipped_runs'] == 1
+    assert not (tmp_path / 'run.lock').exists()
+
+
+def test_run_once_syncs_only_new_target(tmp_path, make_result):
+    """Test that adding a PiHole only syncs the new one when the config is unchanged"""
+    cfg = _run_once_cfg(tmp_path)
+
+    with patch('internal_dns_sync.git.clone_or_update', return_value='/tmp/repo'), \
+         patch('internal_dns_sync.git.file_revision', return_value='rev1'), \
+         patch('internal_dns_sync.dns_config.load_dns_config', return_value=(set(), set())), \
+         patch.object(sync, 'sync_pihole', return_value=make_result()) as mock_sync:
+        main.run_once(cfg)
+        cfg['piholes'] = PIHOLES + [{'url': 'http://pihole4', 'password': 'pass4'}]
+        main.run_once(cfg)
+
+    assert mock_sync.call_count == len(PIHOLES) + 1
+    assert mock_sync.call_args[0][0]['url'] == 'http://pihole4'
+
+
+def test_run_once_skips_unchanged_content(tmp_path, make_result):
+    """Test that a new revision with identical records does not touch the PiHoles"""
+    cfg = _run_once_cfg(tmp_path)
+    desired = ({HostRecord('10.0.0.1', 'test.local')}, set())
+
+    with patch('internal_dns_sync.git.clone_or_update', return_value='/tmp/repo'), \
+         patch('internal_dns_sync.git.file_revision', side_effect=['rev1', 'rev2', 'rev2']), \
+         patch('internal_dns_sync.dns_config.load_dns_config', return_value=desired) as mock_load, \
+         patch.object(sync, 'sync_pihole', return_value=make_result()) as mock_sync:
+        main.run_once(cfg)
+        main.run_once(cfg)
+        main.run_once(cfg)
+
+    assert mock_sync.call_count == len(PIHOLES)
+    assert mock_load.call_count == 2
+
+
+def test_run_once_repairs_only_drifted_targets(tmp_path, make_result):
+    """Test that a repair re-syncs the drifted target even though its content is unchanged"""
+    cfg = _run_once_cfg(tmp_path)
+    desired = ({HostRecord('10.0.0.1', 'test.local')}, set())
+
+    with patch('internal_dns_sync.git.clone_or_update', return_value='/tmp/repo'), \
+         patch('internal_dns_sync.git.file_revision', return_value='rev1'), \
+         patch('internal_dns_sync.dns_config.load_dns_config', return_value=desired), \
+         patch.object(sync, 'sync_pihole', return_value=make_result()) as mock_sync:
+        main.run_once(cfg)
+        mock_sync.reset_mock()
+        results = main.run_once(cfg, repair=['http://pihole2'])
+
+    assert list(results) == ['http://pihole2']
+    assert [c.args[0]['url'] for c in mock_sync.call_args_list] == ['http://pihole2']
+
+
+def test_run_watch_repairs_drifted_target(tmp_path, make_result):
+    """Test that only a PiHole whose records no longer match its synced state is repaired"""
+    cfg = _run_once_cfg(tmp_path)
+    desired = ({HostRecord('10.0.0.1', 'test.local')}, set())
+    clients = {}
+    for pihole in PIHOLES:
+        clients[pihole['url']] = Mock(base_url=pihole['url'], **{'export_session.return_value': None})
+        clients[pihole['url']].get_dns_config.return_value = json.dumps(
+            {'config': {'dns': {'hosts': ['10.0.0.1 test.local'], 'cnameRecords': []}}}).encode()
+    clients['http://pihole3'].get_dns_config.return_value = json.dumps(
+        {'config': {'dns': {'hosts': ['10.0.0.1 test.local', '10.0.0.9 manual.local'], 'cnameRecords': []}}}).encode()
+
+    with patch('internal_dns_sync.git.clone_or_update', return_value='/tmp/repo'), \
+         patch('internal_dns_sync.git.file_revision', return_value='rev1'), \
+         patch('internal_dns_sync.dns_config.load_dns_config', return_value=desired), \
+         patch.object(sync, 'sync_pihole', return_value=make_result()) as mock_sync:
+        main.run_once(cfg, clients)
+        mock_sync.reset_mock()
+        results = main.run_watch(cfg, clients, {})
+
+    assert list(results) == ['http://pihole3']
+    assert [c.args[0]['url'] for c in mock_sync.call_args_list] == ['http://pihole3']
+
+
+def test_run_watch_without_drift_does_not_sync(tmp_path):
+    """Test that a poll finding every PiHole in sync neither takes the lock nor syncs"""
+    cfg = _run_once_cfg(tmp_path)
+    clients = {p['url']: Mock(base_url=p['url']) for p in PIHOLES}
+
+    with patch('internal_dns_sync.watch.find_drift', return_value=[]), \
+         patch.object(main, 'run_locked') as mock_run:
+        assert main.run_watch(cfg, clients, {}) is None
+
+    mock_run.assert_not_called()
+
+
+def test_run_watch_poll_is_one_trace(tmp_path):
+    """Test that the requests of a poll belong to a single trace instead of one trace each"""
+    cfg = _run_once_cfg(tmp_path)
+    trace_file = tmp_path / 'traces.jsonl'
+    body = json.dumps({'config': {'dns': {'hosts': [], 'cnameRecords': []}}}).encode()
+    state.save_state(str(tmp_path / 'state.json'),
+                     {'piholes': {p['url']: {'hash': state.content_hash(set(), set())} for p in PIHOLES}})
+
+    def get_dns_config():
+        with tracing.span('http'):
+            return body
+
+    clients = {p['url']: Mock(base_url=p['url'], get_dns_config=get_dns_config) for p in PIHOLES}
+    with patch.object(tracing, '_trace_file', str(trace_file)):
+        assert main.run_watch(cfg, clients, {}) is None
+
+    [line] = trace_file.read_text().splitlines()
+    spans = json.loads(line)['resourceSpans'][0]['scopeSpans'][0]['spans']
+    assert sorted(s['name'] for s in spans) == ['http'] * len(PIHOLES) + ['watch']
+
+
+def test_run_daemon_watches_between_syncs(tmp_path):
+    """Test that the daemon polls for drift while waiting for the next sync"""
+    cfg = {'interval': 1, 'jitter': 0, 'cache_dir': str(tmp_path), 'metrics_port': 0, 'webhook_port': 0,
+           'webhook_debounce': 0, 'watch_interval': 0.1,
+           'config_poll_interval': 0}
+    stop = threading.Event()
+    polls = []
+
+    def fake_watch(cfg, clients, seen):
+        polls.append(seen)
+        if len(polls) == 3:
+            stop.set()
+
+    with patch.object(main, 'run_locked', return_value={}) as mock_run, \
+         patch.object(main, 'run_watch', side_effect=fake_watch), \
+         patch.object(main, 'shutdown'):
+        main.run_daemon(cfg, stop)
+
+    assert mock_run.call_count == 1
+    assert len(polls) == 3
+    assert polls[0] is polls[1] is polls[2]
+
+
+def test_run_once_syncs_after_filter_change(tmp_path, make_result):
+    """Test that changed filter rules re-sync the target even though the DNS sources are unchanged"""
+    cfg = _run_once_cfg(tmp_path)
+    cfg['piholes'] = [dict(PIHOLES[0])]
+    desired = ({HostRecord('10.0.0.1', 'a.lan'), HostRecord('10.0.0.2', 'b.other')}, set())
+
+    with patch('internal_dns_sync.git.clone_or_update', return_value='/tmp/repo'), \
+         patch('internal_dns_sync.git.file_revision', return_value='rev1'), \
+         patch('internal_dns_sync.dns_config.load_dns_config', return_value=desired), \
+         patch.object(sync, 'sync_pihole', return_value=make_result()) as mock_sync:
+        main.run_once(cfg)
+        assert main.run_once(cfg) == {}
+        cfg['piholes'][0]['include'] = ['lan']
+        main.run_once(cfg)
+
+    assert mock_sync.call_count == 2
+    assert mock_sync.call_args.args[1] == {HostRecord('10.0.0.1', 'a.lan')}
+
+
+def test_run_once_syncs_changed_content(tmp_path, make_result):
+    """Test that changed records are synced to every PiHole"""
+    cfg = _run_once_cfg(tmp_path)
+    first = ({HostRecord('10.0.0.1', 'test.local')}, set())
+    second = ({HostRecord('10.0.0.2', 'test.local')}, set())
+
+    with patch('internal_dns_sync.git.clone_or_update', return_value='/tmp/repo'), \
+         patch('internal_dns_sync.git.file_revision', side_effect=['rev1', 'rev2']), \
+         patch('internal_dns_sync.dns_config.load_dns_config', side_effect=[first, second]), \
+         patch.object(sync, 'sync_pihole', return_value=make_result()) as mock_sync:
+        main.run_once(cfg)
+        main.run_once(cfg)
+
+    assert mock_sync.call_count == 2 * len(PIHOLES)
+
+
+def test_run_once_forces_full_reconciliation(tmp_path, make_result):
+    """Test that targets are re-synced once full_sync_interval has passed"""
+    cfg = _run_once_cfg(tmp_path)
+
+    with patch('internal_dns_sync.git.clone_or_update', return_value='/tmp/repo'), \
+         patch('internal_dns_sync.git.file_revision', return_value='rev1'), \
+         patch('internal_dns_sync.dns_config.load_dns_config', return_value=(set(), set())), \
+         patch.object(sync, 'sync_pihole', return_value=make_result()) as mock_sync, \
+         patch('time.time', side_effect=[1000.0, 2000.0, 5000.0]):
+        main.run_once(cfg)
+        main.run_once(cfg)
+        main.run_once(cfg)
+
+    assert mock_sync.call_count == 2 * len(PIHOLES)
+
+
+def test_run_once_persists_and_restores_sessions(tmp_path, make_result):
+    """Test that a session from one run is reused by the next without re-authenticating"""
+    cfg = _run_once_cfg(tmp_path)
+    cfg['piholes'] = PIHOLES[:1]
+    seen = []
+    loaded = [(set(), set()), ({HostRecord('10.0.0.1', 'x')}, set())]
+
+    def fake_sync(pihole_config, hosts, cnames, api):
+        seen.append((api.sid, api.csrf))
+        if api.sid is None:
+            api._set_session('sid-1', 'csrf-1', 1800)
+        return make_result()
+
+    with patch('internal_dns_sync.git.clone_or_update', return_value='/tmp/repo'), \
+         patch('internal_dns_sync.git.file_revision', side_effect=['rev1', 'rev2']), \
+         patch('internal_dns_sync.dns_config.load_dns_config', side_effect=loaded), \
+         patch.object(sync, 'sync_pihole', side_effect=fake_sync):
+        main.run_once(cfg)
+        main.run_once(cfg)
+
+    assert seen == [(None, None), ('sid-1', 'csrf-1')]
+
+
+def test_shutdown_logs_out_and_forgets_sessions(tmp_path):
+    """Test that shutdown logs out every client and drops persisted sessions"""
+    cfg = {'cache_dir': str(tmp_path)}
+    state_file = str(tmp_path / 'state.json')
+    main.state.save_state(state_file, {'piholes': {}, 'sessions': {'http://pihole1': {'sid': 'x'}}})
+    api = Mock()
+
+    main.shutdown(cfg, {'http://pihole1': api})
+
+    api.logout.assert_called_once()
+    assert main.state.load_state(state_file) == {'piholes': {}}
+
+
+def test_run_plan_prints_diff_and_json(tmp_path, capsys, make_result):
+    """Test that a plan prints the diff, writes JSON and applies nothing"""
+    cfg = _run_once_cfg(tmp_path)
+    json_file = tmp_path / 'plan.json'
+
+    with patch('internal_dns_sync.git.clone_or_update', return_value='/tmp/repo'), \
+         patch('internal_dns_sync.git.file_revision', return_value='rev1'), \
+         patch('internal_dns_sync.dns_config.load_dns_config', return_value=(set(), set())), \
+         patch.object(sync, 'plan_pihole', return_value=make_result(added=1)), \
+         patch.object(sync, 'sync_pihole') as mock_sync:
+        main.run_plan(cfg, str(json_file))
+
+    mock_sync.assert_not_called()
+    out = capsys.readouterr().out
+    assert 'http://pihole1: 1 to add, 0 to remove, 1 unchanged' in out
+    assert '  + host 10.0.0.0 h0.local' in out
+    plan = json.loads(json_file.read_text())
+    assert plan['revision'] == 'rev1'
+    assert set(plan['targets']) == {p['url'] for p in PIHOLES}
+
+
+def test_run_plan_json_to_stdout(tmp_path, capsys, make_result):
+    """Test that '-' writes only the JSON plan to stdout and the readable plan to stderr"""
+    cfg = _run_once_cfg(tmp_path)
+    cfg['piholes'] = PIHOLES[:1]
+
+    with patch('internal_dns_sync.git.clone_or_update', return_value='/tmp/repo'), \
+         patch('internal_dns_sync.git.file_revision', return_value='rev1'), \
+         patch('internal_dns_sync.dns_config.load_dns_config', return_value=(set(), set())), \
+         patch.object(sync, 'plan_pihole', return_value=make_result()):
+        main.run_plan(cfg, '-')
+
+    captured = capsys.readouterr()
+    plan = json.loads(captured.out)
+    assert plan['targets']['http://pihole1']['changes'] == 0
+    assert 'http://pihole1: 0 to add' in captured.err
+
+
+def test_run_plan_keeps_state_of_concurrent_run(tmp_path, make_result):
+    """Test that a plan only writes back sessions and keeps what a run saved meanwhile"""
+    cfg = _run_once_cfg(tmp_path)
+    cfg['piholes'] = PIHOLES[:1]
+    state_file = tmp_path / 'state.json'
+
+    def finish_run(*args, **kwargs):
+        state.save_state(str(state_file), {'piholes': {'http://pihole1': {'revision': 'rev1'}}})
+        return make_result()
+
+    with patch('internal_dns_sync.git.clone_or_update', return_value='/tmp/repo'), \
+         patch('internal_dns_sync.git.file_revision', return_value='rev1'), \
+         patch('internal_dns_sync.dns_config.load_dns_config', return_value=(set(), set())), \
+         patch.object(sync, 'plan_pihole', side_effect=finish_run):
+        main.run_plan(cfg, None)
+
+    saved = state.load_state(str(state_file))
+    assert saved['piholes'] == {'http://pihole1': {'revision': 'rev1'}}
+    assert 'sessions' in saved
+
+
+def test_run_plan_leaves_state_alone_while_locked(tmp_path, make_result):
+    """Test that a plan does not write the state while a run holds the lock"""
+    cfg = _run_once_cfg(tmp_path)
+    cfg['piholes'] = PIHOLES[:1]
+
+    with patch('internal_dns_sync.git.clone_or_update', return_value='/tmp/repo'), \
+         patch('internal_dns_sync.git.file_revision', return_value='rev1'), \
+         patch('internal_dns_sync.dns_config.load_dns_config', return_value=(set(), set())), \
+         patch.object(sync, 'plan_pihole', return_value=make_result()), \
+         patch.object(lock.RunLock, 'try_acquire', return_value=False):
+        main.run_plan(cfg, None)
+
+    assert not (tmp_path / 'state.json').exists()
+
+
+def test_main_plan_flag_exits_nonzero_on_failure(tmp_path):
+    """Test that --plan fails when a PiHole could not be read"""
+    with patch('internal_dns_sync.config.get_config', return_value=_run_once_cfg(tmp_path)), \
+         patch.object(main, 'run_plan', return_value={'http://pihole1': requests.ConnectionError()}) as mock_plan:
+        with pytest.raises(SystemExit):
+            main.main(['--plan', '--plan-json', 'plan.json'])
+
+    assert mock_plan.call_args[0][1] == 'plan.json'
+
+
+def test_main_plan_json_requires_plan():
+    """Test that --plan-json is rejected without --plan instead of running a real sync"""
+    with pytest.raises(SystemExit):
+        main.parse_args(['--plan-json', 'plan.json'])
+    with pytest.raises(SystemExit):
+        main.parse_args(['--daemon', '--plan-json', 'plan.json'])
+
+
+def test_main_plan_and_daemon_are_exclusive():
+    """Test that --plan cannot be combined with --daemon"""
+    with pytest.raises(SystemExit):
+        main.parse_args(['--plan', '--daemon'])
+
+
+def test_reload_config_keeps_unchanged_clients(tmp_path):
+    """Test that a reload logs out removed and reconfigured PiHoles but keeps the others warm"""
+    cfg = _run_once_cfg(tmp_path)
+    cfg['piholes'] = [dict(p) for p in PIHOLES]
+    new_cfg = dict(cfg, piholes=[
+        dict(PIHOLES[0]),
+        dict(PIHOLES[1], password='rotated'),
+        {'url': 'http://pihole4', 'password': 'pass4'},
+    ])
+    clients = {p['url']: Mock() for p in PIHOLES}
+    kept = clients['http://pihole1']
+    logged_out = [clients['http://pihole2'], clients['http://pihole3']]
+
+    with patch('internal_dns_sync.config.get_config', return_value=new_cfg), \
+         patch('internal_dns_sync.tracing.configure'):
+        assert main.reload_config(cfg, clients) is new_cfg
+
+    assert clients == {'http://pihole1': kept}
+    kept.logout.assert_not_called()
+    for api in logged_out:
+        api.logout.assert_called_once()
+
+
+def test_reload_config_keeps_running_config_when_invalid(tmp_path, caplog):
+    """Test that a config that no longer loads leaves the running config and clients alone"""
+    cfg = _run_once_cfg(tmp_path)
+    clients = {p['url']: Mock() for p in PIHOLES}
+
+    with patch('internal_dns_sync.config.get_config', side_effect=ValueError("lock_mode must be 'exit' or 'wait'")):
+        assert main.reload_config(cfg, clients) is cfg
+
+    assert len(clients) == len(PIHOLES)
+    assert 'Keeping the running config' in caplog.text
+
+
+def test_run_daemon_reloads_changed_config(tmp_path):
+    """Test that a config change wakes the daemon, which syncs with the reloaded config"""
+    config_file = tmp_path / 'config.yml'
+    config_file.write_text('interval: 3600\n')
+    cfg = {'interval': 3600, 'jitter': 0, 'cache_dir': str(tmp_path), 'metrics_port': 0, 'webhook_port': 0,
+           'webhook_debounce': 0, 'watch_interval': 0, 'config_poll_interval': 0.05, 'piholes': []}
+    new_cfg = dict(cfg, piholes=[{'url': 'http://pihole4', 'password': 'pass4'}])
+    stop = threading.Event()
+    wake = threading.Event()
+    seen = []
+
+    def fake_run(cfg, clients):
+        seen.append(cfg)
+        if len(seen) == 1:
+            config_file.write_text('interval: 3600\npiholes: [{url: http://pihole4, password: pass4}]\n')
+        else:
+            stop.set()
+            wake.set()
+
+    with patch('internal_dns_sync.config.config_path', return_value=str(config_file)), \
+         patch.object(main, 'reload_config', return_value=new_cfg) as mock_reload, \
+         patch.object(main, 'run_locked', side_effect=fake_run), \
+         patch.object(main, 'shutdown'):
+        main.run_daemon(cfg, stop, wake)
+
+    mock_reload.assert_called_once()
+    assert seen == [cfg, new_cfg]
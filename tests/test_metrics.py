@@ -0,0 +1,115 @@
+import urllib.request
+import pytest
+from unittest.mock import Mock, patch
+import requests
+from internal_dns_sync import metrics
+
+
+@pytest.fixture
+def registry():
+    return metrics.Registry()
+
+
+def test_render_counter_and_gauge(registry):
+    """Test the text exposition format of labelled counters and gauges"""
+    counter = metrics.Counter('test_total', 'A counter', ['target'], registry=registry)
+    gauge = metrics.Gauge('test_timestamp', 'A gauge', registry=registry)
+    counter.labels('http://pihole1').inc()
+    counter.labels('http://pihole1').inc(2)
+    gauge.labels().set(1.5)
+
+    assert registry.render() == (
+        '# HELP test_total A counter\n'
+        '# TYPE test_total counter\n'
+        'test_total{target="http://pihole1"} 3\n'
+        '# HELP test_timestamp A gauge\n'
+        '# TYPE test_timestamp gauge\n'
+        'test_timestamp 1.5\n'
+    )
+
+
+def test_render_histogram(registry):
+    """Test that histogram buckets are cumulative and end with +Inf"""
+    histogram = metrics.Histogram('test_seconds', 'A histogram', ['phase'], registry=registry, buckets=(0.1, 1))
+    histogram.labels('git').observe(0.05)
+    histogram.labels('git').observe(0.5)
+    histogram.labels('git').observe(5)
+
+    assert registry.render().splitlines()[2:] == [
+        'test_seconds_bucket{phase="git",le="0.1"} 1',
+        'test_seconds_bucket{phase="git",le="1"} 2',
+        'test_seconds_bucket{phase="git",le="+Inf"} 3',
+        'test_seconds_sum{phase="git"} 5.55',
+        'test_seconds_count{phase="git"} 3',
+    ]
+
+
+def test_label_values_are_escaped(registry):
+    """Test that quotes, backslashes and newlines in label values are escaped"""
+    counter = metrics.Counter('test_total', 'A counter', ['target'], registry=registry)
+    counter.labels('a"b\\c\nd').inc()
+
+    assert 'test_total{target="a\\"b\\\\c\\nd"} 1' in registry.render()
+
+
+def test_labels_must_match(registry):
+    """Test that a wrong number of label values is rejected"""
+    counter = metrics.Counter('test_total', 'A counter', ['target', 'type'], registry=registry)
+
+    with pytest.raises(ValueError):
+        counter.labels('http://pihole1')
+
+
+def test_time_observes_duration(registry):
+    """Test that the timer records one observation, also when the block raises"""
+    histogram = metrics.Histogram('test_seconds', 'A histogram', registry=registry)
+
+    with pytest.raises(RuntimeError):
+        with histogram.labels().time():
+            raise RuntimeError('boom')
+
+    assert 'test_seconds_count 1' in registry.render()
+
+
+def test_serve_metrics(registry):
+    """Test that the HTTP endpoint serves the registry"""
+    metrics.Counter('test_total', 'A counter', registry=registry).labels().inc()
+    server = metrics.serve(0, '127.0.0.1', registry=registry)
+    try:
+        url = f'http://127.0.0.1:{server.server_address[1]}/metrics'
+        with urllib.request.urlopen(url, timeout=5) as response:
+            assert response.headers['Content-Type'] == metrics.CONTENT_TYPE
+            assert b'test_total 1' in response.read()
+    finally:
+        server.shutdown()
+
+
+def test_write_textfile(registry, tmp_path):
+    """Test that metrics are written to a textfile for the node exporter"""
+    metrics.Counter('test_total', 'A counter', registry=registry).labels().inc()
+    file = tmp_path / 'internal_dns_sync.prom'
+
+    metrics.write_textfile(str(file), registry)
+
+    assert file.read_text() == registry.render()
+
+
+def test_export_push_failure_is_not_fatal(registry, caplog):
+    """Test that an unreachable push gateway only logs a warning"""
+    cfg = {'metrics_textfile': None, 'pushgateway_url': 'http://pushgateway:9091'}
+
+    with patch('requests.put', side_effect=requests.ConnectionError('refused')) as mock_put:
+        metrics.export(cfg, registry)
+
+    assert mock_put.call_args[0][0] == 'http://pushgateway:9091/metrics/job/internal_dns_sync'
+    assert 'Failed to push metrics' in caplog.text
+
+
+def test_export_push(registry):
+    """Test that metrics are pushed to the gateway"""
+    cfg = {'metrics_textfile': None, 'pushgateway_url': 'http://pushgateway:9091/'}
+
+    with patch('requests.put', return_value=Mock()) as mock_put:
+        metrics.export(cfg, registry)
+
+    assert mock_put.call_args[1]['data'] == registry.render().encode('utf-8')
@@ -1,6 +1,9 @@
+import time
 import pytest
 from unittest.mock import Mock, patch
-from internal_dns_sync.pihole import PiHoleAPI
+from internal_dns_sync.pihole import PiHoleAPI, parse_dns_config
+from internal_dns_sync import records
+from internal_dns_sync.records import HostRecord, CnameRecord, RawRecord
 import requests
 
 
@@ -70,9 +73,12 @@ def test_get_hosts_network_error(pihole_api):
     """Test get hosts with network error"""
     pihole_api.sid = 'test-sid'
     
-    with patch.object(pihole_api.session, 'get', side_effect=requests.ConnectionError):
+    with patch.object(pihole_api.session, 'get', side_effect=requests.ConnectionError) as mock_get, \
+         patch('time.sleep'):
         with pytest.raises(requests.ConnectionError):
             pihole_api.get_hosts()
+    
+    assert mock_get.call_count == pihole_api.retries + 1
 
 
 def test_get_cnames_success(pihole_api):
@@ -94,7 +100,7 @@ def test_update_hosts_success(pihole_api):
     mock_response = Mock()
     
     with patch.object(pihole_api.session, 'patch', return_value=mock_response):
-        pihole_api.update_hosts(['10.0.0.1 test.local', '10.0.0.2 test2.local'])
+        pihole_api.update_hosts([HostRecord('10.0.0.1', 'test.local'), HostRecord('10.0.0.2', 'test2.local')])
         pihole_api.session.patch.assert_called_once()
 
 
@@ -106,7 +112,7 @@ def test_update_hosts_error(pihole_api):
     
     with patch.object(pihole_api.session, 'patch', return_value=mock_response):
         with pytest.raises(requests.HTTPError):
-            pihole_api.update_hosts(['10.0.0.1 test.local'])
+            pihole_api.update_hosts([HostRecord('10.0.0.1', 'test.local')])
 
 
 def test_update_cnames_success(pihole_api):
@@ -115,7 +121,7 @@ def test_update_cnames_success(pihole_api):
     mock_response = Mock()
     
     with patch.object(pihole_api.session, 'patch', return_value=mock_response):
-        pihole_api.update_cnames(['alias.local,target.local'])
+        pihole_api.update_cnames([CnameRecord('alias.local', 'target.local')])
         pihole_api.session.patch.assert_called_once()
 
 
@@ -147,7 +153,7 @@ def test_update_cnames_error(pihole_api):
     
     with patch.object(pihole_api.session, 'patch', return_value=mock_response):
         with pytest.raises(requests.HTTPError):
-            pihole_api.update_cnames(['alias.local,target.local'])
+            pihole_api.update_cnames([CnameRecord('alias.local', 'target.local')])
 
 
 def test_base_url_trailing_slash(pihole_api):
@@ -165,3 +171,314 @@ def test_session_timeout(pihole_api):
     with patch.object(pihole_api.session, 'get', return_value=mock_response):
         with pytest.raises(requests.HTTPError):
             pihole_api.get_hosts()
+
+
+def test_authenticate_tracks_validity(pihole_api):
+    """Test that the session validity from the auth response is tracked"""
+    mock_response = Mock()
+    mock_response.json.return_value = {
+        'session': {'sid': 'test-sid', 'csrf': 'test-csrf', 'validity': 1800}
+    }
+
+    with patch.object(pihole_api.session, 'post', return_value=mock_response):
+        pihole_api.authenticate()
+
+    assert pihole_api.session_valid()
+    assert pihole_api.expires == pytest.approx(time.time() + 1800, abs=5)
+
+
+def test_request_authenticates_lazily(pihole_api):
+    """Test that the first request authenticates and later ones reuse the session"""
+    auth_response = Mock()
+    auth_response.json.return_value = {'session': {'sid': 'test-sid', 'csrf': 'test-csrf', 'validity': 1800}}
+    get_response = Mock(status_code=200)
+    get_response.json.return_value = {'config': {'dns': {'hosts': []}}}
+
+    with patch.object(pihole_api.session, 'post', return_value=auth_response) as mock_post, \
+         patch.object(pihole_api.session, 'get', return_value=get_response):
+        pihole_api.get_hosts()
+        pihole_api.get_cnames()
+
+    mock_post.assert_called_once()
+
+
+def test_request_reauthenticates_on_401(pihole_api):
+    """Test that a 401 triggers exactly one re-authentication and a retry"""
+    pihole_api.restore_session({'sid': 'old-sid', 'csrf': 'old-csrf', 'validity': 1800,
+                                'expires': time.time() + 1000})
+    auth_response = Mock()
+    auth_response.json.return_value = {'session': {'sid': 'new-sid', 'csrf': 'new-csrf', 'validity': 1800}}
+    expired = Mock(status_code=401)
+    ok = Mock(status_code=200)
+    ok.json.return_value = {'config': {'dns': {'hosts': ['10.0.0.1 test.local']}}}
+
+    with patch.object(pihole_api.session, 'post', return_value=auth_response) as mock_post, \
+         patch.object(pihole_api.session, 'get', side_effect=[expired, ok]):
+        hosts = pihole_api.get_hosts()
+
+    assert hosts == ['10.0.0.1 test.local']
+    mock_post.assert_called_once()
+    assert pihole_api.sid == 'new-sid'
+    assert pihole_api.session.headers['X-FTL-SID'] == 'new-sid'
+
+
+def test_restore_session_ignores_expired(pihole_api):
+    """Test that an expired persisted session is not reused"""
+    pihole_api.restore_session({'sid': 'old-sid', 'csrf': 'old-csrf', 'validity': 1800,
+                                'expires': time.time() - 1})
+
+    assert pihole_api.sid is None
+    assert pihole_api.export_session() is None
+
+
+def test_export_restore_round_trip(pihole_api):
+    """Test that an exported session can be restored in a new client"""
+    pihole_api._set_session('test-sid', 'test-csrf', 1800)
+    other = PiHoleAPI('http://pihole.local', 'testpass')
+
+    other.restore_session(pihole_api.export_session())
+
+    assert other.sid == 'test-sid'
+    assert other.session.headers['X-FTL-CSRF'] == 'test-csrf'
+
+
+def test_export_restore_round_trip_without_validity(pihole_api):
+    """Test that a session without a known validity survives a round trip and is reused until a 401"""
+    pihole_api._set_session('test-sid', 'test-csrf', None)
+    other = PiHoleAPI('http://pihole.local', 'testpass')
+
+    other.restore_session(pihole_api.export_session())
+
+    assert other.sid == 'test-sid'
+    assert other.expires is None
+    assert other.session_valid()
+
+
+def test_logout(pihole_api):
+    """Test that logout deletes the session on the PiHole and forgets it"""
+    pihole_api._set_session('test-sid', 'test-csrf', 1800)
+
+    with patch.object(pihole_api.session, 'delete') as mock_delete:
+        pihole_api.logout()
+
+    mock_delete.assert_called_once_with('http://pihole.local/api/auth', timeout=pihole_api.timeout)
+    assert pihole_api.sid is None
+    assert 'X-FTL-SID' not in pihole_api.session.headers
+
+
+def test_logout_without_session(pihole_api):
+    """Test that logout is a no-op without a session"""
+    with patch.object(pihole_api.session, 'delete') as mock_delete:
+        pihole_api.logout()
+
+    mock_delete.assert_not_called()
+
+
+def test_logout_network_error(pihole_api):
+    """Test that a failing logout does not raise"""
+    pihole_api._set_session('test-sid', 'test-csrf', 1800)
+
+    with patch.object(pihole_api.session, 'delete', side_effect=requests.ConnectionError):
+        pihole_api.logout()
+
+    assert pihole_api.sid is None
+
+
+def test_update_dns_combined(pihole_api):
+    """Test that hosts and CNAMEs are sent in a single PATCH"""
+    pihole_api.sid = 'test-sid'
+    mock_response = Mock()
+
+    with patch.object(pihole_api.session, 'patch', return_value=mock_response) as mock_patch:
+        pihole_api.update_dns(
+            hosts={HostRecord('10.0.0.1', 'test.local')},
+            cnames={CnameRecord('alias.local', 'test.local')}
+        )
+
+    mock_patch.assert_called_once()
+    assert mock_patch.call_args[1]['json'] == {
+        'config': {'dns': {'hosts': ['10.0.0.1 test.local'], 'cnameRecords': ['alias.local,test.local']}}
+    }
+
+
+def test_update_dns_single_key(pihole_api):
+    """Test that only the given list is sent"""
+    pihole_api.sid = 'test-sid'
+    mock_response = Mock()
+
+    with patch.object(pihole_api.session, 'patch', return_value=mock_response) as mock_patch:
+        pihole_api.update_dns(cnames=[])
+
+    assert mock_patch.call_args[1]['json'] == {'config': {'dns': {'cnameRecords': []}}}
+
+
+def test_update_dns_nothing(pihole_api):
+    """Test that no request is made when nothing is passed"""
+    pihole_api.sid = 'test-sid'
+
+    with patch.object(pihole_api.session, 'patch') as mock_patch:
+        pihole_api.update_dns()
+
+    mock_patch.assert_not_called()
+
+
+def test_get_dns_state_single_request(pihole_api):
+    """Test that hosts and CNAMEs are fetched with one GET"""
+    pihole_api.sid = 'test-sid'
+    mock_response = Mock(status_code=200)
+    mock_response.json.return_value = {
+        'config': {'dns': {
+            'hosts': ['10.0.0.1 test.local'],
+            'cnameRecords': ['alias.local,test.local'],
+            'upstreams': ['1.1.1.1'],
+        }}
+    }
+
+    with patch.object(pihole_api.session, 'get', return_value=mock_response) as mock_get:
+        state = pihole_api.get_dns_state()
+
+    mock_get.assert_called_once_with('http://pihole.local/api/config/dns', timeout=pihole_api.timeout)
+    assert state.hosts == {HostRecord('10.0.0.1', 'test.local')}
+    assert state.cnames == {CnameRecord('alias.local', 'test.local')}
+
+
+def test_get_dns_config_returns_raw_body(pihole_api):
+    """Test that the raw DNS config parses to the same state as get_dns_state"""
+    pihole_api.sid = 'test-sid'
+    body = b'{"config": {"dns": {"hosts": ["10.0.0.1 test.local"], "cnameRecords": ["alias.local,test.local"]}}}'
+    mock_response = Mock(status_code=200, content=body)
+
+    with patch.object(pihole_api.session, 'get', return_value=mock_response):
+        assert pihole_api.get_dns_config() == body
+
+    state = parse_dns_config(body)
+    assert state.hosts == {HostRecord('10.0.0.1', 'test.local')}
+    assert state.cnames == {CnameRecord('alias.local', 'test.local')}
+
+
+def test_get_dns_state_empty(pihole_api):
+    """Test a DNS config without local records"""
+    pihole_api.sid = 'test-sid'
+    mock_response = Mock(status_code=200)
+    mock_response.json.return_value = {'config': {'dns': {}}}
+
+    with patch.object(pihole_api.session, 'get', return_value=mock_response):
+        hosts, cnames = pihole_api.get_dns_state()
+
+    assert hosts == set()
+    assert cnames == set()
+
+
+def test_add_dns_item(pihole_api):
+    """Test that a single entry is added with a PUT to its encoded path"""
+    pihole_api.sid = 'test-sid'
+
+    with patch.object(pihole_api.session, 'put', return_value=Mock(status_code=201)) as mock_put:
+        pihole_api.add_dns_item('hosts', HostRecord('10.0.0.1', 'test.local'))
+
+    mock_put.assert_called_once_with('http://pihole.local/api/config/dns/hosts/10.0.0.1%20test.local',
+                                     timeout=pihole_api.timeout)
+
+
+def test_delete_dns_item(pihole_api):
+    """Test that a single entry is removed with a DELETE to its encoded path"""
+    pihole_api.sid = 'test-sid'
+
+    with patch.object(pihole_api.session, 'delete', return_value=Mock(status_code=204)) as mock_delete:
+        pihole_api.delete_dns_item('cnameRecords', 'alias.local,test.local')
+
+    mock_delete.assert_called_once_with('http://pihole.local/api/config/dns/cnameRecords/alias.local%2Ctest.local',
+                                        timeout=pihole_api.timeout)
+
+
+def test_delete_dns_item_error(pihole_api):
+    """Test that a failing per-item request raises"""
+    pihole_api.sid = 'test-sid'
+    mock_response = Mock(status_code=404)
+    mock_response.raise_for_status.side_effect = requests.HTTPError("404 Not Found")
+
+    with patch.object(pihole_api.session, 'delete', return_value=mock_response):
+        with pytest.raises(requests.HTTPError):
+            pihole_api.delete_dns_item('hosts', '10.0.0.1 test.local')
+
+
+def test_get_dns_state_normalizes_entries(pihole_api):
+    """Test that PiHole entries are parsed into normalized records"""
+    pihole_api.sid = 'test-sid'
+    mock_response = Mock(status_code=200)
+    mock_response.json.return_value = {'config': {'dns': {
+        'hosts': ['10.0.0.1  Test.local other.local', 'garbage'],
+        'cnameRecords': ['alias.local,test.local,300'],
+    }}}
+
+    with patch.object(pihole_api.session, 'get', return_value=mock_response):
+        state = pihole_api.get_dns_state()
+
+    assert state.hosts == {HostRecord('10.0.0.1', 'test.local'), HostRecord('10.0.0.1', 'other.local'),
+                           RawRecord('garbage')}
+    assert state.cnames == {CnameRecord('alias.local', 'test.local')}
+
+
+def test_delete_dns_item_uses_source_line(pihole_api):
+    """Test that a parsed entry is deleted by its original line"""
+    pihole_api.sid = 'test-sid'
+    [record] = records.parse_hosts_line('10.0.0.1  Test.local')
+
+    with patch.object(pihole_api.session, 'delete', return_value=Mock(status_code=204)) as mock_delete:
+        pihole_api.delete_dns_item('hosts', *record.sources)
+
+    mock_delete.assert_called_once_with('http://pihole.local/api/config/dns/hosts/10.0.0.1%20%20Test.local',
+                                        timeout=pihole_api.timeout)
+
+
+def test_update_dns_sorted_wire_format(pihole_api):
+    """Test that full lists are sent sorted in the PiHole wire format"""
+    pihole_api.sid = 'test-sid'
+
+    with patch.object(pihole_api.session, 'patch', return_value=Mock(status_code=200)) as mock_patch:
+        pihole_api.update_hosts({HostRecord('10.0.0.2', 'b.local'), HostRecord('10.0.0.1', 'a.local')})
+
+    assert mock_patch.call_args[1]['json'] == {'config': {'dns': {'hosts': ['10.0.0.1 a.local', '10.0.0.2 b.local']}}}
+
+
+def test_get_retries_transient_errors(pihole_api):
+    """Test that reads are retried with backoff on timeouts and 5xx responses"""
+    pihole_api.sid = 'test-sid'
+    ok = Mock(status_code=200)
+    ok.json.return_value = {'config': {'dns': {'hosts': []}}}
+
+    with patch.object(pihole_api.session, 'get', side_effect=[requests.Timeout, Mock(status_code=503), ok]), \
+         patch('time.sleep') as mock_sleep:
+        assert pihole_api.get_hosts() == []
+
+    assert mock_sleep.call_count == 2
+    assert all(0 <= c[0][0] <= pihole_api.backoff * 2 ** i for i, c in enumerate(mock_sleep.call_args_list))
+
+
+def test_patch_retries_only_on_server_errors(pihole_api):
+    """Test that a PATCH is retried on 429 but not after a timeout, which may have been applied"""
+    pihole_api.sid = 'test-sid'
+
+    with patch.object(pihole_api.session, 'patch', side_effect=[Mock(status_code=429), Mock(status_code=200)]) \
+            as mock_patch, patch('time.sleep'):
+        pihole_api.update_hosts(set())
+    assert mock_patch.call_count == 2
+
+    with patch.object(pihole_api.session, 'patch', side_effect=requests.Timeout) as mock_patch, \
+         patch('time.sleep'):
+        with pytest.raises(requests.Timeout):
+            pihole_api.update_hosts(set())
+    assert mock_patch.call_count == 1
+
+
+def test_put_is_not_retried(pihole_api):
+    """Test that per-entry writes are not retried"""
+    pihole_api.sid = 'test-sid'
+    mock_response = Mock(status_code=503)
+    mock_response.raise_for_status.side_effect = requests.HTTPError("503 Service Unavailable")
+
+    with patch.object(pihole_api.session, 'put', return_value=mock_response) as mock_put:
+        with pytest.raises(requests.HTTPError):
+            pihole_api.add_dns_item('hosts', HostRecord('10.0.0.1', 'test.local'))
+
+    mock_put.assert_called_once()
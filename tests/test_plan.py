@@ -0,0 +1,48 @@
+import json
+import requests
+from internal_dns_sync import plan
+from internal_dns_sync.diff import Delta, SyncResult
+from internal_dns_sync.records import HostRecord
+
+
+RESULTS = {
+    'http://pihole1': SyncResult(
+        Delta([HostRecord('10.0.0.3', 'c.local')], [HostRecord('10.0.0.2', 'b.local')], 4),
+        Delta([], [], 2)
+    ),
+    'http://pihole2': requests.ConnectionError('unreachable'),
+}
+
+
+def test_format_text():
+    """Test the human readable plan"""
+    text = plan.format_text(RESULTS)
+
+    assert text.splitlines() == [
+        'http://pihole1: 1 to add, 1 to remove, 6 unchanged',
+        '  - host 10.0.0.2 b.local',
+        '  + host 10.0.0.3 c.local',
+        'http://pihole2: failed to fetch state: unreachable',
+    ]
+
+
+def test_to_dict():
+    """Test the machine readable plan"""
+    data = plan.to_dict(RESULTS, 'rev1')
+
+    assert data['revision'] == 'rev1'
+    assert data['targets']['http://pihole1'] == {
+        'hosts': {'added': ['10.0.0.3 c.local'], 'removed': ['10.0.0.2 b.local'], 'unchanged': 4},
+        'cnames': {'added': [], 'removed': [], 'unchanged': 2},
+        'changes': 2,
+    }
+    assert data['targets']['http://pihole2'] == {'error': 'unreachable'}
+
+
+def test_write_json(tmp_path):
+    """Test that the plan is written as JSON"""
+    json_file = tmp_path / 'plan.json'
+
+    plan.write_json(RESULTS, str(json_file), 'rev1')
+
+    assert json.loads(json_file.read_text()) == plan.to_dict(RESULTS, 'rev1')
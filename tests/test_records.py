@@ -0,0 +1,110 @@
+import pytest
+from internal_dns_sync import records
+from internal_dns_sync.records import HostRecord, CnameRecord, RawRecord
+
+
+def test_host_record_normalizes():
+    """Test that IPs are compressed and domains lowercased without trailing dot"""
+    record = HostRecord('FD00:0000::0001', 'Host.Example.Local.')
+
+    assert record.ip == 'fd00::1'
+    assert record.domain == 'host.example.local'
+    assert record.wire == 'fd00::1 host.example.local'
+
+
+def test_cname_record_normalizes():
+    """Test CNAME normalization and wire format"""
+    record = CnameRecord('Alias.Local.', 'TARGET.local')
+
+    assert record.wire == 'alias.local,target.local'
+
+
+def test_records_compare_by_wire_format():
+    """Test that equivalent records are equal and hash the same"""
+    assert HostRecord('10.0.0.1', 'A.local') == HostRecord('10.0.0.1', 'a.local.')
+    assert len({HostRecord('10.0.0.1', 'A.local'), HostRecord('10.0.0.1', 'a.local')}) == 1
+    assert HostRecord('10.0.0.1', 'a.local') != '10.0.0.1 a.local'
+
+
+def test_records_have_no_dict():
+    """Test that records are slotted"""
+    with pytest.raises(AttributeError):
+        HostRecord('10.0.0.1', 'a.local').extra = 1
+
+
+@pytest.mark.parametrize('ip, domain', [
+    ('not.an.ip', 'a.local'),
+    ('10.0.0.1', ''),
+    ('10.0.0.1', '-a.local'),
+    ('10.0.0.1', 'a..local'),
+    ('10.0.0.1', 'a' * 64 + '.local'),
+])
+def test_host_record_invalid(ip, domain):
+    """Test that invalid IPs and domains raise ValueError"""
+    with pytest.raises(ValueError):
+        HostRecord(ip, domain)
+
+
+def test_parse_hosts_line_canonical():
+    """Test that a canonical PiHole line becomes a host record that remembers its line"""
+    [record] = records.parse_hosts_line('10.0.0.1 a.local')
+
+    assert record == HostRecord('10.0.0.1', 'a.local')
+    assert record.sources == ('10.0.0.1 a.local',)
+
+
+@pytest.mark.parametrize('line', ['10.0.0.1  a.local', '\t10.0.0.1\ta.local ', '10.0.0.1 A.Local.'])
+def test_parse_hosts_line_normalizes(line):
+    """Test that whitespace and case differences parse to the same record"""
+    [record] = records.parse_hosts_line(line)
+
+    assert record == HostRecord('10.0.0.1', 'a.local')
+    assert record.sources == (line,)
+
+
+def test_parse_hosts_line_multiple_names():
+    """Test that a line with several names yields one record per name"""
+    parsed = records.parse_hosts_line('10.0.0.1 a.local b.local')
+
+    assert parsed == [HostRecord('10.0.0.1', 'a.local'), HostRecord('10.0.0.1', 'b.local')]
+    assert all(record.sources == ('10.0.0.1 a.local b.local',) for record in parsed)
+
+
+@pytest.mark.parametrize('line', ['garbage', '', 'not.an.ip a.local'])
+def test_parse_hosts_line_invalid(line):
+    """Test that unparsable lines are kept as raw records"""
+    assert records.parse_hosts_line(line) == [RawRecord(line)]
+
+
+@pytest.mark.parametrize('line', [
+    'alias.local,target.local',
+    'Alias.local, target.local.',
+    'alias.local,target.local,300',
+])
+def test_parse_cname_line_normalizes(line):
+    """Test that spacing, case and a TTL suffix parse to the same record"""
+    [record] = records.parse_cname_line(line)
+
+    assert record == CnameRecord('alias.local', 'target.local')
+    assert record.sources == (line,)
+
+
+def test_parse_cname_line_multiple_aliases():
+    """Test dnsmasq's multiple aliases per target"""
+    parsed = records.parse_cname_line('a.local,b.local,target.local,60')
+
+    assert parsed == [CnameRecord('a.local', 'target.local'), CnameRecord('b.local', 'target.local')]
+
+
+@pytest.mark.parametrize('line', ['alias.local', 'alias.local,bad target'])
+def test_parse_cname_line_invalid(line):
+    """Test that unparsable CNAME lines are kept as raw records"""
+    assert records.parse_cname_line(line) == [RawRecord(line)]
+
+
+def test_parse_hosts_deduplicates():
+    """Test that equivalent lines collapse into one record that remembers every line"""
+    [record] = records.parse_hosts(['10.0.0.1 a.local', '10.0.0.1  A.local'])
+
+    assert record == HostRecord('10.0.0.1', 'a.local')
+    assert record.sources == ('10.0.0.1 a.local', '10.0.0.1  A.local')
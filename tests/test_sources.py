@@ -0,0 +1,78 @@
+import pytest
+from unittest.mock import patch
+from internal_dns_sync import sources
+from internal_dns_sync.records import HostRecord, CnameRecord
+
+
+def test_merge_combines_sources():
+    """Test that records from all sources are combined"""
+    merged = sources.merge([
+        ('a.yaml', {HostRecord('10.0.0.1', 'a.local')}, set()),
+        ('b.yaml', {HostRecord('10.0.0.2', 'b.local')}, {CnameRecord('www.local', 'b.local')}),
+    ])
+
+    assert merged == (
+        {HostRecord('10.0.0.1', 'a.local'), HostRecord('10.0.0.2', 'b.local')},
+        {CnameRecord('www.local', 'b.local')},
+    )
+
+
+def test_merge_allows_identical_duplicates():
+    """Test that a name defined identically in several sources is not a conflict"""
+    host = HostRecord('10.0.0.1', 'a.local')
+
+    hosts, _ = sources.merge([('a.yaml', {host}, set()), ('b.yaml', {host}, set())])
+
+    assert hosts == {host}
+
+
+def test_merge_reports_every_conflict():
+    """Test that names defined differently across sources are all reported"""
+    with pytest.raises(sources.SourceConflictError) as exc_info:
+        sources.merge([
+            ('a.yaml', {HostRecord('10.0.0.1', 'a.local'), HostRecord('10.0.0.1', 'b.local')}, set()),
+            ('b.yaml', {HostRecord('10.0.0.2', 'a.local')}, {CnameRecord('b.local', 'a.local')}),
+        ])
+
+    assert sorted(exc_info.value.conflicts) == [
+        'a.local: defined differently in a.yaml and b.yaml',
+        'b.local: defined differently in a.yaml and b.yaml',
+    ]
+
+
+def test_fetch_checks_out_each_repository_once(tmp_path):
+    """Test that several files from one repository share a single checkout"""
+    local = tmp_path / 'extra.hosts'
+    local.write_text('10.0.0.9 extra.local\n')
+    cfg = {
+        'cache_dir': str(tmp_path),
+        'sources': [
+            {'repo_url': 'git@github.com:test/repo.git', 'ssh_key': '/key', 'path': 'a.yaml'},
+            {'repo_url': 'git@github.com:test/repo.git', 'ssh_key': '/key', 'path': 'b.yaml'},
+            {'file': str(local)},
+        ],
+    }
+
+    with patch('internal_dns_sync.git.clone_or_update', return_value='/tmp/repo') as mock_clone, \
+         patch('internal_dns_sync.git.file_revision', side_effect=['rev-a', 'rev-b']):
+        fetched = sources.fetch(cfg)
+
+    mock_clone.assert_called_once()
+    assert fetched[:2] == [('/tmp/repo/a.yaml', 'rev-a'), ('/tmp/repo/b.yaml', 'rev-b')]
+    assert fetched[2] == (str(local), sources.file_revision(str(local)))
+
+
+def test_revision_combines_sources():
+    """Test that a single source keeps its revision and several are combined"""
+    assert sources.revision([('a.yaml', 'rev-a')]) == 'rev-a'
+
+    combined = sources.revision([('a.yaml', 'rev-a'), ('b.yaml', 'rev-b')])
+    assert combined != sources.revision([('a.yaml', 'rev-a'), ('b.yaml', 'rev-c')])
+
+
+def test_file_revision_matches_git(tmp_path):
+    """Test that local files get the same id git gives the blob"""
+    path = tmp_path / 'hello'
+    path.write_bytes(b'hello\n')
+
+    assert sources.file_revision(str(path)) == 'ce013625030ba8dba906f756967f9e9ca394464a'
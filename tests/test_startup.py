@@ -0,0 +1,19 @@
+from benchmarks import startup
+
+# Generous, so only a real regression (such as an eager import of requests) trips it on a slow runner
+IMPORT_BUDGET_US = 150_000
+
+
+def test_entry_point_import_budget():
+    """Test that importing the entry point stays light and within budget"""
+    times = startup.import_times('internal_dns_sync.main')
+
+    assert [module for module in startup.HEAVY if module in times] == []
+    assert times['internal_dns_sync.main'] < IMPORT_BUDGET_US
+
+
+def test_unchanged_run_skips_heavy_imports():
+    """Test that a one-shot run that finds nothing changed never loads the PiHole client"""
+    result = startup.short_circuit_run()
+
+    assert [module for module in startup.HEAVY if module in result['modules']] == []
@@ -0,0 +1,51 @@
+import os
+from internal_dns_sync import state
+from internal_dns_sync.records import HostRecord, CnameRecord
+
+
+def test_load_state_missing_file(tmp_path):
+    """Test that a missing state file yields an empty state"""
+    assert state.load_state(str(tmp_path / 'state.json')) == {}
+
+
+def test_save_and_load_state(tmp_path):
+    """Test a state round-trip, creating the directory if needed"""
+    state_file = str(tmp_path / 'cache' / 'state.json')
+
+    state.save_state(state_file, {'revision': 'abc', 'targets': ['http://pihole1']})
+
+    assert state.load_state(state_file) == {'revision': 'abc', 'targets': ['http://pihole1']}
+    assert not os.path.exists(f'{state_file}.tmp')
+
+
+def test_load_state_corrupt_file(tmp_path):
+    """Test that a corrupt state file is ignored"""
+    state_file = tmp_path / 'state.json'
+    state_file.write_text('{not json')
+
+    assert state.load_state(str(state_file)) == {}
+
+
+def test_content_hash_is_order_independent():
+    """Test that the hash does not depend on record order"""
+    hosts_a = [HostRecord('10.0.0.1', 'a.local'), HostRecord('10.0.0.2', 'b.local')]
+    hosts_b = [HostRecord('10.0.0.2', 'b.local'), HostRecord('10.0.0.1', 'a.local')]
+
+    assert state.content_hash(hosts_a, []) == state.content_hash(hosts_b, [])
+
+
+def test_content_hash_distinguishes_record_types():
+    """Test that moving a record between types changes the hash"""
+    hosts = [HostRecord('10.0.0.1', 'a.local')]
+    cnames = [CnameRecord('a.local', 'b.local')]
+
+    assert state.content_hash(hosts, cnames) != state.content_hash(hosts, [])
+
+
+def test_save_state_is_private(tmp_path):
+    """Test that the state file is only readable by its owner"""
+    state_file = str(tmp_path / 'state.json')
+
+    state.save_state(state_file, {'sessions': {}})
+
+    assert os.stat(state_file).st_mode & 0o777 == 0o600
@@ -0,0 +1,386 @@
+import threading
+import time
+import pytest
+from unittest.mock import Mock, patch
+import requests
+from internal_dns_sync import sync, verify
+from internal_dns_sync.pihole import DnsState
+from internal_dns_sync import records
+from internal_dns_sync.records import HostRecord, CnameRecord
+
+
+PIHOLES = [
+    {'url': 'http://pihole1', 'password': 'pass1'},
+    {'url': 'http://pihole2', 'password': 'pass2'},
+    {'url': 'http://pihole3', 'password': 'pass3'},
+]
+DESIRED = {p['url']: (set(), set()) for p in PIHOLES}
+
+
+def _hosts(*wires):
+    return {HostRecord(*wire.split(' ')) for wire in wires}
+
+
+def _cnames(*wires):
+    return {CnameRecord(*wire.split(',')) for wire in wires}
+
+
+def test_sync_all_collects_results(make_result):
+    """Test that every target reports its change count"""
+    with patch.object(sync, 'sync_pihole', side_effect=lambda p, h, c, api: make_result(added=len(p['url']))):
+        results = sync.sync_all(PIHOLES, DESIRED, max_parallel=2)
+
+    assert {url: r.changes for url, r in results.items()} == {p['url']: len(p['url']) for p in PIHOLES}
+
+
+def test_sync_all_failure_does_not_abort_others(make_result):
+    """Test that one failing PiHole does not stop the others"""
+    def fake_sync(pihole_config, hosts, cnames, api):
+        if pihole_config['url'] == 'http://pihole2':
+            raise requests.ConnectionError('unreachable')
+        return make_result(added=1)
+
+    with patch.object(sync, 'sync_pihole', side_effect=fake_sync):
+        results = sync.sync_all(PIHOLES, DESIRED, max_parallel=3)
+
+    assert results['http://pihole1'].changes == 1
+    assert results['http://pihole3'].changes == 1
+    assert isinstance(results['http://pihole2'], requests.ConnectionError)
+
+
+def test_sync_all_runs_concurrently(make_result):
+    """Test that targets are synced in parallel up to max_parallel"""
+    barrier = threading.Barrier(len(PIHOLES), timeout=5)
+
+    def fake_sync(pihole_config, hosts, cnames, api):
+        barrier.wait()
+        return make_result()
+
+    with patch.object(sync, 'sync_pihole', side_effect=fake_sync):
+        results = sync.sync_all(PIHOLES, DESIRED, max_parallel=len(PIHOLES))
+
+    assert all(r.changes == 0 for r in results.values())
+
+
+def test_sync_all_no_piholes():
+    """Test fan-out with no configured PiHoles"""
+    assert sync.sync_all([], {}, max_parallel=4) == {}
+
+
+def test_sync_pihole_reuses_authenticated_client():
+    """Test that an already authenticated client is not re-authenticated"""
+    api = Mock(sid='warm-sid')
+    api.get_dns_state.return_value = DnsState(_hosts('10.0.0.1 test.local'), _cnames())
+
+    result = sync.sync_pihole(PIHOLES[0], _hosts('10.0.0.1 test.local'), set(), api=api)
+
+    assert result.changes == 0
+    api.authenticate.assert_not_called()
+    api.update_hosts.assert_not_called()
+
+
+def test_sync_all_keeps_clients_warm(make_result):
+    """Test that clients survive across syncs, including failed ones"""
+    def fake_sync(pihole_config, hosts, cnames, api):
+        if pihole_config['url'] == 'http://pihole2':
+            raise requests.ConnectionError('unreachable')
+        return make_result()
+
+    clients = {}
+    with patch.object(sync, 'sync_pihole', side_effect=fake_sync):
+        sync.sync_all(PIHOLES, DESIRED, max_parallel=3, clients=clients)
+        first = clients['http://pihole1']
+        sync.sync_all(PIHOLES, DESIRED, max_parallel=3, clients=clients)
+
+    assert clients['http://pihole1'] is first
+    assert 'http://pihole2' in clients
+
+
+def test_sync_pihole_single_patch_for_both_lists():
+    """Test that changed hosts and CNAMEs are written with one update"""
+    api = Mock(sid='warm-sid')
+    api.get_dns_state.return_value = DnsState(_hosts(), _cnames())
+
+    result = sync.sync_pihole(
+        PIHOLES[0],
+        _hosts('10.0.0.1 test.local'),
+        _cnames('alias.local,test.local'),
+        api=api
+    )
+
+    assert result.changes == 2
+    api.update_dns.assert_called_once_with(
+        hosts=_hosts('10.0.0.1 test.local'), cnames=_cnames('alias.local,test.local')
+    )
+
+
+def test_sync_pihole_only_changed_list():
+    """Test that an unchanged list is left out of the update"""
+    api = Mock(sid='warm-sid')
+    api.get_dns_state.return_value = DnsState(_hosts('10.0.0.1 test.local'), _cnames())
+
+    sync.sync_pihole(
+        PIHOLES[0],
+        _hosts('10.0.0.1 test.local'),
+        _cnames('alias.local,test.local'),
+        api=api
+    )
+
+    api.update_dns.assert_called_once_with(hosts=None, cnames=_cnames('alias.local,test.local'))
+
+
+def test_sync_pihole_small_delta_uses_per_item_endpoints():
+    """Test that a change below the threshold is applied entry by entry"""
+    api = Mock(sid='warm-sid')
+    api.get_dns_state.return_value = DnsState(_hosts('10.0.0.1 a.local', '10.0.0.2 b.local'), _cnames())
+    pihole_config = {**PIHOLES[0], 'delta_threshold': 10}
+
+    result = sync.sync_pihole(
+        pihole_config,
+        _hosts('10.0.0.1 a.local', '10.0.0.3 b.local'),
+        set(),
+        api=api
+    )
+
+    assert result.changes == 2
+    api.update_dns.assert_not_called()
+    api.delete_dns_item.assert_called_once_with('hosts', '10.0.0.2 b.local')
+    api.add_dns_item.assert_called_once_with('hosts', HostRecord('10.0.0.3', 'b.local'))
+
+
+def test_sync_pihole_large_delta_replaces_lists():
+    """Test that a change above the threshold replaces the full list"""
+    api = Mock(sid='warm-sid')
+    api.get_dns_state.return_value = DnsState(_hosts(), _cnames())
+    pihole_config = {**PIHOLES[0], 'delta_threshold': 1}
+    desired = {HostRecord(f'10.0.0.{i}', f'h{i}.local') for i in range(3)}
+
+    result = sync.sync_pihole(pihole_config, desired, set(), api=api)
+
+    assert result.changes == 3
+    api.add_dns_item.assert_not_called()
+    api.update_dns.assert_called_once_with(hosts=desired, cnames=None)
+
+
+def test_sync_pihole_verifies_changes():
+    """Test that verification runs after applying changes and its failure fails the target"""
+    api = Mock(sid='warm-sid')
+    api.get_dns_state.return_value = DnsState(_hosts(), _cnames())
+    pihole_config = {**PIHOLES[0], 'delta_threshold': 10, 'verify': True}
+
+    with patch('internal_dns_sync.verify.verify_pihole', side_effect=verify.VerificationError(['a.local: no answer'])) \
+            as mock_verify:
+        with pytest.raises(verify.VerificationError):
+            sync.sync_pihole(pihole_config, _hosts('10.0.0.1 a.local'), set(), api=api)
+
+    api.add_dns_item.assert_called_once()
+    assert mock_verify.call_args[0][1].changes == 1
+
+
+def test_sync_pihole_counts_ip_swap():
+    """Test that swapping the IP of a host is reported as a change"""
+    api = Mock(sid='warm-sid')
+    api.get_dns_state.return_value = DnsState(_hosts('10.0.0.1 a.local', '10.0.0.2 b.local'), _cnames())
+
+    result = sync.sync_pihole(
+        PIHOLES[0],
+        _hosts('10.0.0.9 a.local', '10.0.0.2 b.local'),
+        set(),
+        api=api
+    )
+
+    assert result.counts()['hosts'] == {'added': 1, 'removed': 1, 'unchanged': 1}
+    assert result.changes == 2
+
+
+def test_plan_pihole_does_not_write():
+    """Test that planning only reads the current state"""
+    api = Mock(sid='warm-sid')
+    api.get_dns_state.return_value = DnsState(_hosts('10.0.0.1 a.local'), _cnames())
+
+    result = sync.plan_pihole(PIHOLES[0], _hosts('10.0.0.2 a.local'), set(), api=api)
+
+    assert result.hosts.added == [HostRecord('10.0.0.2', 'a.local')]
+    assert result.hosts.removed == [HostRecord('10.0.0.1', 'a.local')]
+    api.update_dns.assert_not_called()
+    api.add_dns_item.assert_not_called()
+    api.delete_dns_item.assert_not_called()
+
+
+def test_sync_all_dry_run_plans_every_target(make_result):
+    """Test that a dry run fans out plan_pihole instead of sync_pihole"""
+    with patch.object(sync, 'plan_pihole', return_value=make_result(added=1)) as mock_plan, \
+         patch.object(sync, 'sync_pihole') as mock_sync:
+        results = sync.sync_all(PIHOLES, DESIRED, max_parallel=3, dry_run=True)
+
+    assert mock_plan.call_count == len(PIHOLES)
+    mock_sync.assert_not_called()
+    assert all(r.changes == 1 for r in results.values())
+
+
+def test_sync_pihole_equivalent_state_writes_nothing():
+    """Test that formatting differences on the PiHole do not cause any write"""
+    api = Mock(sid='warm-sid')
+    api.get_dns_state.return_value = DnsState(
+        records.parse_hosts(['10.0.0.1\tA.local  b.local']),
+        records.parse_cnames(['Alias.local,a.local,300'])
+    )
+
+    result = sync.sync_pihole(PIHOLES[0], _hosts('10.0.0.1 a.local', '10.0.0.1 b.local'),
+                              _cnames('alias.local,a.local'), api=api)
+
+    assert result.changes == 0
+    api.update_dns.assert_not_called()
+    api.add_dns_item.assert_not_called()
+    api.delete_dns_item.assert_not_called()
+
+
+def test_sync_pihole_delta_restores_names_sharing_a_line():
+    """Test that deleting a multi-name line re-adds the names that are still wanted"""
+    api = Mock(sid='warm-sid')
+    api.get_dns_state.return_value = DnsState(records.parse_hosts(['10.0.0.1 a.local b.local c.local']), set())
+    pihole_config = {**PIHOLES[0], 'delta_threshold': 10}
+
+    result = sync.sync_pihole(pihole_config, _hosts('10.0.0.1 a.local', '10.0.0.1 c.local'), set(), api=api)
+
+    assert result.changes == 1
+    api.delete_dns_item.assert_called_once_with('hosts', '10.0.0.1 a.local b.local c.local')
+    assert [c[0][1] for c in api.add_dns_item.call_args_list] == [
+        HostRecord('10.0.0.1', 'a.local'), HostRecord('10.0.0.1', 'c.local')
+    ]
+
+
+def test_sync_pihole_delta_keeps_names_on_another_line():
+    """Test that a name still on a kept line is not re-added after deleting a line it shared"""
+    api = Mock(sid='warm-sid')
+    api.get_dns_state.return_value = DnsState(records.parse_hosts(['10.0.0.1 a.local b.local', '10.0.0.1 a.local']),
+                                              set())
+    pihole_config = {**PIHOLES[0], 'delta_threshold': 10}
+
+    result = sync.sync_pihole(pihole_config, _hosts('10.0.0.1 a.local'), set(), api=api)
+
+    assert result.changes == 1
+    api.delete_dns_item.assert_called_once_with('hosts', '10.0.0.1 a.local b.local')
+    api.add_dns_item.assert_not_called()
+
+
+def test_sync_pihole_delta_deletes_every_line_of_a_name():
+    """Test that a name found on several lines is deleted from all of them"""
+    api = Mock(sid='warm-sid')
+    api.get_dns_state.return_value = DnsState(records.parse_hosts(['10.0.0.1 a.local', '10.0.0.1  a.local']), set())
+    pihole_config = {**PIHOLES[0], 'delta_threshold': 10}
+
+    sync.sync_pihole(pihole_config, set(), set(), api=api)
+
+    assert [c[0][1] for c in api.delete_dns_item.call_args_list] == ['10.0.0.1 a.local', '10.0.0.1  a.local']
+    api.add_dns_item.assert_not_called()
+
+
+def _grouped_apis(writes, reads, overlap):
+    # Fake clients that record the order of reads and writes and whether two writes ever overlapped
+    active = []
+    lock = threading.Lock()
+
+    def make(url):
+        api = Mock()
+
+        def get_dns_state():
+            reads.append(url)
+            return DnsState(set(), set())
+
+        def update_dns(hosts=None, cnames=None):
+            with lock:
+                active.append(url)
+                overlap.append(len(active) > 1)
+            time.sleep(0.02)
+            with lock:
+                active.remove(url)
+            writes.append(url)
+
+        api.get_dns_state.side_effect = get_dns_state
+        api.update_dns.side_effect = update_dns
+        return api
+    return {p['url']: make(p['url']) for p in PIHOLES}
+
+
+def test_sync_all_serialises_writes_within_group():
+    """Test that members of a redundancy group never write at the same time, but all read up front"""
+    piholes = [dict(p, group='lan') for p in PIHOLES]
+    desired = {p['url']: (_hosts('10.0.0.1 test.local'), set()) for p in piholes}
+    writes, reads, overlap = [], [], []
+    clients = _grouped_apis(writes, reads, overlap)
+
+    with patch.object(verify, 'healthy', return_value=True) as mock_healthy:
+        results = sync.sync_all(piholes, desired, max_parallel=3, clients=clients, settle_delay=0)
+
+    assert all(r.changes == 1 for r in results.values())
+    assert sorted(writes) == sorted(p['url'] for p in PIHOLES)
+    assert not any(overlap)
+    # Every write but the first waits for a health check of the PiHole written before it
+    assert mock_healthy.call_count == 2
+
+
+def test_sync_all_holds_back_group_after_failed_health_check():
+    """Test that the rest of a group keeps its records when a written member does not recover"""
+    piholes = [dict(p, group='lan') for p in PIHOLES[:2]]
+    desired = {p['url']: (_hosts('10.0.0.1 test.local'), set()) for p in piholes}
+    writes, reads, overlap = [], [], []
+    clients = _grouped_apis(writes, reads, overlap)
+
+    with patch.object(verify, 'healthy', return_value=False):
+        results = sync.sync_all(piholes, desired, max_parallel=2, clients=clients, settle_delay=0)
+
+    assert len(writes) == 1
+    held = results[next(url for url in results if url not in writes)]
+    assert isinstance(held, sync.WriteHeldError)
+    assert held.unhealthy == writes[0]
+    assert sorted(reads) == sorted(p['url'] for p in piholes)
+
+
+def test_sync_all_ungrouped_targets_write_independently():
+    """Test that targets without a group are neither serialised nor health checked"""
+    desired = {p['url']: (_hosts('10.0.0.1 test.local'), set()) for p in PIHOLES}
+    writes, reads, overlap = [], [], []
+    clients = _grouped_apis(writes, reads, overlap)
+
+    with patch.object(verify, 'healthy') as mock_healthy:
+        sync.sync_all(PIHOLES, desired, max_parallel=3, clients=clients, settle_delay=10)
+
+    assert len(writes) == 3
+    mock_healthy.assert_not_called()
+
+
+def test_sync_all_group_member_without_changes_does_not_wait():
+    """Test that a group member with nothing to write neither waits nor makes the other settle"""
+    piholes = [dict(p, group='lan') for p in PIHOLES[:2]]
+    desired = {
+        'http://pihole1': (_hosts('10.0.0.1 test.local'), set()),
+        'http://pihole2': (set(), set()),
+    }
+    writes, reads, overlap = [], [], []
+    clients = _grouped_apis(writes, reads, overlap)
+
+    with patch.object(verify, 'healthy') as mock_healthy, patch('time.sleep') as mock_sleep:
+        results = sync.sync_all(piholes, desired, max_parallel=1, clients=clients, settle_delay=10)
+
+    assert results['http://pihole2'].changes == 0
+    assert writes == ['http://pihole1']
+    assert all(c.args != (10,) for c in mock_sleep.call_args_list)
+    mock_healthy.assert_not_called()
+
+
+def test_sync_all_group_waits_settle_delay_between_writes():
+    """Test that the next member of a group writes only after the previous one had time to settle"""
+    piholes = [dict(p, group='lan') for p in PIHOLES[:2]]
+    desired = {p['url']: (_hosts('10.0.0.1 test.local'), set()) for p in piholes}
+    writes, reads, overlap = [], [], []
+    clients = _grouped_apis(writes, reads, overlap)
+
+    with patch.object(verify, 'healthy', return_value=True), \
+         patch.object(sync.time, 'sleep') as mock_sleep:
+        sync.sync_all(piholes, desired, max_parallel=2, clients=clients, settle_delay=30)
+
+    assert len(writes) == 2
+    settles = [c.args[0] for c in mock_sleep.call_args_list if c.args[0] > 1]
+    assert len(settles) == 1
+    assert 29 < settles[0] <= 30
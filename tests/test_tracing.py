@@ -0,0 +1,126 @@
+import json
+import logging
+import pytest
+from unittest.mock import Mock, patch
+from internal_dns_sync import sync, tracing
+from internal_dns_sync.diff import Delta, SyncResult
+
+
+@pytest.fixture
+def trace_file(tmp_path):
+    path = tmp_path / 'traces.jsonl'
+    with patch.object(tracing, '_trace_file', str(path)):
+        yield path
+
+
+def _exported(path):
+    return [span for line in path.read_text().splitlines()
+            for span in json.loads(line)['resourceSpans'][0]['scopeSpans'][0]['spans']]
+
+
+def test_spans_nest_within_one_trace(trace_file):
+    """Test that nested spans share the trace id and point at their parent"""
+    with tracing.span('run') as root:
+        with tracing.span('sync', target='http://pihole1') as child:
+            child.set(changes=3)
+
+    spans = {s['name']: s for s in _exported(trace_file)}
+    assert spans['run']['traceId'] == spans['sync']['traceId'] == root.trace.trace_id
+    assert 'parentSpanId' not in spans['run']
+    assert spans['sync']['parentSpanId'] == spans['run']['spanId']
+    assert {'key': 'changes', 'value': {'intValue': '3'}} in spans['sync']['attributes']
+    assert int(spans['sync']['endTimeUnixNano']) >= int(spans['sync']['startTimeUnixNano'])
+    assert tracing._current.get() is None
+
+
+def test_every_run_is_exported_separately(trace_file):
+    """Test that each root span starts a new trace and is written as its own line"""
+    with tracing.span('run'):
+        pass
+    with tracing.span('run'):
+        pass
+
+    lines = trace_file.read_text().splitlines()
+    assert len(lines) == 2
+    assert len({s['traceId'] for s in _exported(trace_file)}) == 2
+
+
+def test_failed_span_records_error(trace_file):
+    """Test that an exception marks the span as failed and propagates"""
+    with pytest.raises(ValueError):
+        with tracing.span('run'):
+            raise ValueError('broken')
+
+    span = _exported(trace_file)[0]
+    assert span['status'] == {'code': 2, 'message': 'ValueError: broken'}
+
+
+def test_no_export_without_trace_file(tmp_path):
+    """Test that nothing is written unless a trace file is configured"""
+    with patch.object(tracing, '_trace_file', None):
+        with tracing.span('run'):
+            pass
+
+    assert not list(tmp_path.iterdir())
+
+
+def test_summary_lists_phases(caplog):
+    """Test that a finished run logs the duration of each of its phases"""
+    with caplog.at_level(logging.INFO, logger='internal_dns_sync.tracing'):
+        with tracing.span('run'):
+            with tracing.span('fetch'):
+                pass
+            with tracing.span('sync', target='http://pihole1'):
+                pass
+
+    assert 'run took' in caplog.text
+    assert 'fetch 0.' in caplog.text
+    assert 'sync http://pihole1 0.' in caplog.text
+
+
+def test_sync_all_spans_belong_to_the_run(trace_file):
+    """Test that spans from the worker threads are part of the caller's trace"""
+    api = Mock()
+    api.get_dns_state.return_value = Mock(hosts=set(), cnames=set())
+    piholes = [{'url': 'http://pihole1'}, {'url': 'http://pihole2'}]
+    result = SyncResult(Delta([], []), Delta([], []))
+
+    with patch.object(sync, '_sync_pihole', return_value=result):
+        with tracing.span('run'):
+            sync.sync_all(piholes, {p['url']: (set(), set()) for p in piholes}, 2,
+                          {p['url']: api for p in piholes})
+
+    spans = _exported(trace_file)
+    root = next(s for s in spans if s['name'] == 'run')
+    syncs = [s for s in spans if s['name'] == 'sync']
+    assert len(syncs) == 2
+    assert all(s['traceId'] == root['traceId'] and s['parentSpanId'] == root['spanId'] for s in syncs)
+
+
+def test_json_formatter_includes_run_id():
+    """Test that JSON log lines carry the run and span they were logged from"""
+    record = logging.LogRecord('internal_dns_sync.sync', logging.INFO, __file__, 1, 'Synced %d', (3,), None)
+    with tracing.span('run') as span:
+        tracing.ContextFilter().filter(record)
+
+    entry = json.loads(tracing.JsonFormatter().format(record))
+    assert entry['message'] == 'Synced 3'
+    assert entry['level'] == 'INFO'
+    assert entry['run_id'] == span.trace.trace_id
+    assert entry['span_id'] == span.span_id
+
+
+def test_configure_json_logging():
+    """Test that configure switches the root handlers to JSON and sets the level"""
+    root = logging.getLogger()
+    handler = logging.StreamHandler()
+    level = root.level
+    try:
+        with patch.object(root, 'handlers', [handler]), patch.object(tracing, '_trace_file', None):
+            tracing.configure({'log_format': 'json', 'log_level': 'DEBUG', 'trace_file': '/tmp/traces.jsonl'})
+            assert tracing._trace_file == '/tmp/traces.jsonl'
+            assert root.level == logging.DEBUG
+        assert isinstance(handler.formatter, tracing.JsonFormatter)
+        assert any(isinstance(f, tracing.ContextFilter) for f in handler.filters)
+    finally:
+        root.setLevel(level)
@@ -0,0 +1,74 @@
+import pytest
+from unittest.mock import patch
+from internal_dns_sync import dns_client, verify
+from internal_dns_sync.diff import Delta, SyncResult
+from internal_dns_sync.records import HostRecord, CnameRecord
+
+PIHOLE = {'url': 'http://10.0.0.53:8080', 'password': 'pass', 'verify': True}
+
+RESULT = SyncResult(
+    Delta([HostRecord('10.0.0.1', 'new.lan'), HostRecord('fd00::1', 'new.lan')], [HostRecord('10.0.0.9', 'old.lan')]),
+    Delta([CnameRecord('www.lan', 'new.lan')], [])
+)
+
+GOOD = {
+    ('new.lan', dns_client.A): (0, [('new.lan', dns_client.A, '10.0.0.1')]),
+    ('new.lan', dns_client.AAAA): (0, [('new.lan', dns_client.AAAA, 'fd00::1')]),
+    ('old.lan', dns_client.A): (3, []),
+    ('www.lan', dns_client.A): (0, [('www.lan', dns_client.CNAME, 'new.lan'), ('new.lan', dns_client.A, '10.0.0.1')]),
+}
+
+
+def test_verify_passes_when_resolver_agrees():
+    """Test that added names must resolve and removed ones must not, against the PiHole host"""
+    with patch('internal_dns_sync.dns_client.resolve_many', return_value=GOOD) as mock_resolve:
+        verify.verify_pihole(PIHOLE, RESULT)
+
+    server, queries, port = mock_resolve.call_args[0][:3]
+    assert (server, port) == ('10.0.0.53', 53)
+    assert sorted(queries) == sorted(GOOD)
+
+
+def test_verify_retries_then_reports_mismatches():
+    """Test that only failing names are queried again and remaining mismatches fail the target"""
+    stale = dict(GOOD)
+    stale[('old.lan', dns_client.A)] = (0, [('old.lan', dns_client.A, '10.0.0.9')])
+    del stale[('www.lan', dns_client.A)]
+
+    with patch('internal_dns_sync.dns_client.resolve_many', return_value=stale) as mock_resolve, \
+         patch('time.sleep'):
+        with pytest.raises(verify.VerificationError) as exc_info:
+            verify.verify_pihole(PIHOLE, RESULT)
+
+    assert mock_resolve.call_count == verify.ROUNDS
+    assert sorted(mock_resolve.call_args[0][1]) == [('old.lan', dns_client.A), ('www.lan', dns_client.A)]
+    assert exc_info.value.mismatches == ['old.lan: still resolves to 10.0.0.9', 'www.lan: no answer']
+
+
+def test_verify_samples_changed_names():
+    """Test that verify_sample limits the number of names queried"""
+    with patch('internal_dns_sync.dns_client.resolve_many', return_value=GOOD) as mock_resolve:
+        verify.verify_pihole(dict(PIHOLE, verify_sample=2, dns_server='10.0.0.54', dns_port=5353), RESULT)
+
+    server, queries, port = mock_resolve.call_args[0][:3]
+    assert (server, port, len(queries)) == ('10.0.0.54', 5353, 2)
+
+
+@pytest.mark.parametrize('answers, expected', [
+    ({('pi.hole', dns_client.A): (0, [('pi.hole', dns_client.A, '10.0.0.53')])}, True),
+    ({('pi.hole', dns_client.A): (3, [])}, True),
+    ({('pi.hole', dns_client.A): (2, [])}, False),
+    ({}, False),
+])
+def test_healthy_needs_a_real_answer(answers, expected):
+    """Test that a resolver counts as healthy on an answer or NXDOMAIN, not on SERVFAIL or silence"""
+    with patch('internal_dns_sync.dns_client.resolve_many', return_value=answers) as mock_resolve:
+        assert verify.healthy(PIHOLE) is expected
+
+    assert mock_resolve.call_args[0][:3] == ('10.0.0.53', [('pi.hole', dns_client.A)], 53)
+
+
+def test_healthy_unreachable_resolver():
+    """Test that a socket error means unhealthy rather than a crash"""
+    with patch('internal_dns_sync.dns_client.resolve_many', side_effect=OSError('unreachable')):
+        assert verify.healthy(dict(PIHOLE, health_name='probe.lan')) is False
@@ -0,0 +1,68 @@
+import json
+from unittest.mock import Mock
+from internal_dns_sync import state, watch
+from internal_dns_sync.records import HostRecord
+
+PIHOLES = [{'url': 'http://pihole1'}, {'url': 'http://pihole2'}]
+APPLIED = state.content_hash({HostRecord('10.0.0.1', 'test.local')}, set())
+
+
+def _body(*hosts):
+    return json.dumps({'config': {'dns': {'hosts': list(hosts), 'cnameRecords': []}}}).encode()
+
+
+def _clients(*bodies):
+    clients = {}
+    for pihole, body in zip(PIHOLES, bodies):
+        clients[pihole['url']] = Mock(base_url=pihole['url'])
+        clients[pihole['url']].get_dns_config.return_value = body
+    return clients
+
+
+def test_find_drift_reports_changed_target():
+    """Test that only the PiHole whose records differ from the applied state is reported"""
+    clients = _clients(_body('10.0.0.1 test.local'), _body('10.0.0.2 test.local'))
+    applied = {p['url']: APPLIED for p in PIHOLES}
+
+    assert watch.find_drift(PIHOLES, clients, applied, {}, 2) == ['http://pihole2']
+
+
+def test_find_drift_ignores_formatting():
+    """Test that an equivalent line written differently is not drift"""
+    clients = _clients(_body('10.0.0.1   test.local'), _body('10.0.0.1 TEST.local'))
+    applied = {p['url']: APPLIED for p in PIHOLES}
+
+    assert watch.find_drift(PIHOLES, clients, applied, {}) == []
+
+
+def test_find_drift_skips_parsing_unchanged_body(monkeypatch):
+    """Test that a body already seen in sync is not parsed again"""
+    clients = _clients(_body('10.0.0.1 test.local'))
+    applied = {'http://pihole1': APPLIED}
+    seen = {}
+    watch.find_drift(PIHOLES[:1], clients, applied, seen)
+
+    parse = Mock()
+    monkeypatch.setattr(watch.pihole, 'parse_dns_config', parse)
+    assert watch.find_drift(PIHOLES[:1], clients, applied, seen) == []
+    parse.assert_not_called()
+
+
+def test_find_drift_rechecks_after_new_sync():
+    """Test that a seen body is compared again once a different state was applied"""
+    clients = _clients(_body('10.0.0.1 test.local'))
+    seen = {}
+    watch.find_drift(PIHOLES[:1], clients, {'http://pihole1': APPLIED}, seen)
+
+    newer = state.content_hash({HostRecord('10.0.0.5', 'test.local')}, set())
+    assert watch.find_drift(PIHOLES[:1], clients, {'http://pihole1': newer}, seen) == ['http://pihole1']
+
+
+def test_find_drift_unreachable_target_is_not_drift(caplog):
+    """Test that a PiHole that cannot be read is logged and left to the next sync"""
+    clients = _clients(_body('10.0.0.1 test.local'), b'')
+    clients['http://pihole2'].get_dns_config.side_effect = ConnectionError('refused')
+    applied = {p['url']: APPLIED for p in PIHOLES}
+
+    assert watch.find_drift(PIHOLES, clients, applied, {}) == []
+    assert 'Failed to check http://pihole2 for drift' in caplog.text
@@ -0,0 +1,127 @@
+import hashlib
+import hmac
+import http.client
+import threading
+import time
+import urllib.error
+import urllib.request
+import pytest
+from internal_dns_sync import webhook
+
+SECRET = 'topsecret'
+
+
+def _sign(body, secret=SECRET):
+    return 'sha256=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+@pytest.fixture
+def listener():
+    triggered = []
+    server = webhook.serve(0, SECRET, lambda: triggered.append(True), '127.0.0.1')
+    yield f'http://127.0.0.1:{server.server_address[1]}', triggered
+    server.shutdown()
+
+
+def _post(url, body, headers):
+    request = urllib.request.Request(url, data=body, headers=headers, method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def test_verify_signature():
+    """Test GitHub style and bare hex signatures"""
+    body = b'{"ref": "refs/heads/main"}'
+    digest = hmac.new(SECRET.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+    assert webhook.verify_signature(SECRET, body, f'sha256={digest}')
+    assert webhook.verify_signature(SECRET, body, digest)
+    assert not webhook.verify_signature(SECRET, body + b' ', f'sha256={digest}')
+    assert not webhook.verify_signature(SECRET, body, None)
+    assert not webhook.verify_signature(SECRET, body, 'sha256=\u00e9' * 32)
+
+
+def test_push_triggers_sync(listener):
+    """Test that a correctly signed push is accepted and triggers a sync"""
+    url, triggered = listener
+    body = b'{"ref": "refs/heads/main"}'
+
+    status = _post(f'{url}/webhook', body, {'X-GitHub-Event': 'push', 'X-Hub-Signature-256': _sign(body)})
+
+    assert status == 202
+    assert triggered == [True]
+
+
+def test_invalid_signature_is_rejected(listener):
+    """Test that a push signed with the wrong secret does not trigger a sync"""
+    url, triggered = listener
+    body = b'{"ref": "refs/heads/main"}'
+
+    status = _post(f'{url}/webhook', body, {'X-GitHub-Event': 'push', 'X-Hub-Signature-256': _sign(body, 'wrong')})
+
+    assert status == 401
+    assert not triggered
+
+
+def test_other_events_are_ignored(listener):
+    """Test that a signed ping is acknowledged without a sync"""
+    url, triggered = listener
+    body = b'{"zen": "hi"}'
+
+    status = _post(f'{url}/webhook', body, {'X-GitHub-Event': 'ping', 'X-Hub-Signature-256': _sign(body)})
+
+    assert status == 204
+    assert not triggered
+
+
+@pytest.mark.parametrize('length, expected', [(None, 411), ('abc', 400), ('-1', 400), (str(2 * 1024 * 1024), 413)])
+def test_bad_content_length_is_rejected_before_reading(listener, length, expected):
+    """Test that a missing, invalid or oversized Content-Length is answered without reading the body"""
+    url, triggered = listener
+    connection = http.client.HTTPConnection(url.removeprefix('http://'), timeout=5)
+    try:
+        connection.putrequest('POST', '/webhook')
+        connection.putheader('X-GitHub-Event', 'push')
+        if length is not None:
+            connection.putheader('Content-Length', length)
+        connection.endheaders()
+        status = connection.getresponse().status
+    finally:
+        connection.close()
+
+    assert status == expected
+    assert not triggered
+
+
+def test_wait_debounces_bursts():
+    """Test that the wait ends only once pushes have been quiet for the debounce period"""
+    wake = threading.Event()
+    stop = threading.Event()
+
+    def burst():
+        for _ in range(3):
+            wake.set()
+            time.sleep(0.05)
+
+    threading.Thread(target=burst).start()
+    start = time.monotonic()
+    webhook.wait(wake, stop, 10, 0.2)
+
+    assert 0.3 <= time.monotonic() - start < 5
+    assert not wake.is_set()
+
+
+def test_wait_returns_on_stop():
+    """Test that stopping ends the wait right away"""
+    wake = threading.Event()
+    stop = threading.Event()
+    stop.set()
+    wake.set()
+
+    start = time.monotonic()
+    webhook.wait(wake, stop, 10, 10)
+
+    assert time.monotonic() - start < 1